@@ -0,0 +1,116 @@
+"""Future-returning variants of BaseAPI, BaseEntity and BaseCollection.
+
+Every method that goes to the API returns a concurrent.futures.Future instead of blocking. The requests are the same blocking
+requests calls base_api makes, run on a thread pool; this is not asynchronous I/O. Each request in flight holds a thread of the
+pool until its response is read, so an API has at most max_workers requests in flight (DEFAULT_MAX_WORKERS unless the
+constructor is given another number, or an executor of its own), and the rest wait in the pool's queue. A session that keeps
+fewer connections per host than that opens connections it then throws away, so give create_session a pool_maxsize at least
+as big. In Python 3, asyncio.wrap_future(future) turns a result into an awaitable.
+"""
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from base_api import BaseAPI, BaseResource, BaseEntity, BaseCompactEntity, BaseCollection
+
+DEFAULT_MAX_WORKERS = 10 # the pool_maxsize of base_api.create_session
+
+_default_executor = None
+_sized_executors = dict() # max_workers -> the ThreadPoolExecutor shared by the AsyncBaseAPIs with that many workers
+_default_executor_lock = threading.Lock()
+
+def default_executor(max_workers=DEFAULT_MAX_WORKERS):
+    # the executor shared by every AsyncBaseAPI that has not been given one of its own and that has max_workers workers.
+    # An executor set with set_default_executor is shared by all of them instead
+    with _default_executor_lock:
+        if _default_executor is not None:
+            return _default_executor
+        executor = _sized_executors.get(max_workers)
+        if executor is None:
+            executor = _sized_executors[max_workers] = ThreadPoolExecutor(max_workers=max_workers)
+        return executor
+
+def set_default_executor(executor):
+    # share this executor among every AsyncBaseAPI that has not been given one of its own, whatever its max_workers.
+    # Pass None to go back to executors sized by max_workers
+    global _default_executor
+    with _default_executor_lock:
+        _default_executor = executor
+
+def then(future, fn):
+    # return a Future for fn(result of future). Exceptions in either step are set on the returned Future
+    result = Future()
+    def done(f):
+        try:
+            result.set_result(fn(f.result()))
+        except Exception as e:
+            result.set_exception(e)
+    future.add_done_callback(done)
+    return result
+
+class AsyncBaseAPI(BaseAPI):
+
+    def __init__(self, session=None, executor=None, cache=None, max_workers=DEFAULT_MAX_WORKERS):
+        super(AsyncBaseAPI, self).__init__(session, cache)
+        self._executor = executor
+        self.max_workers = max_workers
+
+    def executor(self):
+        executor = getattr(self, '_executor', None)
+        return executor if executor is not None else default_executor(getattr(self, 'max_workers', DEFAULT_MAX_WORKERS))
+
+    def set_executor(self, executor):
+        # use this executor instead of the shared default executor. Pass None to go back to the default
+        self._executor = executor
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor().submit(fn, *args, **kwargs)
+
+    def retrieve(self, url, entity=None, headers=None):
+        return self.submit(BaseAPI.retrieve, self, url, entity, headers)
+
+    def update(self, url, etag, changes, entity=None, headers=None):
+        return self.submit(BaseAPI.update, self, url, etag, changes, entity, headers)
+
+    def delete(self, url, entity=None, headers=None, etag=None):
+        return self.submit(BaseAPI.delete, self, url, entity, headers, etag)
+
+    def create(self, url, body, entity=None, headers=None):
+        return self.submit(BaseAPI.create, self, url, body, entity, headers)
+
+    def retrieve_related(self, entities, relationships, max_workers=10):
+        return self.submit(BaseAPI.retrieve_related, self, entities, relationships, max_workers)
+
+class AsyncBaseEntity(BaseEntity):
+    # refresh, update and delete are inherited - they return whatever api() returns, which is a Future for an AsyncBaseAPI
+
+    def retrieve(self, relationship):
+        # fetch a related resource. The related resource is available from get_related once the returned Future is done
+        if hasattr(self, relationship):
+            def remember(rslt):
+                self._related[relationship] = rslt
+                return rslt
+            return then(self.api().retrieve(getattr(self, relationship)), remember)
+        else:
+            raise Exception('no value set for %s URL' % relationship)
+
+class AsyncBaseCollection(BaseCollection):
+
+    def create(self, entity):
+        # create a new entity in the API by POSTing. The returned Future's result is the entity
+        if self._location:
+            if hasattr(entity, '_self') and entity._self:
+                raise Exception('entity already exists in API %s' % entity)
+            return then(self.api().create(self._location, entity.changes(), entity), lambda rslt: self.add_item(entity))
+        else:
+            raise Exception('Collection has no _self property')
+
+    # the bulk operations return a Future for the list of (entity, result) pairs
+
+    def create_all(self, entities, max_workers=10):
+        return self.api().submit(BaseCollection.create_all, self, entities, max_workers)
+
+    def update_all(self, entities, max_workers=10):
+        return self.api().submit(BaseCollection.update_all, self, entities, max_workers)
+
+    def delete_all(self, entities, max_workers=10, use_etags=True):
+        return self.api().submit(BaseCollection.delete_all, self, entities, max_workers, use_etags)
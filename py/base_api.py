@@ -1,8 +1,127 @@
 import requests
+import threading
+import copy
+import json
+import codecs
+from collections import OrderedDict, namedtuple, deque, MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 from urlparse import urlparse, urlunparse
 
+def create_session(pool_connections=10, pool_maxsize=10, max_retries=0, backoff_factor=0, status_forcelist=None, pool_block=False):
+    # build a requests Session that keeps connections alive and pools them per host.
+    # pool_connections is the number of hosts to keep pools for, pool_maxsize the number of connections kept per host.
+    # Retries only apply to idempotent methods - a POST or PATCH is never re-sent
+    retries = Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=status_forcelist, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retries, pool_block=pool_block)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+def default_session():
+    # the session shared by every BaseAPI that has not been given one of its own
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = create_session()
+        return _default_session
+
+def set_default_session(session):
+    # replace the shared session, e.g. with one from create_session() with a bigger pool or a retry policy
+    global _default_session
+    with _default_session_lock:
+        _default_session = session
+
+CacheEntry = namedtuple('CacheEntry', ['location', 'etag', 'jso'])
+
+class ResourceCache(object):
+    # a size-bounded cache of retrieved resources keyed by URL, evicting the least recently used entry first.
+    # A BaseAPI with a cache sends If-None-Match on retrieve and rebuilds the resource from the cache on 304 Not Modified
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.pop(url, None)
+            if entry is not None:
+                self._entries[url] = entry
+            return entry
+
+    def put(self, url, location, etag, jso):
+        with self._lock:
+            self._entries.pop(url, None)
+            self._entries[url] = CacheEntry(location, etag, jso)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def remove(self, url):
+        with self._lock:
+            self._entries.pop(url, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+def map_concurrently(fn, values, max_workers=10):
+    # call fn on each of values with at most max_workers calls in flight, reading values only a little ahead of the calls.
+    # Returns a list of (value, result) pairs in the order of values. An Exception raised by fn is returned in place of its result
+    def call(value):
+        try:
+            return value, fn(value)
+        except Exception as e:
+            return value, e
+    results = []
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for value in values:
+            if len(pending) >= 2 * max_workers:
+                results.append(pending.popleft().result())
+            pending.append(executor.submit(call, value))
+        results.extend(future.result() for future in pending)
+    return results
+
 class BaseAPI(object):
 
+    def __init__(self, session=None, cache=None):
+        self._session = session
+        self._cache = cache
+
+    def session(self):
+        session = getattr(self, '_session', None)
+        return session if session is not None else default_session()
+
+    def set_session(self, session):
+        # use this session instead of the shared default session. Pass None to go back to the default
+        self._session = session
+
+    def cache(self):
+        return getattr(self, '_cache', None)
+
+    def set_cache(self, cache):
+        # cache retrieved resources in this ResourceCache and revalidate them with conditional GETs. Pass None to stop caching
+        self._cache = cache
+
     def retrieve_headers(self):
         return {
             'Accept': 'application/json'
@@ -15,28 +134,91 @@ class BaseAPI(object):
             'If-Match': etag
             }
 
-    def delete_headers(self):
-        return {
+    def delete_headers(self, etag=None):
+        headers = {
             'Accept': 'application/json'
             }
+        if etag is not None:
+            headers['If-Match'] = etag
+        return headers
 
     def retrieve(self, url, entity=None, headers=None):
         # issue a GET to retrieve a resource from the API and create an object for it
-        r = requests.get(url, headers = headers if headers is not None else self.retrieve_headers())
-        return self.process_resource_result(url, r, entity)
+        headers = headers if headers is not None else self.retrieve_headers()
+        cache = self.cache()
+        if cache is None:
+            r = self.session().get(url, headers = headers)
+            return self.process_resource_result(url, r, entity)
+        cached = cache.get(url)
+        if cached is not None:
+            headers = dict(headers)
+            headers['If-None-Match'] = cached.etag
+        r = self.session().get(url, headers = headers)
+        if cached is not None and r.status_code == 304:
+            cache.record_hit()
+            return self.build_resource_from_json(copy.deepcopy(cached.jso), entity, cached.location, r.headers.get('ETag', cached.etag))
+        cache.record_miss()
+        location, etag, jso = self.resource_result_parts(url, r)
+        cache.put(url, location, etag, jso)
+        return self.build_resource_from_json(copy.deepcopy(jso), entity, location, etag)
         
     def update(self, url, etag, changes, entity=None, headers=None):
-        r = requests.patch(url, json=changes, headers = headers if headers is not None else self.update_headers(etag))
+        r = self.session().patch(url, json=changes, headers = headers if headers is not None else self.update_headers(etag))
+        cache = self.cache()
+        if cache is not None:
+            cache.remove(url)
         return self.process_resource_result(url, r, entity)
             
-    def delete(self, url, entity=None, headers=None):
-        r = requests.delete(url, headers = headers if headers is not None else self.delete_headers())
+    def delete(self, url, entity=None, headers=None, etag=None):
+        # with an etag, the DELETE is conditional on the resource not having changed since
+        r = self.session().delete(url, headers = headers if headers is not None else self.delete_headers(etag))
+        cache = self.cache()
+        if cache is not None:
+            cache.remove(url)
         return self.process_resource_result(url, r, entity)
             
     def create(self, url, body, entity=None, headers=None):
-        r = requests.post(url, json=body, headers = headers if headers is not None else self.delete_headers())
+        r = self.session().post(url, json=body, headers = headers if headers is not None else self.delete_headers())
         return self.process_resource_result(url, r, entity, location_header = 'Location')
 
+    def retrieve_related(self, entities, relationships, max_workers=10):
+        # fetch the related resources of many entities at once, with at most max_workers requests in flight.
+        # Each URL is fetched once however many entities point at it. Each fetched resource is recorded in the _related map
+        # of the entities that point at it. Returns a dict from URL to resource, or to the Exception raised fetching it
+        if isinstance(relationships, basestring):
+            relationships = relationships.split()
+        targets = [(entity, relationship, getattr(entity, relationship)) for entity in entities for relationship in relationships if getattr(entity, relationship, None)]
+        urls = list({url for entity, relationship, url in targets})
+        def fetch(url):
+            try:
+                return BaseAPI.retrieve(self, url)
+            except Exception as e:
+                return e
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = dict(zip(urls, executor.map(fetch, urls)))
+        for entity, relationship, url in targets:
+            rslt = results[url]
+            if not isinstance(rslt, Exception):
+                entity._related[relationship] = rslt
+        return results
+
+    def iter_items(self, url, headers=None, chunk_size=65536):
+        # issue a GET for a collection and yield an object for each of its items as the body arrives, without
+        # loading the whole body or building all the items at once
+        r = self.session().get(url, headers = headers if headers is not None else self.retrieve_headers(), stream=True)
+        try:
+            if r.status_code != 200:
+                raise Exception('unexpected HTTP status_code code: %s url: %s text: %s' % (r.status_code, url, r.text))
+            content_type = r.headers.get('Content-Type')
+            if content_type is None:
+                raise Exception('server did not declare content_type')
+            if content_type.split(';')[0] != 'application/json':
+                raise Exception('non-json content_type %s' % content_type)
+            for item in iter_json_array(r.iter_content(chunk_size), 'items'):
+                yield self.build_resource_from_json(item)
+        finally:
+            r.close()
+
     def retrieve_well_known_resource(self, url, entity=None, headers=None):
         url_parts = list(urlparse(url))
         url_parts[0] = url_parts[1] = None
@@ -47,6 +229,11 @@ class BaseAPI(object):
             raise Exception('no such well-known resource %s. Valid urls are: %s' % (urlunparse(url_parts), self.well_known_URLs()))
             
     def process_resource_result(self, url, r, entity=None, location_header = 'Content-Location'):
+        location, etag, jso = self.resource_result_parts(url, r, location_header)
+        return self.build_resource_from_json(jso, entity, location, etag)
+
+    def resource_result_parts(self, url, r, location_header = 'Content-Location'):
+        # check the response and return its location, etag and parsed json body
         if r.status_code == 200 or r.status_code == 201:
             if location_header in r.headers:
                 location = r.headers[location_header]
@@ -55,8 +242,7 @@ class BaseAPI(object):
                     if 'Content-Type' in r.headers:
                         content_type = r.headers['Content-Type'].split(';')[0]
                         if content_type == 'application/json':
-                            jso = r.json()
-                            return self.build_resource_from_json(jso, entity, location, etag)
+                            return location, etag, r.json()
                         else:
                             raise Exception('non-json content_type %s' %  r.headers['Content-Type'])
                     else:
@@ -115,16 +301,208 @@ class BaseResource(object):
             raise Exception('self location not set')
         return self.api().retrieve(self._location, self)
         
+_UNSET = object()    # the original value of a property that was not set
+_MUTATED = object()  # the original value of a dict or list property that was changed in place
+_REPLACED = object() # the original value of a property that was changed in place and then set to another value
+
+def _merge_patch(originals, current):
+    # a JSON merge-patch of the changes since originals were recorded. current(key) returns the value of key now
+    changes = {}
+    for key, original in (originals or {}).iteritems():
+        value = current(key)
+        if value is _UNSET:
+            if original is not _UNSET:
+                changes[key] = None
+        elif original is _MUTATED and isinstance(value, TrackedDict):
+            patch = value.changes()
+            if patch:
+                changes[key] = patch
+        elif original is _MUTATED:
+            changes[key] = value
+        elif original is _REPLACED or value != original:
+            changes[key] = value
+    return changes
+
+def _record_original(originals, key, original):
+    # record the original value of key the first time it changes. Returns the originals dict, which is created if it was None
+    if originals is None:
+        originals = {}
+    if key not in originals:
+        originals[key] = original
+    elif originals[key] is _MUTATED and original is not _MUTATED:
+        originals[key] = _REPLACED
+    return originals
+
+def _track(owner, key, value):
+    # wrap a dict or list value so that changing it in place marks key as changed in owner
+    if isinstance(value, dict) and not (isinstance(value, TrackedDict) and value._owner is owner and value._key == key):
+        return TrackedDict(owner, key, value)
+    elif isinstance(value, list) and not (isinstance(value, TrackedList) and value._owner is owner and value._key == key):
+        return TrackedList(owner, key, value)
+    return value
+
+class TrackedDict(dict):
+    # a dict property of an entity with track_nested_changes. Changing it in place marks the property as changed, and
+    # changes() returns a merge-patch with just the keys of the dict that changed
+
+    def __init__(self, owner, key, value):
+        dict.__init__(self)
+        self._owner = owner
+        self._key = key
+        self._originals = None
+        for k, v in value.iteritems():
+            dict.__setitem__(self, k, _track(self, k, v))
+
+    def _nested_changed(self, key):
+        self._originals = _record_original(self._originals, key, _MUTATED)
+        self._owner._nested_changed(self._key)
+
+    def _changing(self, key):
+        self._originals = _record_original(self._originals, key, dict.get(self, key, _UNSET))
+        self._owner._nested_changed(self._key)
+
+    def changes(self):
+        return _merge_patch(self._originals, lambda key: dict.get(self, key, _UNSET))
+
+    def __setitem__(self, key, value):
+        self._changing(key)
+        dict.__setitem__(self, key, _track(self, key, value))
+
+    def __delitem__(self, key):
+        if key in self:
+            self._changing(key)
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._changing(key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._originals = _record_original(self._originals, key, value)
+        self._owner._nested_changed(self._key)
+        return key, value
+
+    def clear(self):
+        for key in self.keys():
+            del self[key]
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).iteritems():
+            self[key] = value
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+class TrackedList(list):
+    # a list property of an entity with track_nested_changes. Changing it in place marks the property as changed.
+    # A merge-patch cannot change part of a list, so the whole list is sent
+
+    def __init__(self, owner, key, value):
+        list.__init__(self, [_track(self, None, v) for v in value])
+        self._owner = owner
+        self._key = key
+
+    def _nested_changed(self, key):
+        self._owner._nested_changed(self._key)
+
+    def _changed(method):
+        def changing(self, *args):
+            rslt = method(self, *args)
+            self._owner._nested_changed(self._key)
+            return rslt
+        return changing
+
+    def __setitem__(self, index, value):
+        list.__setitem__(self, index, [_track(self, None, v) for v in value] if isinstance(index, slice) else _track(self, None, value))
+        self._owner._nested_changed(self._key)
+
+    def __setslice__(self, i, j, values):
+        self[max(0, i):max(0, j):] = values
+
+    def append(self, value):
+        list.append(self, _track(self, None, value))
+        self._owner._nested_changed(self._key)
+
+    def extend(self, values):
+        list.extend(self, [_track(self, None, v) for v in values])
+        self._owner._nested_changed(self._key)
+
+    def insert(self, index, value):
+        list.insert(self, index, _track(self, None, value))
+        self._owner._nested_changed(self._key)
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    __delitem__ = _changed(list.__delitem__)
+    __delslice__ = _changed(list.__delslice__)
+    __imul__ = _changed(list.__imul__)
+    pop = _changed(list.pop)
+    remove = _changed(list.remove)
+    reverse = _changed(list.reverse)
+    sort = _changed(list.sort)
+    del _changed
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
 class BaseEntity(BaseResource):
-    
+
+    # set to True in a subclass to also notice changes made in place to dict and list properties, like entity.address['city'] = x.
+    # Dict and list values are then wrapped in a TrackedDict or TrackedList when they are loaded or set
+    track_nested_changes = False
+    # set to False in a subclass to not keep the json the entity was last loaded from in _jso
+    keep_jso = True
+
     def __init__(self, jso = None, url = None, etag = None):
+        object.__setattr__(self, '_originals', None)
         self._related = dict()
         self.kind = type(self).__name__
         super(BaseEntity, self).__init__(jso, url, etag)
-        
+
+    def __setattr__(self, name, value):
+        # remember the value a property had before it was first changed since the last load, so changes() need only look at those
+        if not name.startswith('_'):
+            self._originals = _record_original(getattr(self, '_originals', None), name, getattr(self, name, _UNSET))
+            if self.track_nested_changes:
+                value = _track(self, name, value)
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        if not name.startswith('_') and hasattr(self, name):
+            self._originals = _record_original(getattr(self, '_originals', None), name, getattr(self, name))
+        object.__delattr__(self, name)
+
+    def _nested_changed(self, name):
+        self._originals = _record_original(self._originals, name, _MUTATED)
+
+    def update_attrs(self, jso = None, url = None, etag = None):
+        if jso:
+            for key, value in jso.iteritems():
+                object.__setattr__(self, key, _track(self, key, value) if self.track_nested_changes and not key.startswith('_') else value)
+            if '_location' in jso:
+                self._location = jso['_location']
+            elif '_self' in jso:
+                self._location = jso['_self']
+            if self.keep_jso:
+                self._jso = jso
+            self._originals = None
+        if url:
+            self._location = url
+        if etag:
+            self._etag = etag
+
     def changes(self):
-        jso = self._jso if hasattr(self, '_jso') else None
-        return {key: value for key, value in self.__dict__.iteritems() if not (key.startswith('_') or (jso and key in jso and jso[key] == value))}
+        # a merge-patch of the properties changed since the entity was last loaded. A deleted property has the value None
+        return _merge_patch(self._originals, lambda name: getattr(self, name, _UNSET))
 
     def update(self):
         # issue a PATCH or PUT to update this object from API
@@ -156,16 +534,36 @@ class BaseEntity(BaseResource):
     def get_related(self, relationship, default_value):
         # return a previously-fetched related resource
         return self._related.get(relationship, default_value)
-            
+
+class BaseCompactEntity(BaseEntity):
+    # an entity that keeps its properties in __slots__ and does not keep the json it was loaded from. Subclasses declare
+    # __slots__ for their own properties - other properties go in __dict__, which python only creates when the first one is set
+
+    __slots__ = ('_self', '_location', '_etag', '_related', '_originals', 'kind')
+    keep_jso = False
+
 class BaseCollection(BaseResource):
 
+    # set to True in a subclass to build the objects for items only when they are accessed
+    lazy_items = False
+
     def update_attrs(self, jso, url, etag):
         super(BaseCollection, self).update_attrs(jso, url, etag)
         if jso and 'items' in jso:
-            self.items = {}
-            for item in jso['items']:
-                item_object = self.api().build_resource_from_json(item)
-                self.items[item_object._location] = item_object
+            if self.lazy_items:
+                self.items = LazyItems(self.api(), jso['items'])
+            else:
+                self.items = {}
+                for item in jso['items']:
+                    item_object = self.api().build_resource_from_json(item)
+                    self.items[item_object._location] = item_object
+
+    def iter_items(self):
+        # stream the items of this collection from the API, one object at a time
+        if self._location:
+            return self.api().iter_items(self._location)
+        else:
+            raise Exception('Collection has no _self property')
 
     def create(self, entity):
         # create a new entity in the API by POSTing
@@ -173,11 +571,168 @@ class BaseCollection(BaseResource):
             if hasattr(entity, '_self') and entity._self:
                 raise Exception('entity already exists in API %s' % entity)
             rslt = self.api().create(self._location, entity.changes(), entity)
-            if hasattr(self, 'items'):
-                if entity._self in self.items:
-                    raise Exception('Duplicate id')
-                else:
-                    self.items[entity._self] = entity
-            return entity
+            return self.add_item(entity)
+        else:
+            raise Exception('Collection has no _self property')
+
+    def create_all(self, entities, max_workers=10):
+        # create many entities in the API, with at most max_workers POSTs in flight. A failure does not stop the others.
+        # Returns a list of (entity, result) pairs in the order of entities, where result is the entity or the Exception raised
+        if not self._location:
+            raise Exception('Collection has no _self property')
+        api = self.api()
+        def create(entity):
+            if hasattr(entity, '_self') and entity._self:
+                raise Exception('entity already exists in API %s' % entity)
+            return BaseAPI.create(api, self._location, entity.changes(), entity)
+        results = map_concurrently(create, entities, max_workers)
+        for i, (entity, rslt) in enumerate(results):
+            if not isinstance(rslt, Exception):
+                try:
+                    self.add_item(entity)
+                except Exception as e:
+                    results[i] = (entity, e)
+        return results
+
+    def update_all(self, entities, max_workers=10):
+        # send the changes of many entities to the API, with at most max_workers PATCHes in flight. Each PATCH is conditional
+        # on the entity's _etag. Returns a list of (entity, result) pairs like create_all
+        api = self.api()
+        def update(entity):
+            if not getattr(entity, '_location', None):
+                raise Exception('self _location not set')
+            if getattr(entity, '_etag', None) is None:
+                raise Exception('self _etag not set')
+            return BaseAPI.update(api, entity._location, entity._etag, entity.changes(), entity)
+        return map_concurrently(update, entities, max_workers)
+
+    def delete_all(self, entities, max_workers=10, use_etags=True):
+        # remove many entities from the API, with at most max_workers DELETEs in flight. With use_etags, each DELETE is
+        # conditional on the entity's _etag when it has one. Returns a list of (entity, result) pairs like create_all
+        api = self.api()
+        def delete(entity):
+            if not getattr(entity, '_location', None):
+                raise Exception('self location not set')
+            return BaseAPI.delete(api, entity._location, entity, etag=getattr(entity, '_etag', None) if use_etags else None)
+        results = map_concurrently(delete, entities, max_workers)
+        if hasattr(self, 'items'):
+            for entity, rslt in results:
+                if not isinstance(rslt, Exception):
+                    self.items.pop(entity._location, None)
+        return results
+
+    def add_item(self, entity):
+        # record a newly-created entity in items, if items have been loaded
+        if hasattr(self, 'items'):
+            if entity._self in self.items:
+                raise Exception('Duplicate id')
+            else:
+                self.items[entity._self] = entity
+        return entity
+
+class LazyItems(MutableMapping):
+    # the items of a collection keyed by URL. The object for an item is only built from its json when it is first accessed
+
+    def __init__(self, api, jsos):
+        self._api = api
+        self._entries = {jso.get('_location', jso.get('_self')): jso for jso in jsos}
+
+    def __getitem__(self, url):
+        entry = self._entries[url]
+        if not isinstance(entry, BaseResource):
+            entry = self._entries[url] = self._api.build_resource_from_json(entry)
+        return entry
+
+    def __setitem__(self, url, item):
+        self._entries[url] = item
+
+    def __delitem__(self, url):
+        del self._entries[url]
+
+    def __contains__(self, url):
+        return url in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+def iter_json_array(chunks, key):
+    # yield, one at a time, the elements of the array that is the value of key in the JSON object arriving as chunks of bytes.
+    # Only one element is held in memory at a time. Other properties of the object are parsed and discarded
+    stream = JSONStream(chunks)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        name = stream.value()
+        stream.expect(':')
+        if name == key and stream.peek() == '[':
+            stream.expect('[')
+            if stream.peek() == ']':
+                return
+            while True:
+                yield stream.value()
+                if stream.expect(',]') == ']':
+                    return
         else:
-            raise Exception('Collection has no _self property')
\ No newline at end of file
+            stream.value()
+        if stream.expect(',}') == '}':
+            return
+
+class JSONStream(object):
+    # a cursor over JSON text arriving in chunks that decodes one value at a time, reading more chunks only when it needs them
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = u''
+        self.pos = 0
+        self.exhausted = False
+
+    def read_more(self):
+        if self.exhausted:
+            return False
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer += self.text_decoder.decode(chunk)
+                return True
+        self.buffer += self.text_decoder.decode(b'', True)
+        self.exhausted = True
+        return False
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.read_more():
+                raise ValueError('unexpected end of JSON text')
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError('expected one of %s but found %s in JSON text' % (chars, char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if not self.read_more():
+                    raise
+                continue
+            # a number that reaches the end of the buffer, like 12 or 0. may continue in the next chunk
+            if isinstance(value, (int, long, float)) and not isinstance(value, bool) and \
+                    (end == len(self.buffer) or self.buffer[end] in '0123456789.eE+-') and self.read_more():
+                continue
+            self.pos = end
+            return value
@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+# Tests of base_api that need no server. The session of the API under test is a FakeSession, which keeps resources in memory
+import json, copy, threading, time
+from rapier.py.base_api import JSONStream, iter_json_array, LazyItems, BaseResource, BaseEntity, BaseCompactEntity, TrackedDict, TrackedList, \
+    BaseAPI, BaseCollection, ResourceCache
+from rapier.py.async_base_api import AsyncBaseAPI, AsyncBaseEntity
+from rapier.util import gen_py_sdk
+
+ITEMS = [{'s': u'quote " backslash \\ slash / tab \t newline \n'}, u'caf\xe9 ☃ \U0001f600', {'n': [12, -3.5e+10, 0.25, True, None]},
+         [], {}, 12345678901234567890, u'\\u1234 \\" is not an escape']
+DOCUMENT = json.dumps({'kind': 'Collection', 'items': ITEMS, 'after': {'ignored': [1, 2]}}, ensure_ascii=False).encode('utf-8')
+
+def chunked(data, *boundaries):
+    # data cut at each of boundaries
+    boundaries = (0,) + boundaries + (len(data),)
+    return [data[start:end] for start, end in zip(boundaries, boundaries[1:])]
+
+def test_iter_json_array_chunk_boundaries():
+    # every split of the document into two chunks, including splits inside strings, escapes and multi-byte characters
+    for boundary in range(len(DOCUMENT) + 1):
+        assert list(iter_json_array(chunked(DOCUMENT, boundary), 'items')) == ITEMS, boundary
+    # one byte at a time, with empty chunks, which requests gives for keep-alive
+    chunks = []
+    for byte in DOCUMENT:
+        chunks.extend([byte, b''])
+    assert list(iter_json_array(chunks, 'items')) == ITEMS
+
+def test_iter_json_array_empty():
+    assert list(iter_json_array([b'{"items": []}'], 'items')) == []
+    assert list(iter_json_array([b'{"items"', b': [', b'  ', b']}'], 'items')) == []
+    assert list(iter_json_array([b'{}'], 'items')) == []
+    assert list(iter_json_array([b'{"kind": "Collection"}'], 'items')) == []
+    assert list(iter_json_array([b'{"items": {"a": 1}}'], 'items')) == []
+
+def test_iter_json_array_malformed():
+    # the elements that arrive before the problem are still given
+    for chunks in ([b'{"items": [1, 2, {"a": ', b'tru'], [b'{"items": [1, 2, {"a": true} x'], [b'{"items": [1, 2, '], [b'{"items": [1, 2, "abc']):
+        items = []
+        try:
+            for item in iter_json_array(chunks, 'items'):
+                items.append(item)
+        except ValueError:
+            assert items[:2] == [1, 2], (chunks, items)
+        else:
+            raise Exception('malformed JSON should have raised a ValueError: %s' % chunks)
+
+def test_json_stream_numbers():
+    # a number that ends at the end of a chunk may go on in the next one
+    stream = JSONStream([b'[12', b'34', b'.5', b'e1', b']'])
+    stream.expect('[')
+    assert stream.value() == 12345.0
+    assert stream.expect(']') == ']'
+
+class FakeAPI(object):
+
+    def __init__(self):
+        self.built = []
+
+    def build_resource_from_json(self, jso):
+        self.built.append(jso['_self'])
+        return FakeResource(jso)
+
+class FakeResource(BaseResource):
+
+    def __init__(self, jso):
+        self.jso = jso
+
+def test_lazy_items():
+    api = FakeAPI()
+    items = LazyItems(api, [{'_self': 'http://x/1', 'n': 1}, {'_self': 'http://x/2', '_location': 'http://x/two', 'n': 2}])
+    assert sorted(items) == ['http://x/1', 'http://x/two'] and len(items) == 2 and 'http://x/two' in items
+    assert api.built == []
+    assert items['http://x/two'].jso['n'] == 2
+    assert items['http://x/two'] is items['http://x/two']
+    assert api.built == ['http://x/2']
+    del items['http://x/1']
+    assert list(items) == ['http://x/two'] and api.built == ['http://x/2']
+
+class Person(BaseEntity):
+    track_nested_changes = True
+
+class CompactPerson(BaseCompactEntity):
+    __slots__ = ('name', 'address', 'tags')
+    track_nested_changes = True
+
+PERSON = {'_self': 'http://x/p', 'kind': 'Person', 'name': 'Ann', 'address': {'city': 'London', 'geo': {'lat': 51, 'lng': 0}}, 'tags': ['a', 'b']}
+
+def loaded_people():
+    # a Person and a CompactPerson, loaded from PERSON as a refresh loads them
+    people = [Person(), CompactPerson()]
+    for person in people:
+        person.update_attrs(json.loads(json.dumps(PERSON)))
+    return people
+
+def test_tracked_values():
+    for person in loaded_people():
+        assert isinstance(person.address, TrackedDict) and isinstance(person.address['geo'], TrackedDict) and isinstance(person.tags, TrackedList)
+        assert person.changes() == {}
+
+def test_nested_set():
+    for person in loaded_people():
+        person.address['geo']['lat'] = 48
+        assert person.changes() == {'address': {'geo': {'lat': 48}}}
+        person.address['zip'] = 'N1'
+        assert person.changes() == {'address': {'geo': {'lat': 48}, 'zip': 'N1'}}
+
+def test_nested_delete():
+    # a deleted key is null in a merge-patch
+    for person in loaded_people():
+        del person.address['city']
+        assert person.changes() == {'address': {'city': None}}
+        person.address['geo'].pop('lng')
+        assert person.changes() == {'address': {'city': None, 'geo': {'lng': None}}}
+        del person.name
+        assert person.changes() == {'name': None, 'address': {'city': None, 'geo': {'lng': None}}}
+
+def test_restore_original():
+    # a value set back to what it was loaded with is not a change
+    for person in loaded_people():
+        person.name = 'Bob'
+        person.name = 'Ann'
+        person.address['city'] = 'Paris'
+        person.address['city'] = 'London'
+        person.address['geo']['lat'] = 0
+        person.address['geo']['lat'] = 51
+        del person.address['geo']['lng']
+        person.address['geo']['lng'] = 0
+        assert person.changes() == {}
+
+def test_replace_list():
+    # a merge-patch cannot change part of a list, so a list changed in place or replaced is sent whole
+    for person in loaded_people():
+        person.tags.append('c')
+        assert person.changes() == {'tags': ['a', 'b', 'c']}
+    for person in loaded_people():
+        person.tags[0:1] = ['z', 'y']
+        assert person.changes() == {'tags': ['z', 'y', 'b']}
+    for person in loaded_people():
+        person.tags = ['x']
+        assert person.changes() == {'tags': ['x']} and isinstance(person.tags, TrackedList)
+        person.tags.append({'k': 1})
+        person.tags[1]['k'] = 2
+        assert person.changes() == {'tags': ['x', {'k': 2}]}
+    for person in loaded_people():
+        # changed in place, then replaced by a list equal to the original
+        person.tags.append('c')
+        person.tags = ['a', 'b']
+        assert person.changes() == {'tags': ['a', 'b']}
+
+def test_replace_nested_dict():
+    # a dict property set to another dict is sent whole, not as a patch of the old one
+    for person in loaded_people():
+        person.address['city'] = 'Paris'
+        person.address = {'city': 'Rome'}
+        assert person.changes() == {'address': {'city': 'Rome'}}
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, headers=None, jso=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.jso = jso
+        self.text = json.dumps(jso) if jso is not None else ''
+
+    def json(self):
+        return copy.deepcopy(self.jso)
+
+class FakeSession(object):
+    # answers requests from resources kept in memory, honoring If-None-Match and If-Match. Each request is recorded as
+    # (method, url, headers), and the most requests in flight at once is kept. A request for a url in fail_urls raises
+
+    def __init__(self, resources=None, delay=0):
+        self.resources = {} # url -> [version, jso]. The ETag of a resource is its version in quotes
+        for url, jso in (resources or {}).iteritems():
+            self.resources[url] = [0, jso]
+        self.delay = delay
+        self.fail_urls = set()
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def request(self, method, url, headers, body=None):
+        with self.lock:
+            self.requests.append((method, url, dict(headers or {})))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if url in self.fail_urls:
+                raise IOError('connection refused: %s' % url)
+            with self.lock:
+                return self.respond(method, url, headers or {}, body)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def respond(self, method, url, headers, body):
+        if method == 'POST':
+            location = '%s/%d' % (url, len(self.resources))
+            self.resources[location] = [0, dict(body, _self=location)]
+            return self.ok(location, 201, 'Location')
+        resource = self.resources.get(url)
+        if resource is None:
+            return FakeResponse(404)
+        if 'If-Match' in headers and headers['If-Match'] != etag(resource):
+            return FakeResponse(412)
+        if method == 'GET':
+            if headers.get('If-None-Match') == etag(resource):
+                return FakeResponse(304, {'ETag': etag(resource)})
+        elif method == 'PATCH':
+            for key, value in body.iteritems():
+                if value is None:
+                    resource[1].pop(key, None)
+                else:
+                    resource[1][key] = value
+            resource[0] += 1
+        elif method == 'DELETE':
+            response = self.ok(url)
+            del self.resources[url]
+            return response
+        return self.ok(url)
+
+    def ok(self, url, status_code=200, location_header='Content-Location'):
+        resource = self.resources[url]
+        return FakeResponse(status_code, {location_header: url, 'ETag': etag(resource), 'Content-Type': 'application/json'}, resource[1])
+
+    def get(self, url, headers=None, stream=False):
+        return self.request('GET', url, headers)
+
+    def patch(self, url, json=None, headers=None):
+        return self.request('PATCH', url, headers, json)
+
+    def delete(self, url, headers=None):
+        return self.request('DELETE', url, headers)
+
+    def post(self, url, json=None, headers=None):
+        return self.request('POST', url, headers, json)
+
+def etag(resource):
+    return '"%d"' % resource[0]
+
+class API(BaseAPI):
+
+    def resource_class(self, kind):
+        return {'Item': Item, 'Collection': Collection}.get(kind, BaseResource)
+
+class Item(BaseEntity):
+
+    def api(self):
+        return fake_api
+
+class Collection(BaseCollection):
+
+    def api(self):
+        return fake_api
+
+fake_api = None
+
+def use_fake_api(resources=None, cache=None, delay=0):
+    # make the api of Item and Collection one with a FakeSession holding resources, and return it
+    global fake_api
+    fake_api = API(FakeSession(resources, delay), cache)
+    return fake_api
+
+def items(count):
+    return dict(('http://x/items/%d' % i, {'_self': 'http://x/items/%d' % i, 'kind': 'Item', 'n': i}) for i in range(count))
+
+def test_cache_revalidates():
+    api = use_fake_api(items(1), ResourceCache())
+    first = api.retrieve('http://x/items/0')
+    second = api.retrieve('http://x/items/0')
+    session = api.session()
+    assert [request[2].get('If-None-Match') for request in session.requests] == [None, '"0"']
+    assert api.cache().misses == 1 and api.cache().hits == 1
+    # a 304 rebuilds the resource from the cache, as a copy that the first resource does not share
+    assert isinstance(second, Item) and second is not first and second.n == 0 and second._etag == '"0"' and second._location == 'http://x/items/0'
+    first.n = 5
+    assert api.retrieve('http://x/items/0').n == 0
+
+def test_cache_changed_resource():
+    api = use_fake_api(items(1), ResourceCache())
+    api.retrieve('http://x/items/0')
+    session = api.session()
+    session.resources['http://x/items/0'] = [7, {'_self': 'http://x/items/0', 'kind': 'Item', 'n': 'changed'}]
+    item = api.retrieve('http://x/items/0')
+    assert item.n == 'changed' and item._etag == '"7"' and api.cache().misses == 2 and api.cache().hits == 0
+    assert api.retrieve('http://x/items/0').n == 'changed' and api.cache().hits == 1
+
+def test_cache_update_and_delete_invalidate():
+    api = use_fake_api(items(2), ResourceCache())
+    item = api.retrieve('http://x/items/0')
+    api.retrieve('http://x/items/1')
+    item.n = 10
+    item.update()
+    assert api.cache().get('http://x/items/0') is None and len(api.cache()) == 1
+    api.delete('http://x/items/1')
+    assert len(api.cache()) == 0
+
+def test_cache_eviction():
+    api = use_fake_api(items(4), ResourceCache(max_size=2))
+    cache = api.cache()
+    api.retrieve('http://x/items/0')
+    api.retrieve('http://x/items/1')
+    api.retrieve('http://x/items/0') # now the most recently used
+    api.retrieve('http://x/items/2')
+    assert len(cache) == 2
+    assert cache.get('http://x/items/1') is None and cache.get('http://x/items/0') is not None and cache.get('http://x/items/2') is not None
+    session = api.session()
+    del session.requests[:]
+    api.retrieve('http://x/items/1')
+    assert session.requests[0][2].get('If-None-Match') is None and len(cache) == 2
+    cache.put('http://x/items/3', 'http://x/items/3', '"0"', {})
+    cache.put('http://x/items/3', 'http://x/items/3', '"1"', {})
+    assert len(cache) == 2 and cache.get('http://x/items/3').etag == '"1"'
+
+def retrieved_items(api, count):
+    return [api.retrieve('http://x/items/%d' % i) for i in range(count)]
+
+def test_update_all_if_match():
+    api = use_fake_api(items(3))
+    entities = retrieved_items(api, 3)
+    api.session().resources['http://x/items/1'][0] = 5 # changed by someone else since it was retrieved
+    for entity in entities:
+        entity.n = 'new'
+    results = Collection('http://x/items').update_all(entities)
+    patches = [request for request in api.session().requests if request[0] == 'PATCH']
+    assert sorted((url, headers['If-Match']) for method, url, headers in patches) == [('http://x/items/%d' % i, '"0"') for i in range(3)]
+    assert [entity for entity, rslt in results] == entities
+    assert results[0][1] is entities[0] and results[2][1] is entities[2] and entities[0]._etag == '"1"'
+    assert isinstance(results[1][1], Exception) and '412' in str(results[1][1])
+    assert api.session().resources['http://x/items/0'][1]['n'] == 'new' and api.session().resources['http://x/items/1'][1]['n'] == 1
+
+def test_delete_all_if_match():
+    api = use_fake_api(items(3))
+    entities = retrieved_items(api, 3)
+    api.session().resources['http://x/items/2'][0] = 5
+    results = Collection('http://x/items').delete_all(entities)
+    deletes = [request for request in api.session().requests if request[0] == 'DELETE']
+    assert sorted(headers.get('If-Match') for method, url, headers in deletes) == ['"0"'] * 3
+    assert [isinstance(rslt, Exception) for entity, rslt in results] == [False, False, True]
+    assert api.session().resources.keys() == ['http://x/items/2']
+    # without etags the DELETE is unconditional
+    results = Collection('http://x/items').delete_all(entities[2:], use_etags=False)
+    assert 'If-Match' not in api.session().requests[-1][2] and not isinstance(results[0][1], Exception) and not api.session().resources
+
+def test_bulk_concurrency_bound():
+    # at most max_workers requests are in flight, a failing request does not stop the others, and results keep the order of entities
+    api = use_fake_api(items(20), delay=0.01)
+    session = api.session()
+    entities = retrieved_items(api, 20)
+    session.max_in_flight = 0
+    session.fail_urls.add('http://x/items/3')
+    for entity in entities:
+        entity.n = 'new'
+    results = Collection('http://x/items').update_all(entities, max_workers=3)
+    assert 1 < session.max_in_flight <= 3, session.max_in_flight
+    assert [entity for entity, rslt in results] == entities
+    assert [i for i, (entity, rslt) in enumerate(results) if isinstance(rslt, Exception)] == [3] and isinstance(results[3][1], IOError)
+    assert all(session.resources['http://x/items/%d' % i][1]['n'] == 'new' for i in range(20) if i != 3)
+    session.max_in_flight = 0
+    results = Collection('http://x/items').delete_all(entities, max_workers=4)
+    assert 1 < session.max_in_flight <= 4 and [i for i, (entity, rslt) in enumerate(results) if isinstance(rslt, Exception)] == [3]
+
+def test_create_all():
+    api = use_fake_api(delay=0.01)
+    session = api.session()
+    collection = Collection('http://x/items')
+    collection.items = {}
+    entities = [Item() for i in range(10)]
+    for i, entity in enumerate(entities):
+        entity.n = i
+    entities[4]._self = 'http://x/items/already'
+    results = collection.create_all(entities, max_workers=2)
+    assert session.max_in_flight == 2
+    assert [i for i, (entity, rslt) in enumerate(results) if isinstance(rslt, Exception)] == [4]
+    assert len(session.resources) == 9 and len(collection.items) == 9 and entities[0]._location in collection.items
+
+class AsyncAPI(AsyncBaseAPI):
+
+    def resource_class(self, kind):
+        return {'Item': Item}.get(kind, BaseResource)
+
+def test_async_max_workers():
+    # the futures of an AsyncBaseAPI run on a pool of max_workers threads, so no more than that many requests are in flight
+    api = AsyncAPI(FakeSession(items(12), 0.01), max_workers=3)
+    futures = [api.retrieve('http://x/items/%d' % i) for i in range(12)]
+    assert [future.result().n for future in futures] == range(12)
+    assert 1 < api.session().max_in_flight <= 3, api.session().max_in_flight
+    assert api.executor() is AsyncAPI(FakeSession(), max_workers=3).executor()
+    assert api.executor() is not AsyncAPI(FakeSession()).executor()
+
+def test_reserved_slot_names():
+    # the names gen_py_sdk keeps out of the __slots__ of a generated entity are all the names of the base classes
+    assert gen_py_sdk.BASE_SLOTS == set(BaseCompactEntity.__slots__)
+    base_names = set(name for name in dir(BaseCompactEntity) + dir(AsyncBaseEntity) if not name.startswith('__'))
+    assert base_names <= gen_py_sdk.RESERVED_NAMES, base_names - gen_py_sdk.RESERVED_NAMES
+    entities = {'Thing': {'properties': {'name': {}, 'keep_jso': {}, '_etag': {}, 'class': {}, 1: {}, None: {}}}}
+    assert gen_py_sdk.ClientGenerator().slot_names('Thing', entities) == ['name']
+
+def main():
+    test_iter_json_array_chunk_boundaries()
+    test_iter_json_array_empty()
+    test_iter_json_array_malformed()
+    test_json_stream_numbers()
+    test_lazy_items()
+    test_tracked_values()
+    test_nested_set()
+    test_nested_delete()
+    test_restore_original()
+    test_replace_list()
+    test_replace_nested_dict()
+    test_cache_revalidates()
+    test_cache_changed_resource()
+    test_cache_update_and_delete_invalidate()
+    test_cache_eviction()
+    test_update_all_if_match()
+    test_delete_all_if_match()
+    test_bulk_concurrency_bound()
+    test_create_all()
+    test_async_max_workers()
+    test_reserved_slot_names()
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
 DIR=$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd)
 $DIR/hello_message/run_tests.sh
-$DIR/todo_list/run_tests.sh
\ No newline at end of file
+$DIR/todo_list/run_tests.sh
+$DIR/base_api/run_tests.sh
\ No newline at end of file
@@ -12,5 +12,5 @@ setup(
     author = 'Martin Nally',
     author_email = 'mnally@apigee.com',
     url = 'https://github.com/apigee-labs/rapier',
-    install_requires = ['PyYAML==3.11']
+    install_requires = ['PyYAML==3.11', 'futures; python_version<"3"']
     )
\ No newline at end of file
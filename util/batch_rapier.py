@@ -0,0 +1,126 @@
+#!/usr/bin/env python 
+
+import sys, os, getopt, time, traceback, multiprocessing
+from StringIO import StringIO
+import validate_rapier
+from validate_rapier import SpecError
+from gen_openapispec import OASGenerator, dump_openapispec
+
+SPEC_EXTENSIONS = ('.yaml', '.yml')
+
+def find_specs(paths, output_dir):
+    # the (filename, output path) of each spec to process. The specs in a directory are found recursively, and their output paths
+    # mirror the directory structure
+    jobs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.endswith(SPEC_EXTENSIONS):
+                        spec_filename = os.path.join(dirpath, filename)
+                        jobs.append((spec_filename, output_path(output_dir, os.path.relpath(spec_filename, path))))
+        else:
+            jobs.append((path, output_path(output_dir, os.path.basename(path))))
+    return jobs
+
+def output_path(output_dir, relative_filename):
+    return os.path.join(output_dir, os.path.splitext(relative_filename)[0] + '.openapi.yaml')
+
+def init_worker():
+    # each worker keeps the specs it has validated, so the files that many specs include are parsed and validated once per worker.
+    # Workers cannot start processes of their own, so they parse files one at a time
+    validate_rapier.set_spec_cache(validate_rapier.MemorySpecCache())
+    validate_rapier.SpecGraph.default_processes = 1
+
+def process_spec(job):
+    # validate a spec, and unless validate_only is set, write its OpenAPI spec to output_path.
+    # Returns (filename, succeeded, messages, seconds), where messages is what would have been written to stderr
+    filename, output_path, opts, validate_only = job
+    start = time.time()
+    stderr = sys.stderr
+    sys.stderr = messages = StringIO()
+    try:
+        if validate_only:
+            result = validate_rapier.OASValidator().validate(filename, None)
+            succeeded = result is not None and result[1] == 0
+        else:
+            generator = OASGenerator()
+            generator.set_opts(opts)
+            openAPI_spec_yaml = dump_openapispec(generator.openAPI_spec_from_rapier(filename))
+            directory = os.path.dirname(output_path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(output_path, 'w') as f:
+                f.write(openAPI_spec_yaml)
+            succeeded = True
+    except SpecError as e:
+        print >> sys.stderr, e
+        succeeded = False
+    except Exception:
+        traceback.print_exc()
+        succeeded = False
+    finally:
+        sys.stderr = stderr
+    return filename, succeeded, messages.getvalue(), time.time() - start
+
+def run_batch(jobs, processes):
+    # yields the result of process_spec for each job, in the order of the jobs
+    if processes > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(processes, init_worker)
+        try:
+            for result in pool.imap(process_spec, jobs):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        default_processes = validate_rapier.SpecGraph.default_processes
+        init_worker()
+        try:
+            for job in jobs:
+                yield process_spec(job)
+        finally:
+            validate_rapier.set_spec_cache(None)
+            validate_rapier.SpecGraph.default_processes = default_processes
+
+def main(args):
+    usage = 'usage: batch_rapier.py [-v, --validate] [-o, --output-dir dirname] [--processes n] [-m, --yaml-merge] [-i, --include-impl] [-t --suppress-templates] filename-or-directory...'
+    try:
+        opts, args = getopt.getopt(args, 'vo:mit', ['validate', 'output-dir=', 'processes=', 'yaml-merge', 'include-impl', 'suppress-templates'])
+    except getopt.GetoptError as err:
+        sys.exit(str(err) + '\n' + usage)
+    if not args:
+        sys.exit(usage)
+    output_dir = '.'
+    processes = multiprocessing.cpu_count()
+    validate_only = False
+    generator_opts = []
+    for k, v in opts:
+        if k in ('-o', '--output-dir'):
+            output_dir = v
+        elif k == '--processes':
+            try:
+                processes = int(v)
+            except ValueError:
+                sys.exit('--processes must be a number: %s\n%s' % (v, usage))
+        elif k in ('-v', '--validate'):
+            validate_only = True
+        else:
+            generator_opts.append((k, v))
+    start = time.time()
+    jobs = [(filename, path, generator_opts, validate_only) for filename, path in find_specs(args, output_dir)]
+    failed = []
+    for filename, succeeded, messages, seconds in run_batch(jobs, processes):
+        sys.stderr.write(messages)
+        print >> sys.stderr, '%s %s in %.3f seconds' % ('processed' if succeeded else 'FAILED', filename, seconds)
+        if not succeeded:
+            failed.append(filename)
+    print >> sys.stderr, '%s specs processed in %.3f seconds: %s succeeded, %s failed' % (len(jobs), time.time() - start, len(jobs) - len(failed), len(failed))
+    for filename in failed:
+        print >> sys.stderr, '  failed: %s' % filename
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
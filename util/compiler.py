@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+import sys, os, getopt, threading
+import yaml
+from cStringIO import StringIO
+import validate_rapier
+from validate_rapier import SpecError
+from gen_openapispec import OASGenerator, RelationshipIndex, FragmentCache, dump_openapispec, OUTPUT_FORMATS
+from gen_html import HTMLGenerator
+import gen_py_sdk, gen_js_sdk
+
+# An in-process API for validating rapier specs and generating from them, for programs that would otherwise run the command line
+# tools once per spec. compile_spec writes nothing to stdout or stderr and does not exit - what the command line tools would report
+# is in the CompileResult it returns. Each call has its own validator and generators, and parses the files it loads in the calling
+# process, never in a pool of processes. The validator keeps state in module globals that every call shares - the open documents
+# of validate_rapier.open_documents, the spec cache of validate_rapier.set_spec_cache, the keyword tables and their suggestions,
+# and SpecGraph.default_processes - so compiles never run concurrently: each call holds compile_lock while it runs, and a call
+# made while another is running waits for it to finish. A program that also validates with OASValidator directly, or changes any
+# of those globals, while it compiles must hold compile_lock while it does. A FragmentCache, which a program that compiles the same spec again and
+# again as it is edited can pass to each call so that the OpenAPI targets only generate again the fragments of the entities
+# that changed, is only used under compile_lock.
+# All the targets of one call are generated from the one validated spec, and the OpenAPI and HTML generators share one
+# RelationshipIndex. main writes the targets of a spec to an output directory, for rapier --targets.
+
+TARGETS = ('openapi', 'openapi-impl', 'html', 'python', 'js')
+ARTIFACT_EXTENSIONS = {'openapi': '.openapi', 'openapi-impl': '.openapi-impl', 'html': '.html', 'python': '.py', 'js': '.js'}
+
+compile_lock = threading.RLock() # held by each call of compile_spec, for the module globals of the validator
+
+class CompileResult(object):
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.model = None # the validated rapier spec, or None if it could not be read or was empty
+        self.validator = None # the OASValidator that validated the spec, for resolving entities of the model
+        self.errors = 0 # the number of validation errors
+        self.diagnostics = [] # (severity, message, abs filename, start, end), as in OASValidator.diagnostic
+        self.messages = [] # the validation messages, as the command line tools write them to stderr, then any fatal error
+        self.openapi_spec = None # the OpenAPI spec, as the objects that the 'openapi' artifact is a dump of
+        self.artifacts = dict() # target -> the text generated for it
+
+    def succeeded(self):
+        return self.model is not None and self.errors == 0 and not any(diagnostic[0] == 'FATAL ERROR' for diagnostic in self.diagnostics)
+
+def compile_spec(filename, content=None, targets=('openapi',), yaml_merge=False, include_impl=False, suppress_templates=False,
+                 output_format='yaml', use_async=False, fragment_cache=None):
+    # Validate the spec in filename, or the spec in content if it is given, and generate each of targets from it. The URLs in the
+    # spec are relative to filename either way. yaml_merge, include_impl, suppress_templates and output_format are the options of
+    # gen_openapispec - 'openapi-impl' is 'openapi' with include_impl set - and use_async is the option of gen_py_sdk. fragment_cache
+    # is a FragmentCache for the OpenAPI targets, or None. Generation is only attempted for a spec that validated without errors.
+    # Problems with the spec are reported in the result; other exceptions are raised
+    for target in targets:
+        if target not in TARGETS:
+            raise Exception('unknown target %s - must be one of %s' % (target, ', '.join(TARGETS)))
+    with compile_lock:
+        return _compile_spec(filename, content, targets, yaml_merge, include_impl, suppress_templates, output_format, use_async, fragment_cache)
+
+def _compile_spec(filename, content, targets, yaml_merge, include_impl, suppress_templates, output_format, use_async, fragment_cache):
+    result = CompileResult(filename)
+    validator = result.validator = validate_rapier.OASValidator()
+    validator.quiet = True
+    validator.processes = 1
+    try:
+        validated = validator.validate(filename, None, content)
+    except SpecError as e:
+        validated = None
+        result.messages.append(str(e))
+    except yaml.YAMLError as e:
+        # a syntax error in the spec or a spec it includes - report it as lsp_rapier does, at the position of the mark
+        validated = None
+        mark = (e.problem_mark or e.context_mark) if isinstance(e, yaml.MarkedYAMLError) else None
+        position = (mark.line, mark.column) if mark is not None else None
+        message = ' '.join([part for part in (e.context, e.problem) if part]) if isinstance(e, yaml.MarkedYAMLError) else str(e)
+        error_filename = getattr(e, 'filename', validator.abs_filename)
+        validator.diagnostics.append(('ERROR', message, error_filename, position, position))
+        validator.errors += 1
+        location = ' after line %s column %s' % (mark.line + 1, mark.column + 1) if mark is not None else ''
+        result.messages.append('ERROR - %s in %s%s' % (message, os.path.relpath(error_filename, validator.abs_directoryname), location))
+    result.diagnostics = list(validator.diagnostics)
+    result.messages[0:0] = validator.transcript
+    result.errors = validator.errors
+    if validated is None or validated[0] is None:
+        return result
+    result.model = validated[0]
+    if result.errors > 0:
+        return result
+    relationship_index = RelationshipIndex(validator) if any(target in ('openapi', 'openapi-impl', 'html') for target in targets) else None
+    for target in targets:
+        try:
+            if target in ('openapi', 'openapi-impl'):
+                generator = OASGenerator()
+                generator.set_opts([(option, '') for option, is_set in
+                                    (('--yaml-merge', yaml_merge), ('--include-impl', include_impl or target == 'openapi-impl'),
+                                     ('--suppress-templates', suppress_templates)) if is_set])
+                generator.fragment_cache = fragment_cache
+                openapi_spec = generator.openAPI_spec_from_validator(validator, result.model, result.errors, relationship_index)
+                if target == 'openapi':
+                    result.openapi_spec = openapi_spec
+                result.artifacts[target] = dump_openapispec(openapi_spec, None, output_format)
+            elif target == 'html':
+                result.artifacts[target] = HTMLGenerator().html_from_validator(validator, result.model, result.errors, relationship_index)
+            else:
+                generator = (gen_py_sdk if target == 'python' else gen_js_sdk).ClientGenerator()
+                if target == 'python' and use_async:
+                    generator.set_opts([('--async', '')])
+                generator.set_rapier_spec(result.model)
+                out = StringIO()
+                generator.client_from_rapier(out=out)
+                result.artifacts[target] = out.getvalue()
+        except SpecError as e:
+            result.diagnostics.append(('FATAL ERROR', str(e), validator.abs_filename, None, None))
+            result.messages.append(str(e))
+    return result
+
+def artifact_filename(filename, target, output_format='yaml'):
+    # the name of the file that the target generated from the spec in filename is written to, as watch_rapier and batch_rapier name them
+    extension = ARTIFACT_EXTENSIONS[target]
+    if target in ('openapi', 'openapi-impl'):
+        extension += '.' + output_format
+    return os.path.splitext(os.path.basename(filename))[0] + extension
+
+def write_artifacts(result, output_dir, output_format='yaml'):
+    # write each artifact of result to output_dir, returning the paths written
+    paths = []
+    for target in TARGETS:
+        if target in result.artifacts:
+            path = os.path.join(output_dir, artifact_filename(result.filename, target, output_format))
+            write_file(path, result.artifacts[target])
+            paths.append(path)
+    return paths
+
+def write_file(path, content):
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+    with open(path, 'w') as f:
+        f.write(content)
+
+def main(args):
+    usage = 'usage: compiler.py [-o, --output-dir dirname] [--targets %s] [--output-format yaml|json] [-m, --yaml-merge] ' \
+        '[-i, --include-impl] [-t --suppress-templates] [-a, --async] filename' % ','.join(TARGETS)
+    try:
+        opts, args = getopt.getopt(args, 'o:mita', ['output-dir=', 'targets=', 'output-format=', 'yaml-merge', 'include-impl', 'suppress-templates', 'async'])
+    except getopt.GetoptError as err:
+        sys.exit(str(err) + '\n' + usage)
+    if not len(args) == 1:
+        sys.exit(usage)
+    opts_dict = dict(opts)
+    opts_keys = opts_dict.keys()
+    output_dir = opts_dict.get('-o', opts_dict.get('--output-dir', '.'))
+    if not os.path.isdir(output_dir):
+        sys.exit('output directory does not exist: %s' % output_dir)
+    targets = [target for target in opts_dict.get('--targets', ','.join(TARGETS)).split(',') if target]
+    for target in targets:
+        if target not in TARGETS:
+            sys.exit('unknown target %s - must be one of %s\n%s' % (target, ', '.join(TARGETS), usage))
+    output_format = opts_dict.get('--output-format', 'yaml')
+    if output_format not in OUTPUT_FORMATS:
+        sys.exit('--output-format must be yaml or json: %s\n%s' % (output_format, usage))
+    result = compile_spec(args[0], targets=targets, output_format=output_format,
+                          yaml_merge='-m' in opts_keys or '--yaml-merge' in opts_keys,
+                          include_impl='-i' in opts_keys or '--include-impl' in opts_keys,
+                          suppress_templates='-t' in opts_keys or '--suppress-templates' in opts_keys,
+                          use_async='-a' in opts_keys or '--async' in opts_keys)
+    for message in result.messages:
+        print >> sys.stderr, message
+    write_artifacts(result, output_dir, output_format)
+    if not result.succeeded():
+        sys.exit('generation from %s failed' % args[0])
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -2,6 +2,8 @@
 
 import sys, codecs, os
 import validate_rapier
+from validate_rapier import SpecError
+from gen_openapispec import RelationshipIndex, relationship_graph_for
 
 class HTMLGenerator(object):
 
@@ -21,22 +23,11 @@ class HTMLGenerator(object):
     
     def generate_property_type(self, entity, property):
         if 'relationship' in property:
-            relationship = property['relationship']
-            if isinstance(relationship, basestring):
-                entity_urls = relationship.split()
-                multiplicity = '0:1'
-            elif isinstance(relationship, list):
-                entity_urls = relationship
-                multiplicity = '0:1'                
-            else:
-                entity_urls = relationship['entities']
-                if isinstance(entity_urls, basestring):
-                    entity_urls = entity_urls.split()
-                multiplicity = relationship.get('multiplicity', '0:1')
-            entity_links = [self.create_link(entity_url) for entity_url in entity_urls]
-            upper_bound = multiplicity.split(':')[-1]
-            multi_valued = upper_bound == 'n' or int(upper_bound) > 1
-            return '%s (%s)' % (multiplicity, ' or '.join(entity_links)) if multi_valued else 'url of %s' % ' or '.join(entity_links)
+            edges = self.relationship_graph.property_edges(None, property, entity['id'], entity)
+            entity_links = [self.create_link(edge.target_entity_uri) for edge in edges]
+            if edges and edges[0].is_multivalued():
+                return '%s (%s)' % (edges[0].multiplicity, ' or '.join(entity_links))
+            return 'url of %s' % ' or '.join(entity_links)
         elif '$ref' in property:
             ref = property['$ref']
             return self.create_link(ref)
@@ -179,11 +170,24 @@ class HTMLGenerator(object):
         '''% (spec.get('title', 'untitled'), spec.get('id', '"#"'), version_str, spec.get('description', 'undescribed'))
     
     def generate_html(self, filename):
-        self.validator = validate_rapier.OASValidator()
-        spec, errors = self.validator.validate(filename)
-        if errors == 0:
+        validator = validate_rapier.OASValidator()
+        spec, errors = validator.validate(filename, None)
+        return self.html_from_validator(validator, spec, errors)
+
+    def html_from_validator(self, validator, spec, errors, relationship_index=None):
+        # the HTML for a rapier spec that validator has validated, given the spec and error count that validate returned. Raises
+        # SpecError if the spec has errors or is empty. relationship_index is the RelationshipIndex of the spec, if one was already
+        # made for another generator
+        self.validator = validator
+        if errors > 0:
+            raise SpecError('Validation of %s failed. HTML generation not attempted' % validator.filename)
+        elif spec is None:
+            raise SpecError('Empty spec: %s - no HTML generated' % validator.filename)
+        else:
+            relationship_index = relationship_index if relationship_index is not None else RelationshipIndex(validator)
+            self.relationship_graph = relationship_graph_for(validator, relationship_index)
             
-            self.entities = self.validator.build_included_entity_map()
+            self.entities = relationship_index.included_entity_map
             entities = spec.get('entities')
             rslt = '''<!DOCTYPE html>
 <html>
@@ -204,11 +208,7 @@ class HTMLGenerator(object):
 </body>
 </html>
 ''' % (self.generate_header(spec), self.generate_entities_table(spec) if entities is not None else '')
-            UTF8Writer = codecs.getwriter('utf8')
-            sys.stdout = UTF8Writer(sys.stdout)
             return rslt
-        else:
-            print >>sys.stderr, 'HTML generation of %s failed' % filename
 
 def as_list(value, separator = None):
     if isinstance(value, basestring):
@@ -229,7 +229,12 @@ def main(args):
         usage = 'usage: gen_html.py filename'
         sys.exit(usage)
     html_generator = HTMLGenerator()
-    rslt = html_generator.generate_html(*args)
+    try:
+        rslt = html_generator.generate_html(*args)
+    except SpecError as e:
+        sys.exit(str(e))
+    UTF8Writer = codecs.getwriter('utf8')
+    sys.stdout = UTF8Writer(sys.stdout)
     print rslt
     #except Exception as e:
     #    print >>sys.stderr, 'HTML generation of %s failed: %s' % (args, e)
@@ -1,4 +1,5 @@
 import yaml, sys
+from sdk_util import as_str
 
 class ClientGenerator(object):
 
@@ -6,16 +7,21 @@ class ClientGenerator(object):
         with open(filename) as f:
             self.rapier_spec = yaml.load(f.read())
 
-    def client_from_rapier(self, filename= None):
+    def set_rapier_spec(self, spec):
+        # spec is the data of a rapier spec, as yaml.load gives it or as validate_rapier has validated it
+        self.rapier_spec = spec
+
+    def client_from_rapier(self, filename= None, out=None):
+        out = out if out is not None else sys.stdout
         spec = self.rapier_spec
         if filename:
             self.set_rapier_spec_from_filename(filename)
             
         entities = spec.get('entities',{})
         well_known_urls = [as_list(entity.get('wellKnownURLs')) for entity in entities.itervalues() if 'wellKnownURLs' in entity]
-        well_known_urls = [url for urls in well_known_urls for url in urls]
+        well_known_urls = [as_str(url) for urls in well_known_urls for url in urls]
         
-        print '''var baseAPI = require('rapier')
+        print >> out, '''var baseAPI = require('rapier')
 
 var exports = function() {
             
@@ -45,18 +51,18 @@ var exports = function() {
     {0}.prototype.api = api_function;'''
         
         for entity_name in entities:
-            print class_template.format(entity_name, 'BaseEntity')
+            print >> out, class_template.format(entity_name, 'BaseEntity')
 
-        print class_template.format('Collection', 'BaseCollection')
+        print >> out, class_template.format('Collection', 'BaseCollection')
         
         map_entries = ["{0}: {0}".format((entity_name)) for entity_name in entities] + ["Collection: Collection"]
         
-        print '''
+        print >> out, '''
     var classToKindMap = {
         %s
         }''' % ',\n        '.join(map_entries)
 
-        print '''
+        print >> out, '''
     return {
         %s
         }
@@ -1,15 +1,70 @@
 #!/usr/bin/env python 
 
-import yaml, sys, getopt, itertools, string, re
+import yaml, sys, getopt, itertools, string, re, json, hashlib
 import validate_rapier
-from validate_rapier import PresortedOrderedDict
+import profiling
+from validate_rapier import PresortedOrderedDict, SpecError
+from cStringIO import StringIO
+from json.encoder import encode_basestring_ascii as encode_json_string
+try:
+    from yaml.cyaml import CEmitter
+except ImportError:
+    CEmitter = None
 import os
 import re
 
-class OASGenerator(object):
+class SpecResolver(object):
+    # Resolves the $refs and entity URLs of a validated spec. OASGenerator is one, and RelationshipIndex makes one for the
+    # generators that share it
+
+    def __init__(self, validator, included_entity_map):
+        self.validator = validator
+        self.rapier_spec = validator.rapier_spec
+        self.included_entity_map = included_entity_map
+
+    def resolve_ref_uri(self, ref_uri):
+        if ref_uri.startswith('#/'):
+            parts = ref_uri[2:].split('/')
+            spec = self.rapier_spec
+            for part in parts:
+                if part not in spec:
+                    raise SpecError('%s not in %s' % (ref_uri, self.validator.filename))
+                spec = spec[part]
+            return spec
+        else:
+            return self.resolve_included_entity(ref_uri)
+    
+    def resolve_included_entity(self, uri):
+        return self.included_entity_map[self.abs_url(uri)]
+
+    def resolve_included_entity_ref(self, ref):
+        return self.resolve_included_entity(ref['$ref'])
+
+    def resolve_included_entity_name(self, uri):
+        return self.resolve_included_entity(uri)['name']
+
+    def resolve_property(self, entity_uri, property_name):
+        entity = self.resolve_included_entity(entity_uri)
+        if not entity:
+            return None
+        if 'properties' in entity:
+            if property_name in entity['properties']:
+                return entity['properties'][property_name]
+        if 'allOf' in entity:
+            for entity_ref in entity['allOf']:
+                property = self.resolve_property(entity_ref['$ref'], property_name)
+                if property:
+                    return property
+
+    def abs_url(self, url):
+        split_url = url.split('#')
+        split_url[0] = os.path.abspath(os.path.join(self.validator.abs_filename, split_url[0]))
+        return '#'.join(split_url)
+
+class OASGenerator(SpecResolver):
 
     def __init__(self):
-        pass
+        self.fragment_cache = None # a FragmentCache, for generating from the same spec again and again
 
     def set_opts(self, opts):
         self.opts = opts
@@ -19,12 +74,29 @@ class OASGenerator(object):
         self.use_templates = not ('--suppress-templates' in self.opts_keys or '-t' in self.opts_keys)
 
     def openAPI_spec_from_rapier(self, filename):
-        self.validator = validate_rapier.OASValidator()
-        spec, errors = self.validator.validate(filename, None)
+        validator = validate_rapier.OASValidator()
+        with profiling.phase('validate'):
+            spec, errors = validator.validate(filename, None)
+        return self.openAPI_spec_from_validator(validator, spec, errors)
+
+    def openAPI_spec_from_validator(self, validator, spec, errors, relationship_index=None):
+        # the OpenAPI spec for a rapier spec that validator has validated, given the spec and error count that validate returned.
+        # relationship_index is the RelationshipIndex of the spec, if one was already made for another generator
+        openapispec = self.build_openAPI_spec(validator, spec, errors, relationship_index, True)
+        if self.fragment_recorder is not None and self.fragment_recorder.conflict:
+            # a fragment from the cache and a fragment generated again hold different parses of one node of the spec, where a
+            # full generation would share the node between them
+            openapispec = self.build_openAPI_spec(validator, spec, errors, relationship_index, False)
+        return openapispec
+
+    def build_openAPI_spec(self, validator, spec, errors, relationship_index, replay_fragments):
+        self.validator = validator
+        self.fragment_recorder = None
+        filename = validator.filename
         if errors > 0:
-            sys.exit('Validation of %s failed. OpenAPI spec generation not attempted' % filename)
+            raise SpecError('Validation of %s failed. OpenAPI spec generation not attempted' % filename)
         elif spec is None:
-            sys.exit('Empty spec: %s - no OpenAPI spec generated' % filename)        
+            raise SpecError('Empty spec: %s - no OpenAPI spec generated' % filename)        
         else:
             self.rapier_spec = spec
         self.conventions = spec.get('conventions',{})     
@@ -83,7 +155,9 @@ class OASGenerator(object):
         if 'entities' in spec:
             entities = spec['entities']
             self.interfaces = dict()
-            self.included_entity_map = self.validator.build_included_entity_map()
+            self.relationship_index = relationship_index if relationship_index is not None else RelationshipIndex(validator)
+            self.included_entity_map = self.relationship_index.included_entity_map
+            self.relationship_graph = RelationshipGraph(self, self.relationship_index)
             self.openapispec_uri_map = self.oas_definition_map(self.validator)
             self.openapispec['definitions'] = self.definitions
             self.referenced_entities = {entity['id'] for entity in entities.itervalues() if 'wellKnownURLs' in entity}
@@ -98,70 +172,100 @@ class OASGenerator(object):
                     self.error_response = self.global_definition_ref(self.abs_url('#ErrorResponse'))
             else:
                 self.error_response = {}
-            self.responses = self.build_standard_responses()
-            self.response_sets = self.build_standard_response_sets()
-            self.methods = self.build_standard_methods()
+            if self.fragment_cache is not None:
+                self.fragment_recorder = FragmentRecorder.for_generator(self, self.fragment_cache, replay_fragments)
+            self.patch_consumes = self.shared_object('patch_consumes', self.patch_consumes)
+            self.responses = self.shared_object('responses', self.build_standard_responses())
+            self.response_sets = self.shared_object('response_sets', self.build_standard_response_sets())
+            self.methods = self.shared_object('methods', self.build_standard_methods())
+            if self.fragment_recorder is not None:
+                self.fragment_recorder.track_state()
             for entity_uri, entity_spec in self.entities_and_dependencies_iteritems():
-                entity_name = entity_spec['name']
-                entity_uri = entity_spec['id']
-                entity_url_spec = EntityURLSpec(entity_uri, self)
-                interface = self.build_entity_interface(entity_url_spec)
-                self.interfaces[entity_uri] = interface
-                if entity_uri in self.referenced_entities:
-                    self.openapispec_interfaces[entity_url_spec.interface_id()] = interface
-                rel_property_specs = self.get_entity_relationship_property_specs(entity_uri, entity_spec)
-                for rel_property_spec in rel_property_specs:
-                    q_p = QueryPath(rel_property_spec.relationship_name, self)
-                    if rel_property_spec.is_collection_resource(): 
-                        interface = self.build_relationship_interface(entity_url_spec, q_p, rel_property_spec, rel_property_specs)
-                        self.openapispec_interfaces[rel_property_spec.interface_id()] = interface
-                        self.interfaces[rel_property_spec.interface_id()] = interface
-                    else:
-                        self.referenced_entities.update([spec.target_entity_uri for spec in rel_property_specs])        
+                self.generate_fragment('interfaces', entity_spec, self.build_entity_interfaces)
             for entity_uri, entity_spec in self.entities_and_dependencies_iteritems():
-                entity_name = entity_spec['name']
-                definition = self.to_openapispec(entity_spec)
-                self.definitions[entity_name] = definition
+                self.generate_fragment('definition', entity_spec, self.build_entity_definition)
             for entity_spec in entities.itervalues():
-                entity_uri = entity_spec['id']
-                if 'wellKnownURLs' in entity_spec:
-                    for well_known_URL in as_list(entity_spec['wellKnownURLs']):
-                        path = well_known_URL[:-1] if well_known_URL.endswith('/') and len(well_known_URL) > 1 else well_known_URL
-                        spec = WellKnownURLSpec(path, entity_uri, self)
-                        path_spec = spec.build_oas_path_spec()
-                        self.openapispec_paths[path] = path_spec
-                uri_templates = entity_spec.get('uriTemplates')
-                if uri_templates is not None:
-                    for uri_template in as_list(uri_templates):
-                        spec = URITemplateSpec(uri_template, entity_uri, self)
-                        spec.emit_openapi_path()
-                rel_property_specs = self.get_entity_relationship_property_specs(entity_uri, entity_spec)
-                if self.include_impl and 'permalinkTemplate' in entity_spec:
-                    implementation_spec = ImplementationPathSpec(entity_spec['permalinkTemplate'], entity_uri, self)
-                    entity_interface = implementation_spec.build_interface_reference()
-                    path_spec = implementation_spec.build_oas_path_spec()
-                    self.openapispec_paths[implementation_spec.path_segment()] = path_spec
-                if 'queryPaths' in entity_spec:
-                    query_paths = [QueryPath(query_path, self) for query_path in as_list(entity_spec['queryPaths'])]
-                    for rel_property_spec in rel_property_specs:
-                        rel_property_spec_stack = [rel_property_spec]
-                        if self.include_impl and 'permalinkTemplate' in entity_spec:
-                            implementation_spec = ImplementationPathSpec(entity_spec['permalinkTemplate'], entity_uri, self)
-                            self.add_query_paths(query_paths[:], implementation_spec, rel_property_spec_stack, rel_property_specs)
-                        if 'wellKnownURLs' in entity_spec:
-                            qps = query_paths[:]
-                            well_known_URLs = as_list(entity_spec['wellKnownURLs'])
-                            for well_known_URL in well_known_URLs:
-                                baseURL_spec = WellKnownURLSpec(well_known_URL, entity_uri, self)
-                                self.add_query_paths(qps, baseURL_spec, rel_property_spec_stack, rel_property_specs)
-                        entity_url_property_spec = EntityURLSpec(entity_uri, self)
-                        self.add_query_paths(query_paths, entity_url_property_spec, rel_property_spec_stack, rel_property_specs)
-                    if len(query_paths) > 0:
-                        sys.exit('query paths not valid or listed more than once: %s' % [query_path.openapispec_path_string for query_path in query_paths] )  
+                self.generate_fragment('paths', entity_spec, self.build_entity_paths)
+            if self.fragment_recorder is not None:
+                self.fragment_recorder.untrack_state()
         if not self.openapispec_interfaces:
             del self.openapispec['x-interfaces']
         return self.openapispec
 
+    def generate_fragment(self, kind, entity_spec, build):
+        # build the fragment of kind - 'interfaces', 'definition' or 'paths' - for entity_spec, or add it again from the FragmentCache
+        if self.fragment_recorder is None:
+            build(entity_spec)
+        else:
+            self.fragment_recorder.generate(kind, entity_spec, build)
+
+    def shared_object(self, name, value):
+        # value, or the object that the fragments in the FragmentCache share in its place, like the standard responses they merge
+        return value if self.fragment_recorder is None else self.fragment_recorder.shared(name, value)
+
+    def build_entity_interfaces(self, entity_spec):
+        entity_name = entity_spec['name']
+        entity_uri = entity_spec['id']
+        entity_url_spec = EntityURLSpec(entity_uri, self)
+        with profiling.phase('build interfaces'):
+            interface = self.build_entity_interface(entity_url_spec)
+        self.interfaces[entity_uri] = interface
+        if entity_uri in self.referenced_entities:
+            self.openapispec_interfaces[entity_url_spec.interface_id()] = interface
+        rel_property_specs = self.get_entity_relationship_property_specs(entity_uri, entity_spec)
+        for rel_property_spec in rel_property_specs:
+            q_p = QueryPath(rel_property_spec.relationship_name, self)
+            if rel_property_spec.is_collection_resource(): 
+                with profiling.phase('build interfaces'):
+                    interface = self.build_relationship_interface(entity_url_spec, q_p, rel_property_spec, rel_property_specs)
+                self.openapispec_interfaces[rel_property_spec.interface_id()] = interface
+                self.interfaces[rel_property_spec.interface_id()] = interface
+            else:
+                self.referenced_entities.update([spec.target_entity_uri for spec in rel_property_specs])        
+
+    def build_entity_definition(self, entity_spec):
+        entity_name = entity_spec['name']
+        with profiling.phase('build definitions'):
+            definition = self.to_openapispec(entity_spec)
+        self.definitions[entity_name] = definition
+
+    def build_entity_paths(self, entity_spec):
+        entity_uri = entity_spec['id']
+        if 'wellKnownURLs' in entity_spec:
+            for well_known_URL in as_list(entity_spec['wellKnownURLs']):
+                path = well_known_URL[:-1] if well_known_URL.endswith('/') and len(well_known_URL) > 1 else well_known_URL
+                spec = WellKnownURLSpec(path, entity_uri, self)
+                path_spec = spec.build_oas_path_spec()
+                self.openapispec_paths[path] = path_spec
+        uri_templates = entity_spec.get('uriTemplates')
+        if uri_templates is not None:
+            for uri_template in as_list(uri_templates):
+                spec = URITemplateSpec(uri_template, entity_uri, self)
+                spec.emit_openapi_path()
+        rel_property_specs = self.get_entity_relationship_property_specs(entity_uri, entity_spec)
+        if self.include_impl and 'permalinkTemplate' in entity_spec:
+            implementation_spec = ImplementationPathSpec(entity_spec['permalinkTemplate'], entity_uri, self)
+            entity_interface = implementation_spec.build_interface_reference()
+            path_spec = implementation_spec.build_oas_path_spec()
+            self.openapispec_paths[implementation_spec.path_segment()] = path_spec
+        if 'queryPaths' in entity_spec:
+            query_paths = [QueryPath(query_path, self) for query_path in as_list(entity_spec['queryPaths'])]
+            for rel_property_spec in rel_property_specs:
+                rel_property_spec_stack = [rel_property_spec]
+                if self.include_impl and 'permalinkTemplate' in entity_spec:
+                    implementation_spec = ImplementationPathSpec(entity_spec['permalinkTemplate'], entity_uri, self)
+                    self.add_query_paths(query_paths[:], implementation_spec, rel_property_spec_stack, rel_property_specs)
+                if 'wellKnownURLs' in entity_spec:
+                    qps = query_paths[:]
+                    well_known_URLs = as_list(entity_spec['wellKnownURLs'])
+                    for well_known_URL in well_known_URLs:
+                        baseURL_spec = WellKnownURLSpec(well_known_URL, entity_uri, self)
+                        self.add_query_paths(qps, baseURL_spec, rel_property_spec_stack, rel_property_specs)
+                entity_url_property_spec = EntityURLSpec(entity_uri, self)
+                self.add_query_paths(query_paths, entity_url_property_spec, rel_property_spec_stack, rel_property_specs)
+            if len(query_paths) > 0:
+                raise SpecError('query paths not valid or listed more than once: %s' % [query_path.openapispec_path_string for query_path in query_paths] )  
+
     def entities_and_dependencies_iteritems(self):
         for entity_item in self.rapier_spec.get('entities', {}).iteritems():
             yield entity_item
@@ -169,61 +273,55 @@ class OASGenerator(object):
             yield entity_item
 
     def get_one_relationship_property_specs(self, prop_name, property, entity_uri, entity_spec):
-        result = []
-        relationship = as_relationship(prop_name, property['relationship'])
-        upper_multiplicity = relationship.get('multiplicity', '0:1').split(':')[-1]
-        multi_valued = upper_multiplicity == 'n' or (upper_multiplicity.isdigit() and int(upper_multiplicity) > 1)
-        for target_entity_uri in as_list(relationship['entities']):
-            p_spec = (RelMVPropertySpec if multi_valued else RelSVPropertySpec)(self, entity_uri, entity_spec, property, relationship, target_entity_uri)
-            result.append(p_spec)
-        return result
+        return self.relationship_graph.property_edges(prop_name, property, entity_uri, entity_spec)
 
     def get_entity_relationship_property_specs(self, entity_uri, entity_spec):
-        spec = self.rapier_spec
-        result = []
-        def add_properties(spec):
-            if hasattr(spec, 'keys'):
-                if '$ref' in spec:
-                    add_properties(self.resolve_ref_uri(spec['$ref']))
-                elif 'properties' in spec:
-                    for prop_name, property in spec['properties'].iteritems():
-                        if 'relationship' in property:
-                            result.extend(self.get_one_relationship_property_specs(prop_name, property, entity_uri, entity_spec))
-                        else:
-                            add_properties(property)
-                elif 'type' in spec and spec['type'] == 'array':
-                    add_properties(spec['items'])
-                if 'oneOf' in spec:
-                    for o_spec in spec['oneOf']:
-                        add_properties(o_spec)
-                if 'allOf' in spec:
-                    for o_spec in spec['allOf']:
-                        add_properties(o_spec)
-
-        add_properties(entity_spec)
-        return result
+        return self.relationship_graph.edges(entity_uri, entity_spec)
         
     def add_query_paths(self, query_paths, prefix, rel_property_spec_stack, prev_rel_property_specs):
-        rapier_spec = self.rapier_spec
+        # emit each of query_paths whose segments follow the relationships of rel_property_spec_stack and the relationships reachable
+        # from them, removing it from query_paths. The relationships are followed depth first, and only while the relationships
+        # followed so far are the start of a query path not yet emitted - the trie of query_paths tells which those are. A relationship
+        # already on the stack is not followed again, and no path is followed further than the longest query path, so relationships
+        # that lead back to where they started do not matter
+        trie_path = [QueryPathTrie(query_paths)]
+        for rel_property_spec in rel_property_spec_stack:
+            node = trie_path[-1].children.get(rel_property_spec.relationship_name)
+            if node is None or node.count == 0:
+                return
+            trie_path.append(node)
+        with profiling.phase('enumerate query paths'):
+            self.add_trie_query_paths(query_paths, prefix, rel_property_spec_stack, prev_rel_property_specs, trie_path)
+
+    def add_trie_query_paths(self, query_paths, prefix, rel_property_spec_stack, prev_rel_property_specs, trie_path):
+        # trie_path holds the trie node for each relationship of rel_property_spec_stack, after the root
         rel_property_spec = rel_property_spec_stack[-1]
         target_entity_uri = rel_property_spec.target_entity_uri
         target_entity_spec = self.validator.resolve_referenced_entity(target_entity_uri)
+        profiling.count('relationship paths enumerated')
         if target_entity_spec: # if it is external, it may not be found
+            node = trie_path[-1]
             rel_property_specs = self.get_entity_relationship_property_specs(target_entity_uri, target_entity_spec)
-            for query_path in query_paths[:]:
+            for query_path in node.query_paths[:]:
                 if query_path.matches(rel_property_spec_stack):
                     self.emit_query_path(prefix, query_path, rel_property_spec_stack, prev_rel_property_specs)
                     query_paths.remove(query_path)
+                    node.query_paths.remove(query_path)
+                    for trie_node in trie_path:
+                        trie_node.count -= 1
             for rel_spec in rel_property_specs:
-                if rel_spec not in rel_property_spec_stack:
+                child = node.children.get(rel_spec.relationship_name)
+                if child is not None and child.count > 0 and rel_spec not in rel_property_spec_stack:
                     rel_property_spec_stack.append(rel_spec)
-                    self.add_query_paths(query_paths, prefix, rel_property_spec_stack, rel_property_specs)
+                    trie_path.append(child)
+                    self.add_trie_query_paths(query_paths, prefix, rel_property_spec_stack, rel_property_specs, trie_path)
+                    trie_path.pop()
                     rel_property_spec_stack.pop()
                 
     def emit_query_path(self, prefix, query_path, rel_property_spec_stack, rel_property_specs):
         for inx, spec in enumerate(rel_property_spec_stack):
             if spec.is_multivalued() and not query_path.query_segments[inx].selects_single_value() and not inx == len(rel_property_spec_stack) - 1:
-                sys.exit('query path has multi-valued segment with no parameter: %s' % query_path)
+                raise SpecError('query path has multi-valued segment with no parameter: %s' % query_path)
         rel_spec = rel_property_spec_stack[-1]
         is_collection_resource = rel_spec.is_collection_resource() and not query_path.query_segments[-1].selects_single_value()
         interface_id = rel_spec.interface_id() if is_collection_resource else rel_spec.target_entity_uri
@@ -234,8 +332,10 @@ class OASGenerator(object):
             # 2. prefix is an EntityURLSpec. We need to create an OAS template
             # . prefix is a WellKnownURLSpec. We need to create an OAS path (which may or may not reference a template)
             prefix.emit_openapi_element(query_path, rel_spec)
+            profiling.count('query paths emitted')
 
     def build_entity_interface(self, entity_url_spec):
+        profiling.count('interfaces built')
         entity_uri = entity_url_spec.entity_uri
         entity_spec = self.validator.resolve_included_entity(entity_uri)
         parameters = entity_url_spec.build_parameters()
@@ -247,7 +347,7 @@ class OASGenerator(object):
             response_200 = {
                 'schema': self.global_definition_ref(entity_uri)
                 }
-            if not self.yaml_merge or propduces and len(produces) > 1:
+            if not self.yaml_merge or produces and len(produces) > 1:
                 response_200.update(self.build_standard_200(produces or self.openapispec.get('produces')))
             else:
                 response_200['<<'] = self.responses.get('standard_200')
@@ -374,6 +474,7 @@ class OASGenerator(object):
         return interface
 
     def build_relationship_interface(self, entity_url_spec, query_path, rel_property_spec, rel_property_specs):
+        profiling.count('interfaces built')
         parameters = entity_url_spec.build_parameters(query_path) 
         relationship_name = rel_property_spec.relationship_name
         entity_uri = rel_property_spec.target_entity_uri
@@ -524,7 +625,7 @@ class OASGenerator(object):
 
     def build_standard_response_sets(self):
         result = dict()
-        result['entity_get_responses'] = self.build_entity_get_responses
+        result['entity_get_responses'] = self.build_entity_get_responses()
         result['put_patch_responses'] = self.build_put_patch_responses()
         result['delete_responses'] = self.build_delete_responses()
         result['post_responses'] = self.build_post_responses()
@@ -585,8 +686,7 @@ class OASGenerator(object):
                     else:
                         filename_parts.append('oas')
                     return {'$ref': '%s#/definitions/%s' % ('.'.join(filename_parts), entityname)}
-            print 'internal error - failed to resolve reference %s' % key
-            sys.exit(-1)
+            raise SpecError('internal error - failed to resolve reference %s' % key)
         
     def build_standard_200(self, produces=None):
         rslt = {
@@ -687,10 +787,10 @@ class OASGenerator(object):
     def build_collection_get(self, rel_property_spec, produces):
         collection_entity_uri = rel_property_spec.collection_resource
         if not collection_entity_uri:
-            sys.exit('must provide collection_resource for property %s in entity %s in spec %s' % (rel_property_spec.relationship_name, rel_property_spec.source_entity_name(), self.validator.filename))
+            raise SpecError('must provide collection_resource for property %s in entity %s in spec %s' % (rel_property_spec.relationship_name, rel_property_spec.source_entity_name(), self.validator.filename))
         collection_entity = self.validator.resolve_included_entity(collection_entity_uri)
         if collection_entity is None:
-            sys.exit('error: must define entity %s' % collection_entity_uri)   
+            raise SpecError('error: must define entity %s' % collection_entity_uri)   
         rslt = {
             'responses': {
                 '200': {
@@ -789,40 +889,6 @@ class OASGenerator(object):
                 }
         return rslt
                 
-    def resolve_ref_uri(self, ref_uri):
-        if ref_uri.startswith('#/'):
-            parts = ref_uri[2:].split('/')
-            spec = self.rapier_spec
-            for part in parts:
-                if part not in spec:
-                    sys.exit('%s not in %s' % (ref_uri, self.filename))
-                spec = spec[part]
-            return spec
-        else:
-            return self.resolve_included_entity(ref_uri)
-    
-    def resolve_included_entity(self, uri):
-        return self.included_entity_map[self.abs_url(uri)]
-
-    def resolve_included_entity_ref(self, ref):
-        return self.resolve_included_entity(ref['$ref'])
-
-    def resolve_included_entity_name(self, uri):
-        return self.resolve_included_entity(uri)['name']
-
-    def resolve_property(self, entity_uri, property_name):
-        entity = self.resolve_included_entity(entity_uri)
-        if not entity:
-            return None
-        if 'properties' in entity:
-            if property_name in entity['properties']:
-                return entity['properties'][property_name]
-        if 'allOf' in entity:
-            for entity_ref in entity['allOf']:
-                property = self.resolve_property(entity_ref['$ref'], property_name)
-                if property:
-                    return property
-
     def to_openapispec(self, node, entity_spec=None, property_name=None):
         if hasattr(node, 'keys'):
             result = PresortedOrderedDict()
@@ -867,19 +933,415 @@ class OASGenerator(object):
         else:
             return node
         
-    def abs_url(self, url):
-        split_url = url.split('#')
-        split_url[0] = os.path.abspath(os.path.join(self.validator.abs_filename, split_url[0]))
-        return '#'.join(split_url)
-     
     def oas_definition_map(self, validator):
-        entities = validator.rapier_spec.get('entities', {})
-        result = {'%s#/entities/%s' % (validator.abs_filename, name): '#/definitions/%s' % name for name in entities.iterkeys()}
-        result.update({entity['id']: '#/definitions/%s' % name for name, entity in entities.iteritems()})
-        for nested_validator in validator.included_spec_validators.itervalues():
-            result.update(self.oas_definition_map(nested_validator))
+        # the validators are visited in one pass, depth first, so an included spec's definitions replace those of the specs before it
+        result = {}
+        for included_validator in validator.included_validators():
+            entities = included_validator.rapier_spec.get('entities', {})
+            for name in entities.iterkeys():
+                result['%s#/entities/%s' % (included_validator.abs_filename, name)] = '#/definitions/%s' % name
+            for name, entity in entities.iteritems():
+                result[entity['id']] = '#/definitions/%s' % name
         return result
             
+class RelationshipIndex(object):
+    # The relationship properties of the entities of a validated spec, in their properties, oneOf, allOf and $refs. The properties
+    # of an entity are walked the first time they are asked for and then kept. Nothing in the index depends on the options of a
+    # generator, so the generators of one validated spec - OpenAPI with and without --include-impl, HTML - can share an index, each
+    # making its own RelationshipGraph from it. The lists in the index are shared, and must not be changed
+
+    def __init__(self, validator):
+        self.resolver = SpecResolver(validator, validator.build_included_entity_map())
+        self.included_entity_map = self.resolver.included_entity_map
+        self.entity_properties = dict() # id of entity spec -> (entity spec, [(property name, relationship property)])
+        self.property_relationships = dict() # (property name, id of property) -> (property, relationship, multi-valued)
+
+    def relationship_properties(self, entity_spec):
+        entry = self.entity_properties.get(id(entity_spec))
+        if entry is None:
+            # the entity spec is kept in the entry so that its id is not reused while the entry exists
+            entry = self.entity_properties[id(entity_spec)] = (entity_spec, self.find_relationship_properties(entity_spec))
+        return entry[1]
+
+    def relationship(self, prop_name, property):
+        # the relationship of a relationship property, as a dict, and whether it is multi-valued
+        key = (prop_name, id(property))
+        entry = self.property_relationships.get(key)
+        if entry is None:
+            relationship = as_relationship(prop_name, property['relationship'])
+            upper_multiplicity = relationship.get('multiplicity', '0:1').split(':')[-1]
+            multi_valued = upper_multiplicity == 'n' or (upper_multiplicity.isdigit() and int(upper_multiplicity) > 1)
+            entry = self.property_relationships[key] = (property, relationship, multi_valued)
+        return entry[1], entry[2]
+
+    def find_relationship_properties(self, entity_spec):
+        result = []
+        def add_properties(spec):
+            if hasattr(spec, 'keys'):
+                if '$ref' in spec:
+                    add_properties(self.resolver.resolve_ref_uri(spec['$ref']))
+                elif 'properties' in spec:
+                    for prop_name, property in spec['properties'].iteritems():
+                        if 'relationship' in property:
+                            result.append((prop_name, property))
+                        else:
+                            add_properties(property)
+                elif 'type' in spec and spec['type'] == 'array':
+                    add_properties(spec['items'])
+                if 'oneOf' in spec:
+                    for o_spec in spec['oneOf']:
+                        add_properties(o_spec)
+                if 'allOf' in spec:
+                    for o_spec in spec['allOf']:
+                        add_properties(o_spec)
+
+        add_properties(entity_spec)
+        return result
+
+class RelationshipGraph(object):
+    # The relationships between the entities of a spec, for one generator. The edges of an entity are a RelSVPropertySpec or
+    # RelMVPropertySpec for each target entity of each relationship property that the RelationshipIndex finds for it. Each spec holds
+    # its multiplicity and target entity. The edges of an entity, and of a relationship property, are made the first time they are
+    # asked for and then kept, however many query paths go through them. The lists of edges are shared, and must not be changed
+
+    def __init__(self, generator, index):
+        self.generator = generator
+        self.index = index
+        self.entity_edges = dict() # (entity uri, id of entity spec) -> (entity spec, edges)
+        self.relationship_edges = dict() # (property name, id of property, entity uri, id of entity spec) -> (property, entity spec, edges)
+
+    def edges(self, entity_uri, entity_spec):
+        key = (entity_uri, id(entity_spec))
+        entry = self.entity_edges.get(key)
+        if entry is None:
+            # the entity spec is kept in the entry so that its id is not reused while the entry exists
+            edges = [edge for prop_name, property in self.index.relationship_properties(entity_spec)
+                     for edge in self.property_edges(prop_name, property, entity_uri, entity_spec)]
+            entry = self.entity_edges[key] = (entity_spec, edges)
+        return entry[1]
+
+    def targets(self, entity_uri, entity_spec):
+        return [edge.target_entity_uri for edge in self.edges(entity_uri, entity_spec)]
+
+    def property_edges(self, prop_name, property, entity_uri, entity_spec):
+        key = (prop_name, id(property), entity_uri, id(entity_spec))
+        entry = self.relationship_edges.get(key)
+        if entry is None:
+            relationship, multi_valued = self.index.relationship(prop_name, property)
+            spec_class = RelMVPropertySpec if multi_valued else RelSVPropertySpec
+            edges = [spec_class(self.generator, entity_uri, entity_spec, property, relationship, target_entity_uri)
+                     for target_entity_uri in as_list(relationship['entities'])]
+            entry = self.relationship_edges[key] = (property, entity_spec, edges)
+        return entry[2]
+
+def relationship_graph_for(validator, relationship_index=None):
+    # the RelationshipGraph of a validated spec, for generators other than OASGenerator, like gen_html. The specs of its edges
+    # hold their relationship, multiplicity and target entity, but cannot build OpenAPI interfaces. gen_py_sdk and gen_js_sdk do
+    # not use it: the classes they generate have the properties of each entity, but nothing of its relationships
+    index = relationship_index if relationship_index is not None else RelationshipIndex(validator)
+    return RelationshipGraph(index.resolver, index)
+
+class FragmentCache(object):
+    # The fragments of the OpenAPI specs generated from a spec, kept from one generation to the next, for programs that generate
+    # from the same spec again and again as it is edited, like watch_rapier. A fragment is what generating one entity adds to the
+    # OpenAPI spec - its interfaces, its definition or its paths. While an OASGenerator has a FragmentCache, the fragment of an
+    # entity is added again from the cache, rather than generated again, if the content of the entity - and, for its interfaces
+    # and paths, the content of every entity it refers to, directly or indirectly - is what it was when the fragment was
+    # generated, and everything the fragment looked up in the OpenAPI spec built before it is still the same. The result is the
+    # OpenAPI spec that generating every fragment again would give. Generations with different options are kept apart, and a
+    # change to anything in the spec other than the content of its entities starts the generations with those options afresh.
+    # The OpenAPI specs generated with a FragmentCache share objects with one another, so they must not be changed. A
+    # FragmentCache is not safe to use from several threads
+
+    def __init__(self):
+        self.generations = dict() # (yaml_merge, include_impl, use_templates) -> CachedGeneration
+
+class CachedGeneration(object):
+    # the fragments of the OpenAPI specs generated with one set of options
+
+    def __init__(self, context_digest):
+        self.context_digest = context_digest # digest of everything in the spec but the content of its entities
+        self.shared_objects = dict() # name -> an object that the fragments share, like the standard responses they merge
+        self.fragments = dict() # (kind, entity id, occurrence) -> Fragment
+
+class Fragment(object):
+
+    def __init__(self, digest, ops, model_nodes):
+        self.digest = digest # the digest of the entities the fragment was generated from
+        self.ops = ops # (op, state name, key, value) for each lookup and store in the tracked state while generating the fragment
+        self.model_nodes = model_nodes # (path, node) for each node of the rapier spec that the fragment holds
+
+MISSING = object()
+
+class FragmentRecorder(object):
+    # Generates the fragments of one generation with a FragmentCache. Each part of the generator's state that the fragments of
+    # different entities share - the interfaces, paths, templates, definitions and so on - is tracked while the fragments are
+    # generated, so that what a fragment looks up and stores there can be recorded, checked and stored again. A node of the
+    # rapier spec that a fragment holds, like an enum, is the node of the parse the fragment was generated from. Where a full
+    # generation would put one node in two fragments, and the cache has them from different parses, conflict is set, and the
+    # OASGenerator generates every fragment again
+
+    TRACKED_STATE = (('interfaces', None), ('openapispec_interfaces', 'x-interfaces'), ('openapispec_templates', 'x-templates'),
+                     ('openapispec_paths', 'paths'), ('definitions', 'definitions'), ('header_parameters', 'parameters'),
+                     (None, 'responses'), ('referenced_entities', None))
+
+    @classmethod
+    def for_generator(cls, generator, cache, replay_fragments=True):
+        # the recorder for generator, or None if the spec cannot be generated with a FragmentCache - the nodes of a spec whose
+        # entities share nodes, through YAML anchors and aliases, do not each have one path
+        recorder = cls(generator, cache, replay_fragments)
+        return None if recorder.shared_nodes else recorder
+
+    def __init__(self, generator, cache, replay_fragments=True):
+        self.generator = generator
+        self.replay_fragments = replay_fragments
+        self.ops = None # the ops of the fragment being generated, or None
+        self.tracked = dict() # state name -> the tracked state
+        self.node_paths = dict() # id of a dict or list in the spec -> (abs filename or entity id, key, ...)
+        self.shared_nodes = False
+        self.entity_digests = dict() # entity id -> digest of the content of the entity
+        self.entity_references = dict() # entity id -> the ids of the entities it refers to
+        self.closure_digests = dict() # entity id -> digest of the entity and the entities it refers to, directly or indirectly
+        self.occurrences = dict() # (kind, entity id) -> the number of fragments of kind generated for the entity so far
+        self.placed_nodes = dict() # path -> the node at path that a fragment of this generation holds
+        self.conflict = False
+        context_digest = self.digest_spec()
+        options = (generator.yaml_merge, generator.include_impl, generator.use_templates)
+        generation = cache.generations.get(options)
+        if generation is None or generation.context_digest != context_digest:
+            generation = cache.generations[options] = CachedGeneration(context_digest)
+        self.generation = generation
+
+    def shared(self, name, value):
+        return self.generation.shared_objects.setdefault(name, value)
+
+    def spec_validators(self):
+        # the validators of the spec, the specs it includes and the specs they reference
+        result = []
+        for validator in self.generator.validator.included_validators():
+            for spec_validator in itertools.chain([validator], validator.referenced_spec_validators.itervalues()):
+                if all(spec_validator is not other for other in result):
+                    result.append(spec_validator)
+        return result
+
+    def digest_spec(self):
+        # digest the content of each entity, and return a digest of the rest
+        parts = [repr((self.generator.validator.abs_filename, sorted(self.generator.openapispec_uri_map.iteritems())))]
+        entity_names = dict() # entity name -> ids of the entities with that name
+        entities = []
+        for validator in self.spec_validators():
+            parts.append(repr(validator.abs_filename))
+            for key, value in (validator.rapier_spec or {}).iteritems():
+                if key == 'entities':
+                    for name, entity_spec in value.iteritems():
+                        parts.append(repr((name, entity_spec['id'])))
+                        entity_names.setdefault(entity_spec['name'], []).append(entity_spec['id'])
+                        entities.append(entity_spec)
+                elif isinstance(value, (dict, list)):
+                    parts.append(repr(key))
+                    self.digest_node(value, (validator.abs_filename, key), parts, set())
+                else:
+                    parts.append(repr((key, value)))
+        for entity_spec in entities:
+            entity_id = entity_spec['id']
+            if entity_id not in self.entity_digests:
+                entity_parts = []
+                references = set()
+                self.digest_node(entity_spec, (entity_id,), entity_parts, references)
+                self.entity_digests[entity_id] = digest(entity_parts)
+                self.entity_references[entity_id] = [other_id for name in references for other_id in entity_names.get(name, ())]
+        return digest(parts)
+
+    def digest_node(self, node, path, parts, references):
+        # add the content of node, a dict or list of the spec, to parts, and the names of the entities it may refer to to references
+        if id(node) in self.node_paths:
+            self.shared_nodes = True
+            return
+        self.node_paths[id(node)] = path
+        if isinstance(node, dict):
+            parts.append('{')
+            items = ((key, value) for key, value in node.iteritems() if key != 'resolved_node') # the validator adds resolved_node to a $ref
+        else:
+            parts.append('[')
+            items = enumerate(node)
+        for key, value in items:
+            parts.append(repr(key))
+            if isinstance(value, (dict, list)):
+                self.digest_node(value, path + (key,), parts, references)
+            else:
+                parts.append(repr(value))
+                if isinstance(value, basestring) and '#' in value:
+                    references.update(value.split('#')[-1].split('/'))
+        parts.append('}' if isinstance(node, dict) else ']')
+
+    def closure_digest(self, entity_id):
+        result = self.closure_digests.get(entity_id)
+        if result is None:
+            closure = set()
+            stack = [entity_id]
+            while stack:
+                other_id = stack.pop()
+                if other_id not in closure:
+                    closure.add(other_id)
+                    stack.extend(self.entity_references.get(other_id, ()))
+            result = self.closure_digests[entity_id] = \
+                digest(sorted(repr((other_id, self.entity_digests.get(other_id))) for other_id in closure))
+        return result
+
+    def track_state(self):
+        generator = self.generator
+        for name, key in self.__class__.TRACKED_STATE:
+            state = getattr(generator, name, None) if name is not None else generator.openapispec[key]
+            if state is not None:
+                tracked = tracked_state_class(state)(self, name or key)
+                tracked.update(state)
+                self.tracked[name or key] = tracked
+                if name is not None:
+                    setattr(generator, name, tracked)
+                if key is not None:
+                    generator.openapispec[key] = tracked
+
+    def untrack_state(self):
+        generator = self.generator
+        for name, key in self.__class__.TRACKED_STATE:
+            tracked = self.tracked.get(name or key)
+            if tracked is not None:
+                state = tracked.untracked()
+                if name is not None:
+                    setattr(generator, name, state)
+                if key is not None:
+                    generator.openapispec[key] = state
+
+    def record(self, op, name, key, value):
+        self.ops.append((op, name, key, value))
+
+    def generate(self, kind, entity_spec, build):
+        entity_id = entity_spec['id']
+        if entity_id not in self.entity_digests:
+            build(entity_spec)
+            return
+        occurrence = self.occurrences[kind, entity_id] = self.occurrences.get((kind, entity_id), 0) + 1
+        key = (kind, entity_id, occurrence)
+        # the definition of an entity is built from the entity alone
+        entity_digest = self.entity_digests.get(entity_id) if kind == 'definition' else self.closure_digest(entity_id)
+        fragment = self.generation.fragments.get(key)
+        if self.replay_fragments and fragment is not None and fragment.digest == entity_digest and self.replay(fragment):
+            profiling.count('fragments reused')
+        else:
+            self.ops = []
+            try:
+                build(entity_spec)
+                ops = self.ops
+            finally:
+                self.ops = None
+            fragment = self.generation.fragments[key] = Fragment(entity_digest, ops, self.model_nodes(ops))
+            profiling.count('fragments generated')
+        for path, node in fragment.model_nodes:
+            if self.placed_nodes.setdefault(path, node) is not node:
+                self.conflict = True
+
+    def replay(self, fragment):
+        # store what fragment stored, if what it looked up is still the same
+        stored = dict() # (state name, key) -> what fragment stored
+        for op, name, key, value in fragment.ops:
+            if op == 'set' or op == 'add':
+                stored[name, key] = value
+            elif op == 'in':
+                if ((name, key) in stored or key in self.tracked[name]) != value:
+                    return False
+            elif op == 'get':
+                if (stored[name, key] if (name, key) in stored else self.tracked[name].get(key, MISSING)) is not value:
+                    return False
+        for op, name, key, value in fragment.ops:
+            if op == 'set':
+                self.tracked[name][key] = value
+            elif op == 'add':
+                self.tracked[name].add(key)
+        return True
+
+    def model_nodes(self, ops):
+        # the nodes of the spec in what ops stored, except in what was looked up, which belongs to the fragments that stored it
+        node_paths = self.node_paths
+        stored = [value for op, name, key, value in ops if op == 'set']
+        looked_up = {id(value) for op, name, key, value in ops if op == 'get'} - {id(value) for value in stored}
+        result = []
+        visited = set()
+        while stored:
+            node = stored.pop()
+            if isinstance(node, (dict, list)) and id(node) not in visited and id(node) not in looked_up:
+                visited.add(id(node))
+                path = node_paths.get(id(node))
+                if path is not None:
+                    result.append((path, node))
+                stored.extend(node.itervalues() if isinstance(node, dict) else node)
+        return result
+
+class TrackedMapping(object):
+    # a dict of the generator's state that records what is looked up and stored in it while a fragment is generated
+
+    def __init__(self, recorder, name):
+        super(TrackedMapping, self).__init__()
+        self.recorder = recorder
+        self.name = name
+
+    def __contains__(self, key):
+        result = super(TrackedMapping, self).__contains__(key)
+        if self.recorder.ops is not None:
+            self.recorder.record('in', self.name, key, result)
+        return result
+
+    def __getitem__(self, key):
+        value = super(TrackedMapping, self).__getitem__(key)
+        if self.recorder.ops is not None:
+            self.recorder.record('get', self.name, key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        super(TrackedMapping, self).__setitem__(key, value)
+        if self.recorder.ops is not None:
+            self.recorder.record('set', self.name, key, value)
+
+class TrackedDict(TrackedMapping, dict):
+
+    def untracked(self):
+        return dict(self)
+
+class TrackedPresortedOrderedDict(TrackedMapping, PresortedOrderedDict):
+
+    def untracked(self):
+        return PresortedOrderedDict(self.iteritems())
+
+class TrackedSet(set):
+
+    def __init__(self, recorder, name):
+        super(TrackedSet, self).__init__()
+        self.recorder = recorder
+        self.name = name
+
+    def __contains__(self, key):
+        result = super(TrackedSet, self).__contains__(key)
+        if self.recorder.ops is not None:
+            self.recorder.record('in', self.name, key, result)
+        return result
+
+    def add(self, key):
+        super(TrackedSet, self).add(key)
+        if self.recorder.ops is not None:
+            self.recorder.record('add', self.name, key, None)
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def untracked(self):
+        return set(self)
+
+def tracked_state_class(state):
+    return TrackedPresortedOrderedDict if isinstance(state, PresortedOrderedDict) else TrackedDict if isinstance(state, dict) else TrackedSet
+
+def digest(parts):
+    return hashlib.sha1('\n'.join(parts)).hexdigest()
+
 class SegmentSpec(object):
             
     def __init__(self, generator, entity_uri, entity_spec, property, relationship, target_entity_uri):
@@ -892,6 +1354,7 @@ class SegmentSpec(object):
 
         self.readOnly = relationship.get('readOnly')                                 
         self.relationship_name = relationship['name']        
+        self.multiplicity = relationship.get('multiplicity', '0:1')
         self.implementation_private = property.get('implementation_private', False)    
 
     def __eq__(self, other):
@@ -1239,10 +1702,10 @@ class ImplementationPathSpec(PathPrefix):
         try:
             parsed_format = list(formatter.parse(template))
         except Exception as e:
-            sys.exit('error parsing permalinkTemplate template: %s e:' % (template, e))
+            raise SpecError('error parsing permalinkTemplate template: %s e: %s' % (template, e))
         leading_parts = [part for part in parsed_format if part[1] is not None]
         if len(leading_parts) != 1:
-            sys.exit('permalinkTemplate template %s must include exactly one {name} element after ;' % query_path_segment_string)
+            raise SpecError('permalinkTemplate template %s must include exactly one {name} element after ;' % query_path_segment_string)
         else:
             part = leading_parts[0]
         if part[1] == '':
@@ -1311,6 +1774,28 @@ class EntityURLSpec(PathPrefix):
         if self.generator.use_templates:
             self.emit_openapi_template(query_path, rel_spec)
  
+class QueryPathTrie(object):
+    # query paths arranged by the relationship names of their segments. Each node has the query paths whose segments end there, in
+    # the order they were given, and the number of them not yet emitted at or below it
+
+    def __init__(self, query_paths=()):
+        self.children = dict() # relationship name -> QueryPathTrie
+        self.query_paths = []
+        self.count = 0
+        for query_path in query_paths:
+            self.add(query_path)
+
+    def add(self, query_path):
+        node = self
+        node.count += 1
+        for query_segment in query_path.query_segments:
+            child = node.children.get(query_segment.relationship)
+            if child is None:
+                child = node.children[query_segment.relationship] = QueryPathTrie()
+            node = child
+            node.count += 1
+        node.query_paths.append(query_path)
+
 class QueryPath(object):
 
     def __init__(self, query_path, generator):
@@ -1385,12 +1870,12 @@ class QuerySegment(object):
                         'openapispec_param': parsed_format_part[1]
                         } for parsed_format_part in parsed_format if parsed_format_part[1] is not None] 
                     if len(self.selectors) == 0:
-                        sys.exit('query segment %s must include {} element after ;' % query_segment)
+                        raise SpecError('query segment %s must include {} element after ;' % query_segment)
                     selector_template = ''.join([part[0] if part[1] is None else part[0] + '{%s}'%inx for inx, part in enumerate(parsed_format)])
                 except ValueError as e:
-                    sys.exit('error parsing query path segment: %s' % e)
+                    raise SpecError('error parsing query path segment: %s' % e)
             else:
-                sys.exit('query path segment contains more than 1 ; - %s' % query_segment_string)
+                raise SpecError('query path segment contains more than 1 ; - %s' % query_segment_string)
             self.relationship = parts[0]
             self.is_multivalued = False
         for selector in self.selectors:
@@ -1408,7 +1893,7 @@ class QuerySegment(object):
             for selector in self.selectors:
                 property = self.generator.resolve_property(self.rel_property_spec.target_entity_uri, selector['property'])
                 if not property:
-                    sys.exit('Property named %s not found in Entity %s in file %s' % (selector['property'], self.rel_property_spec.target_entity_uri, self.generator.validator.filename))
+                    raise SpecError('Property named %s not found in Entity %s in file %s' % (selector['property'], self.rel_property_spec.target_entity_uri, self.generator.validator.filename))
                 rslt = {
                     'name': selector['openapispec_param'],
                     'in': 'path',
@@ -1466,7 +1951,7 @@ def as_selectors(input):
     else:
         return [{'property': property_name} for property_name in as_list(input)]       
         
-class CustomAnchorDumper(yaml.SafeDumper):
+class CustomAnchorSerializer(yaml.serializer.Serializer):
 
     def generate_anchor(self, node):
         if node.__class__.id == 'mapping':
@@ -1474,30 +1959,240 @@ class CustomAnchorDumper(yaml.SafeDumper):
                 if  item[0].__class__.id == 'scalar' and item[1].__class__.id == 'scalar'} 
             if 'x-id' in d:
                 return re.sub('[^a-zA-Z0-9]', '-', d['x-id'])
-        anchor =  super(CustomAnchorDumper, self).generate_anchor(node)
+        anchor =  super(CustomAnchorSerializer, self).generate_anchor(node)
         return anchor
 
+class OpenAPISpecRepresenter(yaml.representer.SafeRepresenter):
+
+    def represent_mapping(self, tag, mapping, flow_style=None):
+        # a '<<' key made by --yaml-merge is a merge key, which is written plain rather than quoted as the string '<<' would be
+        node = super(OpenAPISpecRepresenter, self).represent_mapping(tag, mapping, flow_style)
+        for key_node, value_node in node.value:
+            if key_node.value == u'<<' and key_node.tag == u'tag:yaml.org,2002:str':
+                key_node.tag = u'tag:yaml.org,2002:merge'
+        return node
+
+    def represent_unicode_node(self, data):
+        # the emitter of libyaml only takes scalar values that are exactly unicode
+        return self.represent_unicode(unicode(data))
+
+OpenAPISpecRepresenter.add_representer(PresortedOrderedDict, yaml.representer.SafeRepresenter.represent_dict)
+OpenAPISpecRepresenter.add_representer(validate_rapier.unicode_node, OpenAPISpecRepresenter.represent_unicode_node)
+OpenAPISpecRepresenter.add_representer(validate_rapier.list_node, yaml.representer.SafeRepresenter.represent_list)
+
+class CustomAnchorDumper(yaml.emitter.Emitter, CustomAnchorSerializer, OpenAPISpecRepresenter, yaml.resolver.Resolver):
+
+    def __init__(self, stream, default_style=None, default_flow_style=None, canonical=None, indent=None, width=None,
+                 allow_unicode=None, line_break=None, encoding=None, explicit_start=None, explicit_end=None, version=None, tags=None):
+        yaml.emitter.Emitter.__init__(self, stream, canonical=canonical, indent=indent, width=width, allow_unicode=allow_unicode,
+                                      line_break=line_break)
+        CustomAnchorSerializer.__init__(self, encoding=encoding, explicit_start=explicit_start, explicit_end=explicit_end,
+                                        version=version, tags=tags)
+        OpenAPISpecRepresenter.__init__(self, default_style=default_style, default_flow_style=default_flow_style)
+        yaml.resolver.Resolver.__init__(self)
+
+if CEmitter is not None:
+    # the same dumper with the emitter of libyaml, which writes the same text several times faster. The anchors come from
+    # CustomAnchorSerializer, as the serializer of libyaml's CSafeDumper cannot name them from x-id
+    class CustomAnchorCDumper(CustomAnchorSerializer, CEmitter, OpenAPISpecRepresenter, yaml.resolver.Resolver):
+
+        def __init__(self, stream, default_style=None, default_flow_style=None, canonical=None, indent=None, width=None,
+                     allow_unicode=None, line_break=None, encoding=None, explicit_start=None, explicit_end=None, version=None, tags=None):
+            CEmitter.__init__(self, stream, canonical=canonical, indent=indent, width=width, allow_unicode=allow_unicode,
+                              line_break=line_break, encoding=encoding, explicit_start=explicit_start, explicit_end=explicit_end,
+                              version=version, tags=tags)
+            CustomAnchorSerializer.__init__(self, encoding=encoding, explicit_start=explicit_start, explicit_end=explicit_end,
+                                            version=version, tags=tags)
+            OpenAPISpecRepresenter.__init__(self, default_style=default_style, default_flow_style=default_flow_style)
+            yaml.resolver.Resolver.__init__(self)
+
+    OpenAPISpecDumper = CustomAnchorCDumper
+else:
+    OpenAPISpecDumper = CustomAnchorDumper
+
 def main(args):
     generator = OASGenerator()
-    usage = 'usage: gen_openapispec.py [-m, --yaml-merge] [-i, --include-impl] [-t --suppress-templates] filename'
+    usage = 'usage: gen_openapispec.py [-m, --yaml-merge] [-i, --include-impl] [-t --suppress-templates] [--output-format yaml|json] [--profile] [--profile-format table|json] filename'
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'mit', ['yaml-merge', 'include-impl', 'suppress-templates'])
+        opts, args = getopt.getopt(sys.argv[1:], 'mit', ['yaml-merge', 'include-impl', 'suppress-templates', 'output-format=', 'profile', 'profile-format='])
     except getopt.GetoptError as err:
         sys.exit(str(err) + '\n' + usage)
     if not len(args) == 1:
         sys.exit(usage)        
     generator.set_opts(opts)
-    Dumper = CustomAnchorDumper
-    opts_keys = [k for k,v in opts]
-    if False: #'--yaml-alias' not in opts_keys and '-m' not in opts_keys:
-        Dumper.ignore_aliases = lambda self, data: True
-    Dumper.add_representer(PresortedOrderedDict, yaml.representer.SafeRepresenter.represent_dict)
-    Dumper.add_representer(validate_rapier.unicode_node, yaml.representer.SafeRepresenter.represent_unicode)
-    Dumper.add_representer(validate_rapier.list_node, yaml.representer.SafeRepresenter.represent_list)
-    openAPI_spec = generator.openAPI_spec_from_rapier(*args)
-    openAPI_spec_yaml = yaml.dump(openAPI_spec, default_flow_style=False, Dumper=Dumper)
-    openAPI_spec_yaml = str.replace(openAPI_spec_yaml, "'<<':", '<<:')
-    print openAPI_spec_yaml
+    output_format = dict(opts).get('--output-format', 'yaml')
+    if output_format not in OUTPUT_FORMATS:
+        sys.exit('--output-format must be yaml or json: %s\n%s' % (output_format, usage))
+    profile_format = profiling_format(opts, usage)
+    if profile_format is not None:
+        profiling.set_profiler(profiling.Profiler())
+    try:
+        openAPI_spec = generator.openAPI_spec_from_rapier(*args)
+        dump_openapispec(openAPI_spec, sys.stdout, output_format)
+        print
+    except SpecError as e:
+        sys.exit(str(e))
+    finally:
+        if profile_format is not None:
+            print >> sys.stderr, profiling.profiler().report(profile_format)
+            profiling.set_profiler(None)
+
+def profiling_format(opts, usage):
+    # the format of the profile asked for by --profile and --profile-format, or None if no profile was asked for
+    opts = dict(opts)
+    if '--profile' not in opts and '--profile-format' not in opts:
+        return None
+    profile_format = opts.get('--profile-format', 'table')
+    if profile_format not in ('table', 'json'):
+        sys.exit('--profile-format must be table or json: %s\n%s' % (profile_format, usage))
+    return profile_format
+
+OUTPUT_FORMATS = ('yaml', 'json')
+
+def dump_openapispec(openAPI_spec, stream=None, output_format='yaml'):
+    # write openAPI_spec to stream an entry at a time, or return the text if stream is None. The json format has the same content in
+    # the same order, with the mappings of merge keys merged in and the objects behind aliases written out again
+    if stream is None:
+        stream = StringIO()
+        dump_openapispec(openAPI_spec, stream, output_format)
+        return stream.getvalue()
+    if output_format == 'json':
+        with profiling.phase('json dump'):
+            dump_json(openAPI_spec, stream.write)
+    else:
+        with profiling.phase('yaml dump'):
+            dump_yaml(openAPI_spec, stream)
+
+STREAMED_LEVELS = 2
+
+def dump_yaml(data, stream):
+    # write data as yaml.dump(data, stream, default_flow_style=False, Dumper=OpenAPISpecDumper) would, but represent and emit each
+    # top-level section, and each entry of a section, on its own, so that the nodes of only one path or definition are held at a
+    # time rather than those of the whole spec. The anchors the whole document would get are worked out first from the data
+    dumper = OpenAPISpecDumper(stream, default_flow_style=False, encoding='utf-8')
+    try:
+        dumper.open()
+        dumper.emit(yaml.DocumentStartEvent(explicit=dumper.use_explicit_start, version=dumper.use_version, tags=dumper.use_tags))
+        shared = shared_anchors(data, dumper)
+        emit_yaml(data, dumper, shared, STREAMED_LEVELS)
+        dumper.emit(yaml.DocumentEndEvent(explicit=dumper.use_explicit_end))
+        dumper.close()
+    finally:
+        dumper.dispose()
+
+def shared_anchors(data, dumper):
+    # the anchors that Serializer.anchor_node would give, by the id of the data that is reached more than once. The data is walked in
+    # the order the representer and the serializer walk the nodes made from it, and is not walked again below a second visit
+    anchors = {}
+    visited = set()
+    stack = [data]
+    while stack:
+        data = stack.pop()
+        if dumper.ignore_aliases(data):
+            continue
+        if id(data) in visited:
+            if id(data) not in anchors:
+                anchors[id(data)] = anchor_for(data, dumper)
+            continue
+        visited.add(id(data))
+        if isinstance(data, dict):
+            items = data.items()
+            items.sort()
+            stack.extend(reversed([value for key, value in items]))
+        elif isinstance(data, list):
+            stack.extend(reversed(data))
+    return anchors
+
+def anchor_for(data, dumper):
+    # the anchor CustomAnchorSerializer.generate_anchor gives the node of data
+    if isinstance(data, dict) and 'x-id' in data and not isinstance(data['x-id'], (dict, list)):
+        return re.sub('[^a-zA-Z0-9]', '-', dumper.represent_data(data['x-id']).value)
+    dumper.last_anchor_id += 1
+    return dumper.ANCHOR_TEMPLATE % dumper.last_anchor_id
+
+def emit_yaml(data, dumper, shared, levels):
+    if levels > 0 and isinstance(data, dict) and data and '<<' not in data and id(data) not in shared:
+        dumper.emit(yaml.MappingStartEvent(None, dumper.DEFAULT_MAPPING_TAG, True, flow_style=dumper.default_flow_style))
+        items = data.items()
+        items.sort()
+        for key, value in items:
+            emit_yaml(key, dumper, shared, 0)
+            emit_yaml(value, dumper, shared, levels - 1)
+        dumper.emit(yaml.MappingEndEvent())
+    elif dumper.ignore_aliases(data):
+        node = dumper.represent_data(data)
+        dumper.anchors[node] = None
+        dumper.serialize_node(node, None, None)
+        del dumper.anchors[node]
+        del dumper.serialized_nodes[node]
+    else:
+        node = dumper.represent_data(data)
+        mark_nodes(node, dumper)
+        for data_id, anchor in shared.iteritems():
+            shared_node = dumper.represented_objects.get(data_id)
+            if shared_node is not None and dumper.anchors.get(shared_node) is None:
+                dumper.anchors[shared_node] = anchor
+        dumper.serialize_node(node, None, None)
+        # only the nodes of shared data can be written again, as aliases. The others are let go
+        dumper.represented_objects = {data_id: node for data_id, node in dumper.represented_objects.iteritems() if data_id in shared}
+        dumper.object_keeper = []
+        dumper.anchors = {node: anchor for node, anchor in dumper.anchors.iteritems() if anchor is not None}
+        dumper.serialized_nodes = {node: True for node in dumper.serialized_nodes if node in dumper.anchors}
+
+def mark_nodes(node, dumper):
+    # enter the nodes not yet serialized in dumper.anchors, as Serializer.anchor_node does, for Serializer.serialize_node to find
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node in dumper.anchors:
+            continue
+        dumper.anchors[node] = None
+        if isinstance(node, yaml.SequenceNode):
+            stack.extend(node.value)
+        elif isinstance(node, yaml.MappingNode):
+            for key, value in node.value:
+                stack.extend((key, value))
+
+def mapping_items(mapping):
+    # the items of mapping in the order the yaml dumper writes them, with the items of the mapping of a merge key in place of it
+    items = mapping.items()
+    if '<<' in mapping:
+        merged = mapping['<<']
+        items = items.__class__([item for item in items if item[0] != '<<'] +
+                                [item for item in mapping_items(merged) if item[0] not in mapping])
+    items.sort()
+    return items
+
+def dump_json(data, write, indent='\n'):
+    if isinstance(data, dict):
+        items = mapping_items(data)
+        if not items:
+            write('{}')
+            return
+        item_indent = indent + '  '
+        separator = '{' + item_indent
+        for key, value in items:
+            write(separator)
+            write(encode_json_string(key if isinstance(key, basestring) else json.dumps(key)))
+            write(': ')
+            dump_json(value, write, item_indent)
+            separator = ',' + item_indent
+        write(indent + '}')
+    elif isinstance(data, list):
+        if not data:
+            write('[]')
+            return
+        item_indent = indent + '  '
+        separator = '[' + item_indent
+        for value in data:
+            write(separator)
+            dump_json(value, write, item_indent)
+            separator = ',' + item_indent
+        write(indent + ']')
+    elif isinstance(data, basestring):
+        write(encode_json_string(data))
+    else:
+        write(json.dumps(data))
     
 def article(name):
     return 'an' if name[0].lower() in 'aeiou' else 'a'
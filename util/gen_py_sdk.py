@@ -1,24 +1,50 @@
-import yaml, sys
+import yaml, sys, getopt, re, keyword
+from sdk_util import as_str
+
+# the slots BaseCompactEntity already has, and the names of the methods, attributes and slots of the base classes of a generated
+# entity - BaseCompactEntity, and AsyncBaseEntity with --async - which an entity property must not take as a slot. api is the
+# method of the generated APIClass. py/test/base_api checks these against the classes in py/base_api.py and py/async_base_api.py
+BASE_SLOTS = {'_self', '_location', '_etag', '_related', '_originals', 'kind'}
+RESERVED_NAMES = BASE_SLOTS | {'_jso', '_nested_changed', 'api', 'changes', 'delete', 'get_related', 'keep_jso', 'refresh', 'retrieve',
+                               'track_nested_changes', 'update', 'update_attrs'}
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
 
 class ClientGenerator(object):
 
+    def __init__(self):
+        self.use_async = False
+
+    def set_opts(self, opts):
+        opts_keys = [k for k,v in opts]
+        self.use_async = '--async' in opts_keys or '-a' in opts_keys
+
     def set_rapier_spec_from_filename(self, filename):
         with open(filename) as f:
             self.rapier_spec = yaml.load(f.read())
 
-    def client_from_rapier(self, filename= None):
+    def set_rapier_spec(self, spec):
+        # spec is the data of a rapier spec, as yaml.load gives it or as validate_rapier has validated it
+        self.rapier_spec = spec
+
+    def client_from_rapier(self, filename= None, out=None):
+        out = out if out is not None else sys.stdout
         spec = self.rapier_spec
         if filename:
             self.set_rapier_spec_from_filename(filename)
             
         entities = spec.get('entities',{})
         well_known_urls = [as_list(entity.get('wellKnownURLs')) for entity in entities.itervalues() if 'wellKnownURLs' in entity]
-        well_known_urls = [url for urls in well_known_urls for url in urls]
+        well_known_urls = [as_str(url) for urls in well_known_urls for url in urls]
         
-        print '''
-from rapier.py.base_api import BaseAPI, BaseResource, BaseEntity, BaseCollection
+        if self.use_async:
+            base_module, base_api, base_entity, base_collection = 'async_base_api', 'AsyncBaseAPI', 'AsyncBaseEntity, BaseCompactEntity', 'AsyncBaseCollection'
+        else:
+            base_module, base_api, base_entity, base_collection = 'base_api', 'BaseAPI', 'BaseCompactEntity', 'BaseCollection'
+
+        print >> out, '''
+from rapier.py.%s import %s, BaseResource, %s, %s
 
-class API(BaseAPI):
+class API(%s):
     def well_known_URLs(self):
         return %s
     def resource_class(self, type_name):
@@ -28,24 +54,54 @@ api = API()
 
 class APIClass(object):
     def api(self):
-        return api''' % well_known_urls
+        return api''' % (base_module, base_api, base_entity, base_collection, base_api, well_known_urls)
         
         for entity_name in entities:
-            print '''
-class %s(BaseEntity, APIClass):            
-    pass''' % entity_name
+            print >> out, '''
+class %s(%s, APIClass):
+    __slots__ = %s''' % (entity_name, base_entity, tuple(self.slot_names(entity_name, entities)))
 
-        print '''
-class Collection(BaseCollection, APIClass):            
-    pass'''
+        print >> out, '''
+class Collection(%s, APIClass):            
+    pass''' % base_collection
     
         map_values = ["'{0}': {0}".format((entity_name)) for entity_name in entities] + ["'Collection': Collection"]
 
-        print '''
+        print >> out, '''
 classToKindMap = {
     %s
     }''' % ',\n    '.join(map_values)
     
+    def slot_names(self, entity_name, entities):
+        # the properties declared for the entity, including those from allOf references, that can be slots
+        names = []
+        visited = set()
+        def add_names(entity):
+            if id(entity) not in visited:
+                visited.add(id(entity))
+                for ref in entity.get('allOf', []):
+                    referenced_entity = self.referenced_entity(ref, entities)
+                    if referenced_entity is not None:
+                        add_names(referenced_entity)
+                names.extend(entity.get('properties') or {})
+        add_names(entities.get(entity_name) or {})
+        slots = []
+        for name in names:
+            if (isinstance(name, basestring) and IDENTIFIER.match(name) and not keyword.iskeyword(name) and not name.startswith('__') and name not in RESERVED_NAMES
+                    and name not in BASE_SLOTS and name not in slots):
+                slots.append(str(name))
+        return slots
+
+    def referenced_entity(self, ref, entities):
+        # the entity an allOf reference refers to, or None. validate_rapier makes each $ref absolute and puts the node it refers to
+        # beside it, so the entities of a validated spec can come from the specs it includes. Otherwise only local references are followed
+        if not isinstance(ref, dict):
+            return None
+        if 'resolved_node' in ref:
+            return ref['resolved_node'] if hasattr(ref['resolved_node'], 'keys') else None
+        ref = ref.get('$ref', '')
+        return (entities.get(ref[len('#/entities/'):]) or {}) if ref.startswith('#/entities/') else None
+
 def as_list(value, separator = None):
     if isinstance(value, basestring):
         if separator:
@@ -61,6 +117,14 @@ def as_list(value, separator = None):
     
 def main(args):
     generator = ClientGenerator()
+    usage = 'usage: gen_py_sdk.py [-a, --async] filename'
+    try:
+        opts, args = getopt.getopt(args, 'a', ['async'])
+    except getopt.GetoptError as err:
+        sys.exit(str(err) + '\n' + usage)
+    if not len(args) == 1:
+        sys.exit(usage)
+    generator.set_opts(opts)
     generator.set_rapier_spec_from_filename(args[0])
     generator.client_from_rapier()
         
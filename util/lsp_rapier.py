@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+
+import sys, os, json, time, threading, traceback, getopt, urllib, urlparse
+from Queue import Queue, Empty
+import yaml
+import validate_rapier
+
+DEBOUNCE = 0.25 # seconds without a change before the open documents are validated again
+LATENCY_BUDGET = 0.5 # seconds a validation round may take before it is reported as slow
+
+SEVERITIES = {'FATAL ERROR': 1, 'ERROR': 1, 'WARNING': 2, 'INFO': 3} # LSP DiagnosticSeverity of each validator severity
+
+def uri_to_filename(uri):
+    return os.path.abspath(urllib.url2pathname(urlparse.urlsplit(uri).path))
+
+def filename_to_uri(filename):
+    return 'file://' + urllib.pathname2url(filename)
+
+def utf16_length(text):
+    return len(text.encode('utf-16-le')) // 2
+
+def lsp_position(position, lines):
+    # the columns of the validator and of yaml marks count characters, and LSP counts the UTF-16 code units before the position
+    line, column = position
+    if line < len(lines):
+        column = utf16_length(lines[line][:column])
+    return {'line': line, 'character': column}
+
+def lsp_range(start, end, lines):
+    return {'start': lsp_position(start, lines), 'end': lsp_position(end, lines)}
+
+def python_column(line, character):
+    # the number of characters of line before an LSP position that has character UTF-16 code units before it
+    units = 0
+    for column, char in enumerate(line):
+        if units >= character:
+            return column
+        units += utf16_length(char)
+    return len(line)
+
+def file_lines(abs_filename):
+    # the lines of a spec file, or of its open document, to convert the columns of positions in it
+    try:
+        content = validate_rapier.read_spec_file(abs_filename)
+    except IOError:
+        return []
+    return content.decode('utf-8', 'replace').splitlines()
+
+def read_message(stream):
+    # the next JSON-RPC message, or None at the end of the stream
+    length = None
+    while True:
+        line = stream.readline()
+        if not line:
+            return None
+        line = line.strip()
+        if line:
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        elif length is not None:
+            return json.loads(stream.read(length))
+
+def write_message(stream, message):
+    body = json.dumps(message)
+    stream.write('Content-Length: %d\r\n\r\n%s' % (len(body), body))
+    stream.flush()
+
+class RapierLanguageServer(object):
+    # A language server on stdio. The open documents are kept in validate_rapier.open_documents, so they are read instead of the
+    # files. After a change, once no change has come for the debounce time, every open document is validated again as a root spec.
+    # The validated specs are kept in a MemorySpecCache, so only the documents and files that changed, and the ones that include or
+    # reference them, are parsed and validated. Diagnostics are published for every file they are about. Each validation also
+    # indexes the URLs in the document, for go to definition of relationship and $ref targets
+
+    def __init__(self, input, output, debounce=DEBOUNCE):
+        self.input = input
+        self.output = output
+        self.debounce = debounce
+        self.messages = Queue()
+        self.documents = set() # the abs filenames of the open documents
+        self.last_change = None # the time of the last change not yet validated, or None
+        self.published = dict() # abs filename -> the diagnostics last published for it
+        self.definitions = dict() # abs filename of an open document -> [(start, end, target abs filename, target position)]
+        self.parses = dict() # abs filename -> (content digest, parsed spec or None), for finding definitions
+        self.cache = validate_rapier.MemorySpecCache()
+        self.shutdown_requested = False
+
+    def read_messages(self):
+        while True:
+            message = read_message(self.input)
+            self.messages.put(message)
+            if message is None:
+                return
+
+    def run(self):
+        # returns the exit status
+        reader = threading.Thread(target=self.read_messages)
+        reader.daemon = True
+        reader.start()
+        validate_rapier.set_spec_cache(self.cache)
+        while True:
+            if self.last_change is not None:
+                try:
+                    message = self.messages.get(True, max(0, self.last_change + self.debounce - time.time()))
+                except Empty:
+                    self.validate_documents()
+                    continue
+            else:
+                message = self.messages.get()
+            if message is None:
+                return 1
+            if message.get('method') == 'exit':
+                return 0 if self.shutdown_requested else 1
+            self.handle(message)
+
+    def handle(self, message):
+        method = message.get('method')
+        if method is None:
+            return # a response to a request from the server - there are none
+        handler = getattr(self, 'handle_' + method.replace('/', '_').replace('$', '_'), None)
+        if 'id' not in message:
+            if handler is not None:
+                handler(message.get('params', {}))
+            return
+        if handler is None:
+            self.send({'jsonrpc': '2.0', 'id': message['id'], 'error': {'code': -32601, 'message': 'method not found: %s' % method}})
+            return
+        try:
+            result = handler(message.get('params', {}))
+        except Exception as e:
+            traceback.print_exc()
+            self.send({'jsonrpc': '2.0', 'id': message['id'], 'error': {'code': -32603, 'message': str(e)}})
+        else:
+            self.send({'jsonrpc': '2.0', 'id': message['id'], 'result': result})
+
+    def send(self, message):
+        write_message(self.output, message)
+
+    def handle_initialize(self, params):
+        return {'capabilities': {'textDocumentSync': 1, 'definitionProvider': True}, 'serverInfo': {'name': 'rapier'}}
+
+    def handle_shutdown(self, params):
+        self.shutdown_requested = True
+        return None
+
+    def handle_textDocument_didOpen(self, params):
+        self.set_document(params['textDocument']['uri'], params['textDocument']['text'])
+
+    def handle_textDocument_didChange(self, params):
+        # the server asks for full document sync, so the last change is the whole document
+        self.set_document(params['textDocument']['uri'], params['contentChanges'][-1]['text'])
+
+    def handle_textDocument_didClose(self, params):
+        filename = uri_to_filename(params['textDocument']['uri'])
+        self.documents.discard(filename)
+        validate_rapier.open_documents.pop(filename, None)
+        self.definitions.pop(filename, None)
+        self.changed()
+
+    def handle_textDocument_definition(self, params):
+        if self.last_change is not None:
+            self.validate_documents()
+        filename = uri_to_filename(params['textDocument']['uri'])
+        line, character = params['position']['line'], params['position']['character']
+        lines = file_lines(filename)
+        position = (line, python_column(lines[line], character) if line < len(lines) else character)
+        for start, end, target_filename, target_position in self.definitions.get(filename, []):
+            if start <= position <= end:
+                return {'uri': filename_to_uri(target_filename), 'range': lsp_range(target_position, target_position, file_lines(target_filename))}
+        return None
+
+    def set_document(self, uri, text):
+        filename = uri_to_filename(uri)
+        self.documents.add(filename)
+        validate_rapier.open_documents[filename] = text.encode('utf-8')
+        self.changed()
+
+    def changed(self):
+        self.last_change = time.time()
+
+    def validate_documents(self):
+        self.last_change = None
+        start = time.time()
+        diagnostics = dict((filename, set()) for filename in self.documents)
+        for filename in sorted(self.documents):
+            self.validate_document(filename, diagnostics)
+        for filename in set(self.published) - set(diagnostics):
+            diagnostics[filename] = set()
+        for filename, file_diagnostics in diagnostics.iteritems():
+            lines = file_lines(filename) if file_diagnostics else []
+            lsp_diagnostics = [self.lsp_diagnostic(diagnostic, lines) for diagnostic in sorted(file_diagnostics)]
+            if self.published.get(filename) != lsp_diagnostics:
+                self.send({'jsonrpc': '2.0', 'method': 'textDocument/publishDiagnostics',
+                           'params': {'uri': filename_to_uri(filename), 'diagnostics': lsp_diagnostics}})
+            if file_diagnostics:
+                self.published[filename] = lsp_diagnostics
+            else:
+                self.published.pop(filename, None)
+        elapsed = time.time() - start
+        print >> sys.stderr, 'validated %s documents in %.3f seconds%s' % (len(self.documents), elapsed, ' - over budget' if elapsed > LATENCY_BUDGET else '')
+
+    def validate_document(self, filename, diagnostics):
+        # validate an open document, adding the diagnostics for each file to diagnostics, and index its definitions
+        content = validate_rapier.open_documents[filename]
+        self.definitions[filename] = []
+        try:
+            parsed = validate_rapier.load_marked(content)
+        except yaml.MarkedYAMLError as e:
+            mark = e.problem_mark or e.context_mark
+            position = (mark.line, mark.column) if mark is not None else None
+            diagnostics[filename].add(('ERROR', ' '.join([part for part in (e.context, e.problem) if part]), filename, position, position))
+            return
+        # the URLs are found before validation, which replaces them with absolute ones, so that they still have their marks
+        urls = validate_rapier.spec_urls(parsed[0])
+        validator = validate_rapier.OASValidator()
+        validator.quiet = True
+        try:
+            validator.validate(filename, None, content, parsed)
+        except validate_rapier.SpecError as e:
+            if not any(diagnostic[0] == 'FATAL ERROR' for diagnostic in validator.diagnostics):
+                validator.diagnostics.append(('FATAL ERROR', str(e), filename, None, None))
+        except Exception as e:
+            validator.diagnostics.append(('ERROR', 'validation failed: %s' % e, filename, None, None))
+        for diagnostic in validator.diagnostics:
+            diagnostics.setdefault(diagnostic[2], set()).add(diagnostic)
+        self.definitions[filename] = self.definition_index(content, urls, validator)
+
+    def lsp_diagnostic(self, diagnostic, lines):
+        severity, message, filename, start, end = diagnostic
+        return {'range': lsp_range(start or (0, 0), end or start or (0, 0), lines), 'severity': SEVERITIES[severity], 'source': 'rapier', 'message': message}
+
+    def definition_index(self, content, urls, validator):
+        # the range of each URL in the document, with the file and position of what it refers to, given the spec_urls of the
+        # document as parsed. The positions come from the marks of the parse
+        lines = content.decode('utf-8', 'replace').splitlines()
+        search_from = dict() # id of a string that holds more than one URL -> the column after the last URL found in it
+        index = []
+        for url, is_include, value in urls:
+            if not hasattr(value, 'start_mark'):
+                continue
+            start, end = (value.start_mark.line, value.start_mark.column), (value.end_mark.line, value.end_mark.column)
+            if url is not value and start[0] == end[0] and start[0] < len(lines):
+                column = lines[start[0]].find(url, search_from.get(id(value), start[1]))
+                if column >= 0:
+                    start, end = (start[0], column), (start[0], column + len(url))
+                    search_from[id(value)] = column + len(url)
+            target = self.definition_target(validator, url)
+            if target is not None:
+                index.append((start, end) + target)
+        return index
+
+    def definition_target(self, validator, url):
+        # the (abs filename, position) of the entity or schema a URL refers to, or of the start of its file if it cannot be found
+        abs_url = validator.abs_url(url)
+        target_filename, _, fragment = abs_url.partition('#')
+        path = []
+        entity = None
+        if getattr(validator, 'uri_index', None) is not None:
+            entity = validator.uri_index.included_entities.get(abs_url) or validator.uri_index.referenced_entities.get(abs_url)
+        if hasattr(entity, 'get') and isinstance(entity.get('id'), basestring) and 'name' in entity:
+            target_filename = entity['id'].partition('#')[0]
+            path = ['entities', entity['name']]
+        elif fragment.startswith('/'):
+            path = fragment[1:].split('/')
+        if not target_filename:
+            return None
+        node = self.parse(target_filename)
+        position = (0, 0)
+        for part in path:
+            if hasattr(node, 'keys'):
+                key = next((key for key in node.iterkeys() if key == part), None)
+                if key is None:
+                    break
+                if hasattr(key, 'start_mark'):
+                    position = (key.start_mark.line, key.start_mark.column)
+                node = node[key]
+            elif isinstance(node, list) and part.isdigit() and int(part) < len(node):
+                node = node[int(part)]
+                if hasattr(node, 'start_mark'):
+                    position = (node.start_mark.line, node.start_mark.column)
+            else:
+                break
+        return target_filename, position
+
+    def parse(self, abs_filename):
+        try:
+            content = validate_rapier.read_spec_file(abs_filename)
+        except IOError:
+            return None
+        digest = validate_rapier.content_digest(content)
+        parse = self.parses.get(abs_filename)
+        if parse is None or parse[0] != digest:
+            try:
+                data = validate_rapier.load_marked(content)[0]
+            except yaml.YAMLError:
+                data = None
+            parse = self.parses[abs_filename] = (digest, data)
+        return parse[1]
+
+def main(args):
+    usage = 'usage: lsp_rapier.py [--debounce milliseconds]'
+    try:
+        opts, args = getopt.getopt(args, '', ['debounce='])
+    except getopt.GetoptError as err:
+        sys.exit(str(err) + '\n' + usage)
+    if args:
+        sys.exit(usage)
+    debounce = DEBOUNCE
+    for k, v in opts:
+        if k == '--debounce':
+            try:
+                debounce = int(v) / 1000.0
+            except ValueError:
+                sys.exit('--debounce must be a number of milliseconds: %s\n%s' % (v, usage))
+    sys.exit(RapierLanguageServer(sys.stdin, sys.stdout, debounce).run())
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
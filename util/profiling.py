@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+import sys, time, json
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Profiling of validation and generation. While a Profiler is set with set_profiler, the phases marked with phase() are timed,
+# the counts passed to count() are added up, and each keyword validator that the walk of check_and_validate_keywords calls from
+# its stack of generators is timed. Without a Profiler, phase() and count() do nothing.
+
+_profiler = None
+
+def profiler():
+    return _profiler
+
+def set_profiler(profiler):
+    global _profiler
+    _profiler = profiler
+
+class NoPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+no_phase = NoPhase()
+
+def phase(name):
+    return _profiler.phase(name) if _profiler is not None else no_phase
+
+def count(name, n=1):
+    if _profiler is not None:
+        _profiler.count(name, n)
+
+def max_rss():
+    # the most memory the process has had resident so far, in KB, or None where it cannot be found
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+class Phase(object):
+    # times one phase. A phase entered again while it is already running, like a phase around a recursive call, is part of
+    # the phase already running and is not counted again
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        profiler = self.profiler
+        self.outermost = self.name not in profiler.running
+        if self.outermost:
+            stats = profiler.phases.get(self.name)
+            if stats is None:
+                stats = profiler.phases[self.name] = {'name': self.name, 'depth': len(profiler.running), 'calls': 0, 'seconds': 0.0,
+                                                      'peak_rss_kb': None, 'rss_growth_kb': 0}
+                profiler.phase_order.append(self.name)
+            profiler.running.append(self.name)
+            self.rss = max_rss()
+            self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        if self.outermost:
+            elapsed = time.time() - self.start
+            profiler = self.profiler
+            profiler.running.pop()
+            stats = profiler.phases[self.name]
+            stats['calls'] += 1
+            stats['seconds'] += elapsed
+            rss = max_rss()
+            if rss is not None:
+                stats['peak_rss_kb'] = max(stats['peak_rss_kb'], rss)
+                stats['rss_growth_kb'] += rss - self.rss
+        return False
+
+class Profiler(object):
+
+    def __init__(self):
+        self.phases = dict() # phase name -> its stats
+        self.phase_order = [] # phase names, in the order they were first entered
+        self.running = [] # the names of the phases running now, outermost first
+        self.counts = dict() # name -> count
+        self.keyword_stats = dict() # keyword validator name -> [calls, seconds]
+        self.timed_keywords = dict() # keyword validator function of validate_rapier -> the function, timed
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def keyword_time(self, name, calls, seconds):
+        stats = self.keyword_stats.get(name)
+        if stats is None:
+            stats = self.keyword_stats[name] = [0, 0.0]
+        stats[0] += calls
+        stats[1] += seconds
+
+    def timed_keyword(self, name, function):
+        # a keyword validator that adds the time of each call to the stats of name
+        def timed(*args):
+            start = time.time()
+            try:
+                return function(*args)
+            finally:
+                self.keyword_time(name, 1, time.time() - start)
+        return timed
+
+    def timed_keyword_generator(self, name, function):
+        # a keyword validator that yields nested nodes, adding the time of each step to the stats of name. The nested nodes are
+        # validated between steps, so their time is not included
+        def timed(*args):
+            generator = function(*args)
+            calls = 1
+            while True:
+                start = time.time()
+                try:
+                    task = next(generator)
+                except StopIteration:
+                    self.keyword_time(name, calls, time.time() - start)
+                    return
+                self.keyword_time(name, calls, time.time() - start)
+                calls = 0
+                yield task
+        return timed
+
+    def results(self):
+        return {
+            'phases': [self.phases[name] for name in self.phase_order],
+            'keywords': [{'name': name, 'calls': stats[0], 'seconds': stats[1]} for name, stats in
+                         sorted(self.keyword_stats.iteritems(), key=lambda item: (-item[1][1], item[0]))],
+            'counts': self.counts
+            }
+
+    def report(self, format='table'):
+        results = self.results()
+        if format == 'json':
+            return json.dumps(results, indent=2, sort_keys=True)
+        lines = ['%-40s %8s %10s %14s %14s' % ('phase', 'calls', 'seconds', 'peak RSS KB', 'RSS growth KB')]
+        for stats in results['phases']:
+            lines.append('%-40s %8d %10.4f %14s %14s' % ('  ' * stats['depth'] + stats['name'], stats['calls'], stats['seconds'],
+                                                        stats['peak_rss_kb'], stats['rss_growth_kb'] if stats['peak_rss_kb'] is not None else None))
+        if results['keywords']:
+            lines.append('')
+            lines.append('%-40s %8s %10s' % ('keyword validator', 'calls', 'seconds'))
+            for stats in results['keywords']:
+                lines.append('%-40s %8d %10.4f' % (stats['name'], stats['calls'], stats['seconds']))
+        if results['counts']:
+            lines.append('')
+            lines.append('%-40s %8s' % ('count', ''))
+            for name, n in sorted(results['counts'].iteritems()):
+                lines.append('%-40s %8d' % (name, n))
+        return '\n'.join(lines)
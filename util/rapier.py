@@ -4,22 +4,48 @@ from gen_openapispec import main as gen_oas_main
 from validate_rapier import main as validate_main
 from gen_js_sdk import main as gen_js_main
 from gen_py_sdk import main as gen_py_main
+from watch_rapier import main as watch_main
+from batch_rapier import main as batch_main
+from lsp_rapier import main as lsp_main
+from compiler import main as compile_main
+from gen_openapispec import profiling_format
+import profiling
 
 def main():
-    usage = 'usage: rapier [-v, --validate] [-p, --gen-python] [-j, --gen-js] [-m, --yaml-merge] [-i, --include-impl] [-t --suppress-templates] filename'
+    usage = 'usage: rapier [-v, --validate] [-p, --gen-python] [-a, --async] [-j, --gen-js] [-w, --watch] [-b, --batch] [--lsp] [-o, --output-dir dirname] [--targets openapi,openapi-impl,html,python,js] [--processes n] [--debounce milliseconds] [--profile] [--profile-format table|json] [-m, --yaml-merge] [-i, --include-impl] [-t --suppress-templates] [--output-format yaml|json] filename'
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'vpjmit', ['validate', 'gen-python', 'gen-js', 'yaml-merge', 'include-impl', 'suppress-templates'])
+        opts, args = getopt.getopt(sys.argv[1:], 'vpajwbo:mit', ['validate', 'gen-python', 'async', 'gen-js', 'watch', 'batch', 'lsp', 'output-dir=', 'targets=', 'processes=', 'debounce=', 'profile', 'profile-format=', 'yaml-merge', 'include-impl', 'suppress-templates', 'output-format='])
     except getopt.GetoptError as err:
         sys.exit(str(err) + '\n' + usage)
+    opts_keys = [k for k,v in opts]
+    profile_format = profiling_format(opts, usage)
+    opts = [(k, v) for k,v in opts if k not in ('--profile', '--profile-format')] # only validation and generation are profiled
+    if '-b' in opts_keys or '--batch' in opts_keys:
+        # any number of files and directories
+        return batch_main([arg for k,v in opts if k not in ('-b', '--batch') for arg in ([k, v] if v else [k])] + args)
+    if '--lsp' in opts_keys:
+        # a language server on stdin and stdout, for the documents an editor opens
+        return lsp_main([arg for k,v in opts if k == '--debounce' for arg in [k, v]] + args)
     if not len(args) == 1:
         sys.exit(usage)        
-    opts_keys = [k for k,v in opts]
+    if '--targets' in opts_keys:
+        # each of the targets, generated from one validated spec, written to the output directory
+        return compile_main([arg for k,v in opts if k in ('-o', '--output-dir', '--targets', '--output-format', '-a', '--async', '-m', '--yaml-merge', '-i', '--include-impl',
+                                                          '-t', '--suppress-templates') for arg in ([k, v] if v else [k])] + args)
 
     if '-v' in opts_keys or '--validate' in opts_keys:
-        validate_main(args[0])
+        if profile_format is not None:
+            profiling.set_profiler(profiling.Profiler())
+        try:
+            validate_main(args)
+        finally:
+            if profile_format is not None:
+                print >> sys.stderr, profiling.profiler().report(profile_format)
     elif '-p' in opts_keys or '--gen-python' in opts_keys:
-        gen_py_main(args[0])
+        gen_py_main((['--async'] if '-a' in opts_keys or '--async' in opts_keys else []) + args)
+    elif '-w' in opts_keys or '--watch' in opts_keys:
+        watch_main([arg for k,v in opts if k not in ('-w', '--watch') for arg in ([k, v] if v else [k])] + args)
     elif '-j' in opts_keys or '--gen-js' in opts_keys:
-        gen_py_main(args[0])
+        gen_js_main(args)
     else:
         gen_oas_main(sys.argv)
\ No newline at end of file
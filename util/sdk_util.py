@@ -0,0 +1,10 @@
+#!/usr/bin/env python
+
+# Helpers shared by the SDK generators, gen_py_sdk and gen_js_sdk.
+
+def as_str(value):
+    # the strings of a validated spec are unicode even when they are ASCII, where yaml.load gives a str that is written without the u
+    try:
+        return str(value)
+    except UnicodeEncodeError:
+        return value
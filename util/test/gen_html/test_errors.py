@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+# Tests that HTML generation raises SpecError for a spec with errors, as OpenAPI generation does.
+# usage: test_errors.py
+
+import sys, os, shutil, tempfile
+DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DIR, '..', '..'))
+import validate_rapier
+from validate_rapier import SpecError
+from gen_html import HTMLGenerator
+
+def generate(directory, text):
+    filename = os.path.join(directory, 'spec.yaml')
+    with open(filename, 'w') as f:
+        f.write(text)
+    validator = validate_rapier.OASValidator()
+    validator.quiet = True
+    spec, errors = validator.validate(filename, None)
+    try:
+        HTMLGenerator().html_from_validator(validator, spec, errors)
+    except SpecError as e:
+        return str(e)
+    return None
+
+def test_spec_errors(directory):
+    message = generate(directory, 'title: Errors\nentities:\n  A:\n    properties:\n      p:\n        type: strin\n')
+    assert message is not None and 'HTML generation not attempted' in message, message
+    assert generate(directory, 'title: Fine\nentities:\n  A:\n    properties:\n      p:\n        type: string\n') is None
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        test_spec_errors(directory)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
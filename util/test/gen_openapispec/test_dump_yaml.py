@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+# Tests of dump_yaml: writing a spec an entry at a time gives the text yaml.dump gives, anchors and merge keys included.
+# usage: test_dump_yaml.py
+
+import sys, os, glob
+from StringIO import StringIO
+import yaml
+DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DIR, '..', '..'))
+import gen_openapispec
+
+def dumpers():
+    result = [gen_openapispec.CustomAnchorDumper]
+    if gen_openapispec.CEmitter is not None:
+        result.append(gen_openapispec.CustomAnchorCDumper)
+    return result
+
+def test_same_text_as_yaml_dump():
+    for filename in sorted(glob.glob(os.path.join(DIR, '..', '*.yaml'))):
+        for opts in ([], [('-m', '')]):
+            generator = gen_openapispec.OASGenerator()
+            generator.set_opts(opts)
+            spec = generator.openAPI_spec_from_rapier(filename)
+            for dumper in dumpers():
+                stream = StringIO()
+                saved = gen_openapispec.OpenAPISpecDumper
+                gen_openapispec.OpenAPISpecDumper = dumper
+                try:
+                    gen_openapispec.dump_yaml(spec, stream)
+                finally:
+                    gen_openapispec.OpenAPISpecDumper = saved
+                expected = yaml.dump(spec, default_flow_style=False, Dumper=dumper)
+                assert stream.getvalue() == expected, (filename, opts, dumper.__name__)
+
+def test_shared_entries_are_aliased():
+    shared = {'x-id': 'Shared', 'type': 'string'}
+    spec = {'definitions': {'A': shared, 'B': {'properties': {'b': shared}}, 'C': [shared]}, 'paths': {}}
+    stream = StringIO()
+    gen_openapispec.dump_yaml(spec, stream)
+    assert stream.getvalue() == yaml.dump(spec, default_flow_style=False, Dumper=gen_openapispec.OpenAPISpecDumper)
+    assert '&Shared' in stream.getvalue() and '*Shared' in stream.getvalue()
+
+def main():
+    test_same_text_as_yaml_dump()
+    test_shared_entries_are_aliased()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+# Tests of --yaml-merge: the response sets and standard 200 response are merged into the GET responses, except where an entity
+# produces several media types, and the YAML loads back with them merged in.
+# usage: test_yaml_merge.py
+
+import sys, os, shutil, tempfile
+import yaml
+DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DIR, '..', '..'))
+import gen_openapispec
+
+SPEC = '''title: Merge
+entities:
+  Thing:
+    wellKnownURLs: /thing
+    properties:
+      name:
+        type: string
+  Doc:
+    wellKnownURLs: /doc
+    produces: [application/json, text/html]
+    properties:
+      text:
+        type: string
+'''
+
+ENTITY_GET_RESPONSES = ['401', '403', '404', '406', 'default']
+
+def generate(directory, opts):
+    filename = os.path.join(directory, 'merge.yaml')
+    with open(filename, 'w') as f:
+        f.write(SPEC)
+    generator = gen_openapispec.OASGenerator()
+    generator.set_opts(opts)
+    return generator, generator.openAPI_spec_from_rapier(filename)
+
+def test_merged_get_responses(directory):
+    generator, spec = generate(directory, [('-m', '')])
+    responses = spec['x-interfaces']['Thing']['get']['responses']
+    assert responses['<<'] is generator.response_sets['entity_get_responses']
+    assert sorted(responses['<<'].keys()) == ENTITY_GET_RESPONSES
+    assert responses['200']['<<'] is spec['responses']['standard_200']
+    loaded = yaml.safe_load(gen_openapispec.dump_openapispec(spec))['x-interfaces']['Thing']['get']['responses']
+    assert sorted(loaded.keys()) == ['200'] + ENTITY_GET_RESPONSES
+    assert loaded['200']['description'] == 'successful' and loaded['200']['schema'] == {'$ref': '#/definitions/Thing'}
+
+def test_several_media_types(directory):
+    # the 200 response of an entity that produces several media types varies on Accept, so it is not the standard one
+    generator, spec = generate(directory, [('-m', ''), ('-i', '')])
+    response_200 = spec['x-interfaces']['Doc']['get']['responses']['200']
+    assert '<<' not in response_200 and 'Vary' in response_200['headers']
+    assert spec['x-interfaces']['Doc']['get']['produces'] == ['application/json', 'text/html']
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        test_merged_get_responses(directory)
+        test_several_media_types(directory)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
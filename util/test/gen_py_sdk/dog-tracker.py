@@ -1,5 +1,5 @@
 
-from rapier.py.base_api import BaseAPI, BaseResource, BaseEntity, BaseCollection
+from rapier.py.base_api import BaseAPI, BaseResource, BaseCompactEntity, BaseCollection
 
 class API(BaseAPI):
     def well_known_URLs(self):
@@ -13,23 +13,23 @@ class APIClass(object):
     def api(self):
         return api
 
-class Person(BaseEntity, APIClass):            
-    pass
+class Person(BaseCompactEntity, APIClass):
+    __slots__ = ('modifier', 'created', 'modified', 'creator', 'name', 'dogs')
 
-class Resource(BaseEntity, APIClass):            
-    pass
+class Resource(BaseCompactEntity, APIClass):
+    __slots__ = ()
 
-class PersistentResource(BaseEntity, APIClass):            
-    pass
+class PersistentResource(BaseCompactEntity, APIClass):
+    __slots__ = ('modifier', 'created', 'modified', 'creator')
 
-class DogTracker(BaseEntity, APIClass):            
-    pass
+class DogTracker(BaseCompactEntity, APIClass):
+    __slots__ = ('modifier', 'created', 'modified', 'creator', 'dogs', 'people')
 
-class Dog(BaseEntity, APIClass):            
-    pass
+class Dog(BaseCompactEntity, APIClass):
+    __slots__ = ('modifier', 'created', 'modified', 'creator', 'birth_date', 'owner', 'fur_color', 'name')
 
-class Collection(BaseEntity, APIClass):            
-    pass
+class Collection(BaseCompactEntity, APIClass):
+    __slots__ = ('items',)
 
 class Collection(BaseCollection, APIClass):            
     pass
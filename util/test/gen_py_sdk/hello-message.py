@@ -1,5 +1,5 @@
 
-from rapier.py.base_api import BaseAPI, BaseResource, BaseEntity, BaseCollection
+from rapier.py.base_api import BaseAPI, BaseResource, BaseCompactEntity, BaseCollection
 
 class API(BaseAPI):
     def well_known_URLs(self):
@@ -13,8 +13,8 @@ class APIClass(object):
     def api(self):
         return api
 
-class HelloMessage(BaseEntity, APIClass):            
-    pass
+class HelloMessage(BaseCompactEntity, APIClass):
+    __slots__ = ('text',)
 
 class Collection(BaseCollection, APIClass):            
     pass
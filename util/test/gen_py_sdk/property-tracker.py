@@ -1,5 +1,5 @@
 
-from rapier.py.base_api import BaseAPI, BaseResource, BaseEntity, BaseCollection
+from rapier.py.base_api import BaseAPI, BaseResource, BaseCompactEntity, BaseCollection
 
 class API(BaseAPI):
     def well_known_URLs(self):
@@ -13,29 +13,29 @@ class APIClass(object):
     def api(self):
         return api
 
-class Bicycle(BaseEntity, APIClass):            
-    pass
+class Bicycle(BaseCompactEntity, APIClass):
+    __slots__ = ('modifier', 'created', 'modified', 'creator', 'owner', 'purchase_date', 'name', 'paint_color')
 
-class Dog(BaseEntity, APIClass):            
-    pass
+class Dog(BaseCompactEntity, APIClass):
+    __slots__ = ('modifier', 'created', 'modified', 'creator', 'birth_date', 'owner', 'fur_color', 'name')
 
-class Collection(BaseEntity, APIClass):            
-    pass
+class Collection(BaseCompactEntity, APIClass):
+    __slots__ = ('items',)
 
-class Person(BaseEntity, APIClass):            
-    pass
+class Person(BaseCompactEntity, APIClass):
+    __slots__ = ('modifier', 'created', 'modified', 'creator', 'name', 'possessions')
 
-class PropertyTracker(BaseEntity, APIClass):            
-    pass
+class PropertyTracker(BaseCompactEntity, APIClass):
+    __slots__ = ('modifier', 'created', 'modified', 'creator', 'bicycles', 'people', 'institutions', 'dogs')
 
-class PersistentResource(BaseEntity, APIClass):            
-    pass
+class PersistentResource(BaseCompactEntity, APIClass):
+    __slots__ = ('modifier', 'created', 'modified', 'creator')
 
-class Resource(BaseEntity, APIClass):            
-    pass
+class Resource(BaseCompactEntity, APIClass):
+    __slots__ = ()
 
-class Institution(BaseEntity, APIClass):            
-    pass
+class Institution(BaseCompactEntity, APIClass):
+    __slots__ = ('modifier', 'created', 'modified', 'creator', 'assets', 'name')
 
 class Collection(BaseCollection, APIClass):            
     pass
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Tests that the language server counts the columns of LSP positions in UTF-16 code units, in diagnostics and in go to definition.
+# usage: test_positions.py
+
+import sys, os, json, shutil, tempfile
+from StringIO import StringIO
+DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DIR, '..', '..'))
+import lsp_rapier, validate_rapier
+
+# U+1F600 is one character, and two UTF-16 code units
+SPEC = u'''title: Positions
+entities:
+  Owner:
+    properties:
+      name:
+        type: string
+  Pet:
+    properties:
+      owner: {description: "\U0001F600\U0001F600", type: string, format: uri, relationship: '#Owner'}
+      name: {description: "\U0001F600", tpye: string}
+'''
+
+def published(output):
+    # the params of each message the server has written
+    messages = []
+    stream = StringIO(output.getvalue())
+    while True:
+        message = lsp_rapier.read_message(stream)
+        if message is None:
+            return messages
+        messages.append(message.get('params'))
+
+def test_columns():
+    line = u'a\U0001F600b'
+    assert lsp_rapier.lsp_position((0, 2), [line]) == {'line': 0, 'character': 3}
+    assert [lsp_rapier.python_column(line, character) for character in range(5)] == [0, 1, 2, 2, 3]
+    assert lsp_rapier.lsp_position((3, 5), [line]) == {'line': 3, 'character': 5}
+
+def test_utf16_positions(directory):
+    filename = os.path.join(directory, 'positions.yaml')
+    uri = lsp_rapier.filename_to_uri(filename)
+    lines = SPEC.splitlines()
+    output = StringIO()
+    server = lsp_rapier.RapierLanguageServer(None, output, 0)
+    server.handle({'method': 'textDocument/didOpen', 'params': {'textDocument': {'uri': uri, 'text': SPEC}}})
+    try:
+        server.validate_documents()
+        diagnostics = [params['diagnostics'] for params in published(output) if params['uri'] == uri][-1]
+        tpye = [diagnostic for diagnostic in diagnostics if 'tpye' in diagnostic['message']][0]
+        assert tpye['range']['start'] == {'line': 9, 'character': lsp_rapier.utf16_length(lines[9][:lines[9].index('tpye')])}
+        assert tpye['range']['start']['character'] == lines[9].index('tpye') + 1
+        # the last character of #Owner, which is two UTF-16 code units further along the line than it is in characters
+        character = lsp_rapier.utf16_length(lines[8][:lines[8].index("#Owner'") + len('#Owner') - 1])
+        server.handle({'jsonrpc': '2.0', 'id': 1, 'method': 'textDocument/definition',
+                       'params': {'textDocument': {'uri': uri}, 'position': {'line': 8, 'character': character}}})
+        response = json.loads(output.getvalue().rsplit('\r\n\r\n', 1)[1])
+        assert response['result'] == {'uri': uri, 'range': {'start': {'line': 2, 'character': 2}, 'end': {'line': 2, 'character': 2}}}, response
+    finally:
+        validate_rapier.open_documents.pop(filename, None)
+
+def main():
+    test_columns()
+    directory = tempfile.mkdtemp()
+    try:
+        test_utf16_positions(directory)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
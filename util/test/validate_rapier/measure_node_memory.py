@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+# Measures the memory of the parsed specs in util/test: the bytes of every object reachable from each parse, counting shared
+# objects once, and the maximum resident set size after holding all of the parses at once.
+# usage: measure_node_memory.py [copies of each parse to hold]
+
+import sys, os, glob, resource
+DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DIR, '..', '..'))
+import validate_rapier
+
+def deep_size(root):
+    # the bytes of root and the objects it holds - the contents of containers, and the attributes and slots of nodes and marks
+    seen = set()
+    size = 0
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.iterkeys())
+            stack.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        if hasattr(obj, '__dict__'):
+            stack.append(obj.__dict__)
+        for cls in type(obj).__mro__:
+            for slot in cls.__dict__.get('__slots__', ()):
+                if hasattr(obj, slot):
+                    stack.append(getattr(obj, slot))
+    return size
+
+def main(args):
+    copies = int(args[0]) if args else 20
+    filenames = sorted(glob.glob(os.path.join(DIR, '..', '*.yaml')))
+    total_content = total_size = 0
+    print '%-30s %10s %12s %8s' % ('spec', 'yaml bytes', 'parse bytes', 'ratio')
+    for filename in filenames:
+        content = validate_rapier.read_spec_file(filename)
+        size = deep_size(validate_rapier.load_marked(content)[0])
+        total_content += len(content)
+        total_size += size
+        print '%-30s %10d %12d %7.1fx' % (os.path.basename(filename), len(content), size, float(size) / len(content))
+    print '%-30s %10d %12d %7.1fx' % ('total', total_content, total_size, float(total_size) / total_content)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    parses = [validate_rapier.load_marked(validate_rapier.read_spec_file(filename))[0] for i in range(copies) for filename in filenames]
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print 'max RSS holding %d parses: %d KB (%d KB before parsing)' % (len(parses), after, before)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+
+# Tests that a spec nested deeper than the recursion limit is loaded and validated, down to its innermost node.
+# usage: test_deep_nesting.py
+
+import sys, os, shutil, tempfile
+DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DIR, '..', '..'))
+import validate_rapier
+
+def test_deeply_nested_property(directory):
+    if validate_rapier.CMarkedLoader is None:
+        return # the composer of the pure-Python loader recurses, so this needs libyaml
+    depth = sys.getrecursionlimit() * 2
+    filename = os.path.join(directory, 'deep.yaml')
+    with open(filename, 'w') as f:
+        f.write('title: Deep\nentities:\n  Deep:\n    properties:\n      nested: ')
+        f.write('{type: array, items: ' * depth + '{type: string, tpye: string}' + '}' * depth + '\n')
+    validator = validate_rapier.OASValidator()
+    validator.quiet = True
+    spec, errors = validator.validate(filename, None)
+    assert errors == 0, validator.transcript
+    assert len(validator.transcript) == 1 and 'unrecognized keyword tpye' in validator.transcript[0], validator.transcript
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        test_deeply_nested_property(directory)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
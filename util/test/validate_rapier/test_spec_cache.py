@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+# Tests of the on-disk SpecCache: a file whose validator comes from the cache is not parsed again.
+# usage: test_spec_cache.py
+
+import sys, os, shutil, tempfile
+DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DIR, '..', '..'))
+import validate_rapier, profiling
+
+def validate(filename):
+    # the messages of validating filename, and the number of spec files parsed to do it
+    profiler = profiling.Profiler()
+    profiling.set_profiler(profiler)
+    try:
+        validator = validate_rapier.OASValidator()
+        validator.quiet = True
+        validator.validate(filename, None)
+    finally:
+        profiling.set_profiler(None)
+    return validator.transcript, profiler.counts.get('spec files parsed', 0)
+
+def edit(filename, text):
+    with open(filename, 'a') as f:
+        f.write('\n' + text)
+
+def test_unchanged_include_is_not_parsed(directory):
+    for name in ('use-common.yaml', 'common.yaml'):
+        shutil.copy(os.path.join(DIR, '..', name), directory)
+    root = os.path.join(directory, 'use-common.yaml')
+    uncached_messages, parsed = validate(root)
+    assert parsed == 2, parsed
+    validate_rapier.set_spec_cache(validate_rapier.SpecCache(os.path.join(directory, 'cache')))
+    try:
+        assert validate(root) == (uncached_messages, 2)
+        assert validate(root) == (uncached_messages, 0)
+        edit(root, '# the root is edited\n')
+        assert validate(root) == (uncached_messages, 1)
+        edit(os.path.join(directory, 'common.yaml'), '# the include is edited\n')
+        assert validate(root) == (uncached_messages, 2)
+    finally:
+        validate_rapier.set_spec_cache(None)
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        test_unchanged_include_is_not_parsed(directory)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
@@ -11,9 +11,21 @@ from yaml.composer import Composer
 from yaml.resolver import Resolver
 from yaml.parser import Parser
 from yaml.constructor import Constructor, BaseConstructor, SafeConstructor
+try:
+    from yaml.cyaml import CParser
+except ImportError:
+    CParser = None
 from urlparse import urlsplit
 from numbers import Number
-import os
+import os, hashlib, tempfile, multiprocessing, itertools, inspect, types
+import cPickle as pickle
+import yaml
+import profiling
+
+class SpecError(Exception):
+    # a spec that cannot be validated or turned into an OpenAPI spec. The main functions of the command line tools exit with its
+    # message, and compiler, which is used in-process, reports it in its result
+    pass
 
 class PresortedList(list):
     def sort(self, *args, **kwargs):
@@ -23,15 +35,57 @@ class PresortedOrderedDict(OrderedDict):
     def items(self, *args, **kwargs):
         return PresortedList(OrderedDict.items(self, *args, **kwargs))
 
+    def __reduce__(self):
+        # create the dict empty and then add the items, so that a dict that contains itself can be pickled
+        return (self.__class__, (), None, None, self.iteritems())
+
+class NodeMark(object):
+    # the line and column, counting from 0, of the start or end of a node in its source - the part of a yaml.Mark that is used
+    __slots__ = ('line', 'column')
+
+    def __init__(self, line, column):
+        self.line = line
+        self.column = column
+
+    def __repr__(self):
+        return 'NodeMark(%s, %s)' % (self.line, self.column)
+
+def pack_mark(mark):
+    # a node keeps its positions as ints, with the line in the high bits and the column in the low 32 bits, rather than the
+    # yaml.Marks of its parse, which each have an attribute dict, the name of the source and a reference to its buffer
+    return mark.line << 32 | mark.column
+
+def unpack_mark(position):
+    return NodeMark(position >> 32, position & 0xFFFFFFFF)
+
 def create_node_class(cls):
     class node_class(cls):
-        def __init__(self, x, start_mark, end_mark):
+        __slots__ = ('start_position', 'end_position')
+
+        def __init__(self, x, start_position, end_position):
             cls.__init__(self, x)
-            self.start_mark = start_mark
-            self.end_mark = end_mark
+            self.start_position = start_position
+            self.end_position = end_position
 
-        def __new__(self, x, start_mark, end_mark):
+        def __new__(self, x, start_position, end_position):
             return cls.__new__(self, x)
+
+        @property
+        def start_mark(self):
+            return unpack_mark(self.start_position)
+
+        @property
+        def end_mark(self):
+            return unpack_mark(self.end_position)
+
+        def __reduce__(self):
+            # create dicts and lists empty and then add the contents, so that a node that contains itself can be pickled
+            if cls is dict:
+                return (node_class, ({}, self.start_position, self.end_position), None, None, self.iteritems())
+            elif cls is list:
+                return (node_class, ([], self.start_position, self.end_position), None, iter(self))
+            else:
+                return (node_class, (cls(self), self.start_position, self.end_position))
     node_class.__name__ = '%s_node' % cls.__name__
     return node_class
 
@@ -47,16 +101,32 @@ class NodeConstructor(SafeConstructor):
     # copies.
     def construct_yaml_map(self, node):
         obj, = SafeConstructor.construct_yaml_map(self, node)
-        return dict_node(obj, node.start_mark, node.end_mark)
+        return dict_node(obj, pack_mark(node.start_mark), pack_mark(node.end_mark))
 
     def construct_yaml_seq(self, node):
-        obj, = SafeConstructor.construct_yaml_seq(self, node)
-        return list_node(obj, node.start_mark, node.end_mark)
+        # yield the list empty and fill it in later, as SafeConstructor does, so that nested nodes are constructed by the loop of
+        # construct_document rather than by recursion
+        data = list_node([], pack_mark(node.start_mark), pack_mark(node.end_mark))
+        yield data
+        data.extend(self.construct_sequence(node))
 
     def construct_yaml_str(self, node):
         obj = SafeConstructor.construct_scalar(self, node)
         assert isinstance(obj, unicode)
-        return unicode_node(obj, node.start_mark, node.end_mark)
+        return unicode_node(obj, pack_mark(node.start_mark), pack_mark(node.end_mark))
+
+    def construct_marked_mapping(self, node):
+        # construct a mapping that keeps the order of its keys, noting keys that occur more than once in duplicate_keys. Like
+        # construct_yaml_seq, the mapping is yielded empty and filled in later, so deeply nested specs do not reach the recursion limit
+        keys = [node_tuple[0].value for node_tuple in node.value]
+        for item, count in Counter(keys).items():
+            if count > 1:
+                key_nodes = [node_tuple[0] for node_tuple in node.value if node_tuple[0].value == item]
+                self.duplicate_keys.append((pack_mark(node.start_mark), '%s occurs %s times, at %s' % (item, count, ' and '.join(['line %s, column %s' % (key_node.start_mark.line + 1, key_node.start_mark.column + 1) for key_node in key_nodes]))))
+        data = PresortedOrderedDict()
+        yield data
+        self.flatten_mapping(node)
+        data.update(self.construct_pairs(node))
 
 NodeConstructor.add_constructor(
         u'tag:yaml.org,2002:map',
@@ -79,12 +149,480 @@ class MarkedLoader(Reader, Scanner, Parser, Composer, NodeConstructor, Resolver)
         Composer.__init__(self)
         SafeConstructor.__init__(self)
         Resolver.__init__(self)
+        self.duplicate_keys = [] # (position of the mapping, message)
+
+MarkedLoader.add_constructor(
+        Resolver.DEFAULT_MAPPING_TAG,
+        NodeConstructor.construct_marked_mapping)
+
+if CParser is not None:
+    class CMarkedLoader(CParser, NodeConstructor, Resolver):
+        # the same as MarkedLoader, but with the reading, scanning, parsing and composing done by libyaml
+        def __init__(self, stream):
+            CParser.__init__(self, stream)
+            SafeConstructor.__init__(self)
+            Resolver.__init__(self)
+            self.duplicate_keys = []
+
+    CMarkedLoader.add_constructor(
+            Resolver.DEFAULT_MAPPING_TAG,
+            NodeConstructor.construct_marked_mapping)
+else:
+    CMarkedLoader = None
+
+def load_marked(stream):
+    # parse a spec, returning its data and the warnings about keys that occur more than once in a mapping
+    if CMarkedLoader is not None:
+        loader = CMarkedLoader(stream)
+        try:
+            node = loader.get_single_node()
+        except yaml.YAMLError:
+            pass # parse again with MarkedLoader, so that the error is reported the way it always has been
+        else:
+            return (loader.construct_document(node) if node is not None else None), duplicate_key_messages(loader)
+    loader = MarkedLoader(stream)
+    return loader.get_single_data(), duplicate_key_messages(loader)
+
+def duplicate_key_messages(loader):
+    # the messages in the order of the mappings in the source, which is the order they were found in before the mappings were
+    # filled in after they were yielded
+    return [message for position, message in sorted(loader.duplicate_keys, key=lambda duplicate: duplicate[0])]
+
+def content_digest(content):
+    return hashlib.sha1(content).hexdigest()
+
+open_documents = dict() # abs filename -> content, for documents being edited that are read instead of the files, like in lsp_rapier
+
+def read_spec_file(abs_filename):
+    content = open_documents.get(abs_filename)
+    if content is None:
+        with open(abs_filename) as f:
+            content = f.read()
+    return content
+
+class SpecCache(object):
+    # an on-disk cache of validated specs. An entry holds the state of an OASValidator after it validated a file, including the
+    # validators of the files it included or referenced, and the content digests of all the files that were read.
+    # An entry is only used while none of those files has changed and the validator code is the same.
+    # A record for each file holds its digest, the files it includes or references, and the file digests of its entries, so that a
+    # SpecGraph need not parse a file whose validator will come from the cache
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def version(self):
+        # changes when this module, yaml or python change, so entries written by other code are not used
+        if not hasattr(self, '_version'):
+            source = os.path.splitext(__file__)[0] + '.py'
+            with open(source) as f:
+                self._version = content_digest('\n'.join([f.read(), __name__, yaml.__version__, sys.version]))
+        return self._version
+
+    def entry_key(self, validator):
+        key = '\n'.join([self.version(), validator.filename, validator.abs_filename, validator.file_digests[validator.abs_filename], str(validator.is_root)])
+        return content_digest(key.encode('utf-8'))
+
+    def entry_path(self, validator):
+        return os.path.join(self.directory, self.entry_key(validator) + '.pickle')
+
+    def get(self, validator):
+        # return the cached state for the validator, or None if there is none or one of the files it read has changed
+        try:
+            with open(self.entry_path(validator), 'rb') as f:
+                state = pickle.load(f)
+        except Exception:
+            return None
+        for filename, digest in state['file_digests'].iteritems():
+            try:
+                current_digest = content_digest(read_spec_file(filename))
+            except IOError:
+                current_digest = None
+            if current_digest != digest:
+                return None
+        return state
+
+    def record_path(self, abs_filename):
+        return os.path.join(self.directory, 'file-' + content_digest('\n'.join([self.version(), abs_filename]).encode('utf-8')) + '.pickle')
+
+    def read_pickle(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            return None
+
+    def write_pickle(self, path, data):
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(temp_path, path)
+        except Exception:
+            pass # the cache is only an optimization
+
+    def read_record(self, abs_filename, digest):
+        # the record of a file with this content digest: {'digest': digest, 'targets': [(abs filename, is_include)] or None,
+        # 'entries': {entry key: file digests}}
+        record = self.read_pickle(self.record_path(abs_filename))
+        if record is None or record['digest'] != digest:
+            record = {'digest': digest, 'targets': None, 'entries': dict()}
+        return record
+
+    def put(self, validator):
+        self.write_pickle(self.entry_path(validator), validator.__getstate__())
+        abs_filename = validator.abs_filename
+        record = self.read_record(abs_filename, validator.file_digests[abs_filename])
+        record['entries'][self.entry_key(validator)] = dict(validator.file_digests)
+        self.write_pickle(self.record_path(abs_filename), record)
+
+    def current_targets(self, abs_filename):
+        # the (abs filename, is_include) pairs of the files that a file includes or references, if the cache has a current entry for
+        # the file - so a SpecGraph need not parse it - or None
+        digests = dict()
+        def current_digest(filename):
+            if filename not in digests:
+                try:
+                    digests[filename] = content_digest(read_spec_file(filename))
+                except IOError:
+                    digests[filename] = None
+            return digests[filename]
+        record = self.read_pickle(self.record_path(abs_filename))
+        if record is None or record['targets'] is None or record['digest'] != current_digest(abs_filename):
+            return None
+        for key, file_digests in record['entries'].iteritems():
+            if all(current_digest(filename) == digest for filename, digest in file_digests.iteritems()) and \
+                    os.path.exists(os.path.join(self.directory, key + '.pickle')):
+                return record['targets']
+        return None
+
+    def put_targets(self, abs_filename, digest, targets):
+        record = self.read_record(abs_filename, digest)
+        if record['targets'] != targets:
+            record['targets'] = targets
+            self.write_pickle(self.record_path(abs_filename), record)
+
+class MemorySpecCache(SpecCache):
+    # a cache of validated specs for a long-running process, like rapier --watch. The state of each validator is kept in memory as it
+    # is, not copied, so a validator that gets its state from the cache shares the parsed and validated spec with the validator that
+    # put it there. That is safe because validation of a spec is complete when it is put in the cache, and generators do not change
+    # the spec. The digest of each file is only computed again when its modification time or size changes
+
+    def __init__(self):
+        self.entries = dict() # (filename, abs filename, is_root) -> (file digests, validator state)
+        self.targets = dict() # abs filename -> (content digest, [(abs filename, is_include)])
+        self.stats = dict() # abs filename -> ((mtime, size), content digest)
+
+    def file_digest(self, abs_filename):
+        if abs_filename in open_documents:
+            return content_digest(open_documents[abs_filename])
+        try:
+            stat = os.stat(abs_filename)
+        except OSError:
+            return None
+        stat_key = (stat.st_mtime, stat.st_size)
+        known = self.stats.get(abs_filename)
+        if known is not None and known[0] == stat_key:
+            return known[1]
+        try:
+            with open(abs_filename) as f:
+                digest = content_digest(f.read())
+        except IOError:
+            return None
+        self.stats[abs_filename] = (stat_key, digest)
+        return digest
+
+    def is_current(self, file_digests):
+        return all(self.file_digest(filename) == digest for filename, digest in file_digests.iteritems())
+
+    def get(self, validator):
+        entry = self.entries.get((validator.filename, validator.abs_filename, validator.is_root))
+        if entry is None:
+            return None
+        file_digests, state = entry
+        if file_digests[validator.abs_filename] != validator.file_digests[validator.abs_filename] or not self.is_current(file_digests):
+            return None
+        return dict(state)
+
+    def put(self, validator):
+        self.entries[(validator.filename, validator.abs_filename, validator.is_root)] = (dict(validator.file_digests), validator.__getstate__())
+
+    def current_targets(self, abs_filename):
+        targets = self.targets.get(abs_filename)
+        if targets is None or self.file_digest(abs_filename) != targets[0]:
+            return None
+        for (filename, entry_abs_filename, is_root), (file_digests, state) in self.entries.iteritems():
+            if entry_abs_filename == abs_filename and self.is_current(file_digests):
+                return targets[1]
+        return None
+
+    def put_targets(self, abs_filename, digest, targets):
+        self.targets[abs_filename] = (digest, targets)
+
+    def watched_files(self):
+        # the files read for any entry - the files a long-running process should watch
+        return set(filename for file_digests, state in self.entries.itervalues() for filename in file_digests)
+
+_spec_cache = None
+
+def set_spec_cache(cache):
+    # use this cache instead of the one named by RAPIER_CACHE_DIR. Pass None to go back to RAPIER_CACHE_DIR
+    global _spec_cache
+    _spec_cache = cache
+
+def spec_cache():
+    # the cache set by set_spec_cache, if any. Otherwise a cache is used only if the RAPIER_CACHE_DIR environment variable names a
+    # directory for it
+    if _spec_cache is not None:
+        return _spec_cache
+    directory = os.environ.get('RAPIER_CACHE_DIR')
+    return SpecCache(directory) if directory else None
+
+INCLUDE_KEYWORDS = ('$ref', 'collectionResource', 'errorResponse')
+
+def spec_urls(node):
+    # the URLs in a parsed spec of entities or schemas it includes or references, as (url, is_include, value) triples in the order
+    # they occur, where value is the string the URL was found in. What is still to be searched is kept on a stack, in reverse
+    # order, rather than searched by recursion: a node with its parent key, or a list of URLs found that come next
+    urls = []
+    stack = [(node, None, None)]
+    while stack:
+        node, parent_key, found = stack.pop()
+        if found is not None:
+            urls.extend(found)
+        elif hasattr(node, 'keys'):
+            nested = []
+            for key, value in node.iteritems():
+                if isinstance(value, basestring) and key in INCLUDE_KEYWORDS:
+                    nested.append((None, None, [(value, True, value)]))
+                elif isinstance(value, basestring) and (key == 'relationship' or (key == 'entities' and parent_key == 'relationship')):
+                    nested.append((None, None, [(url, False, value) for url in value.split()]))
+                elif isinstance(value, list) and key == 'entities' and parent_key == 'relationship':
+                    nested.append((None, None, [(url, False, url) for url in value if isinstance(url, basestring)]))
+                else:
+                    nested.append((value, key, None))
+            stack.extend(reversed(nested))
+        elif isinstance(node, list):
+            stack.extend(reversed([(item, parent_key, None) for item in node]))
+    return urls
+
+def load_spec_file(abs_filename):
+    # read and parse a spec file for a SpecGraph. This runs in a pool process, so the result is pickled.
+    # Files that cannot be read or parsed are left for the validator, so that it reports the problem the way it always has
+    try:
+        content = read_spec_file(abs_filename)
+        data, duplicate_key_messages = load_marked(content)
+    except Exception:
+        return abs_filename, None
+    return abs_filename, (content, data, duplicate_key_messages)
+
+class SpecGraph(object):
+    # the spec files that a spec includes or references, directly or indirectly. Before validation starts, the files are found and
+    # parsed one level at a time. Sending a parse back from a pool process costs about as much as parsing it, and starting the pool
+    # costs more than parsing the specs of a typical API, so the files are parsed in this process unless more processes are asked
+    # for, when the files of each level are parsed in parallel in a process pool. Each validator then takes the parse of
+    # its file from the graph instead of reading and parsing the file itself.
+    # The graph also keeps the validators that are part-way through validation, so that a spec that refers back to a file that is
+    # being validated uses that file's validator, rather than validating the file again and again without end.
+    # Files that the cache has a current entry for are not parsed, since their validators will come from the cache
+
+    default_processes = 1 # the number of parsing processes when none is given, or None for one per processor
+
+    def __init__(self, abs_directoryname, processes=None, cache=None):
+        self.abs_directoryname = abs_directoryname # validators resolve the URLs in every spec of the graph against this directory
+        if processes is None:
+            processes = SpecGraph.default_processes if SpecGraph.default_processes is not None else multiprocessing.cpu_count()
+        self.processes = processes
+        self.cache = cache
+        self.loaded = dict() # abs filename -> (content, data, duplicate_key_messages) for files not yet taken by a validator
+        self.includes = dict() # abs filename -> abs filenames it includes, in the order they occur
+        self.validators_in_progress = dict()
+
+    def abs_filename(self, url):
+        return os.path.abspath(os.path.join(self.abs_directoryname, url.split('#')[0]))
+
+    def load(self, abs_filename, content, parsed=None):
+        # find and parse the spec files reachable from the spec with this filename and content. parsed, if given, is what
+        # load_marked(content) returned
+        self.root = abs_filename
+        if parsed is None:
+            parsed = load_marked(content)
+            profiling.count('spec files parsed')
+        data, duplicate_key_messages = parsed
+        self.loaded[abs_filename] = (content, data, duplicate_key_messages)
+        seen = {abs_filename}
+        frontier = [abs_filename]
+        cached = dict() # abs filename -> targets, for the files that are not parsed because the cache has a current entry for them
+        pool = None
+        try:
+            while frontier:
+                next_frontier = []
+                for filename in frontier:
+                    targets = cached.get(filename)
+                    if targets is None:
+                        loaded = self.loaded.get(filename)
+                        if loaded is None:
+                            continue
+                        targets = [(self.abs_filename(url), is_include) for url, is_include, value in spec_urls(loaded[1]) if url.split('#')[0]]
+                        if self.cache is not None:
+                            self.cache.put_targets(filename, content_digest(loaded[0]), targets)
+                    self.includes[filename] = []
+                    for target, is_include in targets:
+                        if is_include and target not in self.includes[filename]:
+                            self.includes[filename].append(target)
+                        if target not in seen:
+                            seen.add(target)
+                            next_frontier.append(target)
+                to_load = []
+                for filename in next_frontier:
+                    targets = self.cache.current_targets(filename) if self.cache is not None else None
+                    if targets is not None:
+                        cached[filename] = targets
+                    else:
+                        to_load.append(filename)
+                if len(to_load) > 1 and self.processes > 1:
+                    if pool is None:
+                        pool = multiprocessing.Pool(self.processes)
+                    results = pool.map(load_spec_file, to_load)
+                else:
+                    results = map(load_spec_file, to_load)
+                profiling.count('spec files parsed', len(to_load))
+                for filename, loaded in results:
+                    if loaded is not None:
+                        self.loaded[filename] = loaded
+                frontier = next_frontier
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def take(self, abs_filename):
+        # the (content, data, duplicate_key_messages) of a file, or None if it has not been loaded. Validation changes the data,
+        # so each parse is given out only once
+        return self.loaded.pop(abs_filename, None)
+
+    def include_cycles(self):
+        # each cycle of files that include one another, as a list of filenames that starts and ends with the same file
+        cycles = []
+        done = set()
+        def visit(filename, path):
+            path.append(filename)
+            for target in self.includes.get(filename, []):
+                if target in path:
+                    cycles.append(path[path.index(target):] + [target])
+                elif target not in done:
+                    visit(target, path)
+            path.pop()
+            done.add(filename)
+        visit(self.root, [])
+        return cycles
+
+class KeywordSuggestions(object):
+    # The keywords of one keyword table, arranged so that the keywords similar to an unrecognized key are found without running
+    # SequenceMatcher against every one of them. SequenceMatcher.ratio() is 2*M/T, where M is the number of matching characters and
+    # T the length of the two strings together. M is no bigger than the shorter string, nor than the number of characters the two
+    # strings have in common, so keywords ruled out by either of those are skipped without changing the result
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        self.size = len(self.keywords)
+        self.positions_by_length = dict()
+        for position, keyword in enumerate(self.keywords):
+            self.positions_by_length.setdefault(len(keyword), []).append(position)
+        self.characters = [Counter(keyword) for keyword in self.keywords]
+        self.suggestions = OrderedDict() # memo for similar_keywords, least recently used first
+
+    max_suggestions = 256 # the number of keys whose suggestions are remembered
+
+    def similar_keywords(self, key, ratio, max_candidates=None):
+        memo_key = (key, ratio, max_candidates)
+        result = self.suggestions.pop(memo_key, None)
+        if result is None:
+            result = self.find_similar_keywords(key, ratio, max_candidates)
+            if len(self.suggestions) >= self.max_suggestions:
+                self.suggestions.popitem(last=False)
+        self.suggestions[memo_key] = result
+        return result
+
+    def find_similar_keywords(self, key, ratio, max_candidates):
+        key_length = len(key)
+        key_characters = Counter(key)
+        candidates = []
+        for length, positions in self.positions_by_length.iteritems():
+            total = key_length + length
+            if 2.0 * min(key_length, length) / total > ratio:
+                for position in positions:
+                    bound = 2.0 * sum((key_characters & self.characters[position]).itervalues()) / total
+                    if bound > ratio:
+                        candidates.append((bound, position))
+        if max_candidates is not None and len(candidates) > max_candidates:
+            # only compare the key with the keywords most likely to be similar to it
+            candidates.sort(key=lambda candidate: -candidate[0])
+            del candidates[max_candidates:]
+        keywords = [self.keywords[position] for position in sorted(position for bound, position in candidates)]
+        return [keyword for keyword in keywords if SequenceMatcher(None, key, keyword).ratio() > ratio]
+
+def timed_keyword_validator(function, profiler):
+    # the keyword validator function, timed by profiler if there is one
+    if profiler is None:
+        return function
+    timed = profiler.timed_keywords.get(function)
+    if timed is None:
+        timed = profiler.timed_keywords[function] = (profiler.timed_keyword_generator if inspect.isgeneratorfunction(function) else
+                                                     profiler.timed_keyword)(function.__name__, function)
+    return timed
+
+keyword_suggestions = [] # [keyword table, its KeywordSuggestions] for each keyword table that has had an unrecognized keyword
+
+def keyword_suggestions_for(keyword_validators):
+    # the tables are dicts, so they are found by identity rather than hashed. There are only a few of them
+    for index, (table, suggestions) in enumerate(keyword_suggestions):
+        if table is keyword_validators:
+            if suggestions.size != len(keyword_validators):
+                # the table has had keywords added since
+                suggestions = keyword_suggestions[index][1] = KeywordSuggestions(keyword_validators.iterkeys())
+            return suggestions
+    suggestions = KeywordSuggestions(keyword_validators.iterkeys())
+    keyword_suggestions.append([keyword_validators, suggestions])
+    return suggestions
+
+class URIIndex(object):
+    # The entities of a root spec and of every spec it loads, by absolute URI. It is built once validation is complete, so that
+    # resolving an entity URI is one lookup rather than a search through the validators of the included and referenced specs.
+    # An entity found by both searches is the one the search would find first - depth first through the included specs, and the
+    # spec's own entities before those of the specs it references
+
+    def __init__(self, validator):
+        self.included_entities = dict()
+        for included_validator in validator.included_validators():
+            for uri in itertools.chain(included_validator.entities, included_validator.included_entities):
+                if uri not in self.included_entities:
+                    entity = included_validator.entities.get(uri) or included_validator.included_entities.get(uri)
+                    if entity is not None:
+                        self.included_entities[uri] = entity
+        self.referenced_entities = dict()
+        for referenced_validator in itertools.chain([validator], validator.referenced_spec_validators.itervalues()):
+            for uri, entity in referenced_validator.entities.iteritems():
+                if entity is not None:
+                    self.referenced_entities.setdefault(uri, entity)
 
 class OASValidator(object):
 
+    quiet = False # True to keep messages out of stderr. They are still in transcript and diagnostics
+    processes = None # the number of processes that parse the files a root spec loads, or None for SpecGraph.default_processes
+
     def __init__(self):
         self.errors = 0
+        self.transcript = [] # the messages output while validating, to be output again when the result comes from the cache
+        self.diagnostics = [] # the messages reported while validating, by this validator and the ones it used, as in diagnostic()
+        self.file_digests = dict() # the content digest of each file read while validating, or None if it could not be read
+        self.spec_graph = None
+        self.abs_urls = dict() # memo for abs_url
+        self.uri_index = None # set on the validator of the root spec once everything it loads has been validated
         self.similarity_ratio = 0.7
+        self.suggestion_skip_prefixes = () # unrecognized keywords with these prefixes, like 'x-', get no suggestions
+        self.max_suggestion_candidates = None # the most keywords to compare with each unrecognized keyword, or None for no limit
         self.checked_id_uniqueness = False
         self.validated_nodes = set()
         self.included_spec_validators = dict()
@@ -117,10 +655,10 @@ class OASValidator(object):
             
     def validate_entities(self, node, key, entities):
         for key, entity in entities.iteritems():
-            self.check_and_validate_keywords(self.__class__.entity_keywords, entity, key)
+            yield self.__class__.entity_keywords, entity, key
 
     def validate_conventions(self, node, key, conventions):
-        self.check_and_validate_keywords(self.__class__.conventions_keywords, conventions, key)
+        yield self.__class__.conventions_keywords, conventions, key
 
     def validate_query_paths(self, node, key, query_paths):
         if isinstance(query_paths, basestring):
@@ -188,7 +726,8 @@ class OASValidator(object):
     
     def validate_properties(self, node, key, properties):
         if properties is None:
-            return self.error('properties value must be a map, not null', key)
+            self.error('properties value must be a map, not null', key)
+            return
         for property_name, property in properties.iteritems():
             if hasattr(property, 'keys'):
                 p_type = property.get('type')
@@ -200,7 +739,7 @@ class OASValidator(object):
                         self.error('items must be only be present if the type is array: %s' % property, property_name)
             else:
                 self.error('property must be a map: %s' % property, property_name)
-            self.check_and_validate_keywords(self.__class__.property_keywords, property, property_name)
+            yield self.__class__.property_keywords, property, property_name
 
     def validate_readOnly(self, node, key, readOnly):
         if not (readOnly is True or readOnly is False) :
@@ -226,33 +765,66 @@ class OASValidator(object):
         if isinstance(error_response, basestring):
             self.validate_included_entity_url(error_response, key)
         elif hasattr(error_response, 'keys'):
-            self.check_and_validate_keywords(self.__class__.schema_keywords, error_response, key)
+            yield self.__class__.schema_keywords, error_response, key
         else:
             self.error('errorResponse must be URL of entity or schema: %s' % error_response, key)
 
     def similar(self, a, b):
         return SequenceMatcher(None, a, b).ratio() > self.similarity_ratio
+
+    def similar_keywords(self, key, keyword_validators):
+        if not isinstance(key, basestring):
+            return [keyword for keyword in keyword_validators.iterkeys() if self.similar(key, keyword)]
+        if key.startswith(self.suggestion_skip_prefixes):
+            return []
+        return keyword_suggestions_for(keyword_validators).similar_keywords(key, self.similarity_ratio, self.max_suggestion_candidates)
     
+    def unrecognized_keyword(self, key, keyword_validators):
+        similar_keywords = self.similar_keywords(key, keyword_validators)
+        message = 'unrecognized keyword %s' % key
+        if similar_keywords:
+            message += ' - did you mean %s?' % ' or '.join(similar_keywords)
+        self.info(message, key)
+
     def check_and_validate_keywords(self, keyword_validators, node, node_key):
+        # validate a node and the nodes nested in it. Keyword validators that validate nested nodes are generators that yield a
+        # (keyword table, node, node key) for each of them. The nodes being validated are kept on a stack rather than validated by
+        # recursion, so that deeply nested specs do not reach the recursion limit
+        profiler = profiling.profiler()
+        stack = [self.validate_node_keywords(keyword_validators, node, node_key, profiler)]
+        while stack:
+            task = next(stack[-1], None)
+            if task is None:
+                stack.pop()
+            else:
+                stack.append(self.validate_node_keywords(task[0], task[1], task[2], profiler))
+
+    def validate_node_keywords(self, keyword_validators, node, node_key, profiler):
+        # validate the keywords of one node, yielding the (keyword table, node, node key) of each node nested in it
+        if profiler is not None:
+            profiler.count('nodes visited')
         if hasattr(node, 'keys'):
             if id(node) not in self.validated_nodes:
                 self.validated_nodes.add(id(node))
                 if '$ref' in node:
                     ref_key = [key for key in node.iterkeys() if key == '$ref'][0]
-                    resolved_node = keyword_validators[key](self, node, ref_key, node['$ref']) 
+                    resolved_node = timed_keyword_validator(keyword_validators[key], profiler)(self, node, ref_key, node['$ref'])
+                    if isinstance(resolved_node, types.GeneratorType):
+                        for task in resolved_node:
+                            yield task
+                        resolved_node = None
                     node['$ref'] = self.abs_url(node['$ref'])
                     if node is not None:
                         node['resolved_node'] = resolved_node
                 else:
                     for key, value in node.iteritems():
                         if key not in keyword_validators:
-                            similar_keywords = [keyword for keyword in keyword_validators.iterkeys() if self.similar(key, keyword)]
-                            message = 'unrecognized keyword %s' % key
-                            if similar_keywords:
-                                message += ' - did you mean %s?' % ' or '.join(similar_keywords)
-                            self.info(message, key)
+                            self.unrecognized_keyword(key, keyword_validators)
                         else:
-                            keyword_validators[key](self, node, key, value)        
+                            result = timed_keyword_validator(keyword_validators[key], profiler)(self, node, key, value)
+                            if isinstance(result, types.GeneratorType):
+                                for task in result:
+                                    yield task
         else:
             self.error('node must be a map: %s' % node, node_key)
 
@@ -278,14 +850,14 @@ class OASValidator(object):
         if hasattr(relationship, 'keys'):
             if relationship.get('entities') is None:
               self.error('relationship must have property "entities"', key)
-            self.check_and_validate_keywords(self.__class__.relationship_keywords, relationship, key)
+            yield self.__class__.relationship_keywords, relationship, key
         elif isinstance(relationship, basestring):
             self.validate_relationship_entities(node, key, relationship)
         else:
             self.error('relationship must be a string or a map %s' % relationship)        
             
     def validate_property_items(self, node, key, items):
-        self.check_and_validate_keywords(self.__class__.property_keywords, items, key)
+        yield self.__class__.property_keywords, items, key
         
     def validate_relationship_entities(self, node, key, entities):
         if isinstance(entities, basestring):
@@ -368,23 +940,27 @@ class OASValidator(object):
 
     def validate_query_parameters(self, node, key, query_parameters):
         if not hasattr(query_parameters, 'keys'):
-            return self.error('queryParameters must be a map: %s' % query_parameters, key)
+            self.error('queryParameters must be a map: %s' % query_parameters, key)
+            return
         names = set()
         for param_name, query_parameter in query_parameters.iteritems():
-            self.check_and_validate_keywords(self.__class__.query_parameter_keywords, query_parameter, key)
+            yield self.__class__.query_parameter_keywords, query_parameter, key
             if not isinstance(param_name, basestring):
                 self.error('name must be a string: %s' % name, param_name)
 
     def validate_uri_templates(self, node, key, url_templates):
         if isinstance(url_templates, basestring):
             for template_string in url_templates.split():
-                self.validate_url_template(node, key, {"template": template_string})
+                for task in self.validate_url_template(node, key, {"template": template_string}):
+                    yield task
         elif isinstance(url_templates, list):
             for url_template in url_templates:
                 template = {"template": template_string} if isinstance(url_template, basestring) else url_template
-                self.validate_url_template(node, key, template)
+                for task in self.validate_url_template(node, key, template):
+                    yield task
         else:
-            self.validate_url_template(node, key, url_templates)
+            for task in self.validate_url_template(node, key, url_templates):
+                yield task
             
     def validate_url_template(self, node, key, url_template):
         if hasattr(url_template, 'keys'):
@@ -401,7 +977,7 @@ class OASValidator(object):
             if template_variables is not None:
                 if hasattr(template_variables, 'keys'):
                     for var_name, var in template_variables.iteritems():
-                        self.check_and_validate_keywords(self.__class__.template_variable_keywords, var, var_name)
+                        yield self.__class__.template_variable_keywords, var, var_name
                 else:
                     self.error('`variable` property of URI template must be a map: %s' % template_variables)
         elif isinstance(consumes, list):
@@ -412,7 +988,8 @@ class OASValidator(object):
                 self.error('relationship consumes must be a list, string or relationship_consumes object: %s' % consumes, key)
 
     def validate_relationship_query_parameters(self, node, key, query_parameters):
-        self.validate_query_parameters(node, key, query_parameters)
+        for task in self.validate_query_parameters(node, key, query_parameters):
+            yield task
         multiplicity = node.get('multiplicity')
         upperbound = 0
         if multiplicity:
@@ -437,42 +1014,42 @@ class OASValidator(object):
     def validate_schema_allOf(self, node, key, value):
         if isinstance(value, list):
             for one in value:
-                self.check_and_validate_keywords(self.__class__.schema_keywords, one, key)
+                yield self.__class__.schema_keywords, one, key
         else:
             self.error('allOf value must be a list: %s' % value, key)
                                     
     def validate_schema_oneOf(self, node, key, value):
         if isinstance(value, list):
             for one in value:
-                self.check_and_validate_keywords(self.__class__.schema_keywords, one, key)
+                yield self.__class__.schema_keywords, one, key
         else:
             self.error('oneOf value must be a list: %s' % value, key)
                                     
     def validate_entity_allOf(self, node, key, value):
         if isinstance(value, list):
             for one in value:
-                self.check_and_validate_keywords(self.__class__.entity_keywords, one, key)
+                yield self.__class__.entity_keywords, one, key
         else:
             self.error('allOf value must be a list: %s' % value, key)
                                     
     def validate_entity_oneOf(self, node, key, value):
         if isinstance(value, list):
             for one in value:
-                self.check_and_validate_keywords(self.__class__.entity_keywords, one, key)
+                yield self.__class__.entity_keywords, one, key
         else:
             self.error('oneOf value must be a list: %s' % value, key)
                                     
     def validate_query_parameter_allOf(self, node, key, value):
         if isinstance(value, list):
             for one in value:
-                self.check_and_validate_keywords(self.__class__.schema_keywords, one, key)
+                yield self.__class__.schema_keywords, one, key
         else:
             self.error('allOf value must be a list: %s' % value, key)
                                     
     def validate_query_parameter_oneOf(self, node, key, value):
         if isinstance(value, list):
             for one in value:
-                self.check_and_validate_keywords(self.__class__.schema_keywords, one, key)
+                yield self.__class__.schema_keywords, one, key
         else:
             self.error('oneOf value must be a list: %s' % value, key)
                                     
@@ -496,7 +1073,7 @@ class OASValidator(object):
 
     def validate_implementation_private_information(self, node, key, entities):
         for key, entity in entities.iteritems():
-            self.check_and_validate_keywords(self.__class__.implementation_private_keywords, entity, key)
+            yield self.__class__.implementation_private_keywords, entity, key
 
     def validate_permalink_template_template(self, node, key, template):
         formatter = string.Formatter()
@@ -584,7 +1161,7 @@ class OASValidator(object):
 
     def validate_additional_properties(self, node, key, additional_properties):
         if hasattr(additional_properties, 'keys'):
-            self.check_and_validate_keywords(self.__class__.property_keywords, additional_properties, None)
+            yield self.__class__.property_keywords, additional_properties, None
         elif additional_properties is not False:
             self.error('additionalProperties must be false or a schema: %s' % additional_properties, key)
 
@@ -716,12 +1293,15 @@ class OASValidator(object):
         'permalinkTemplate': validate_uri_templates}
 
     def abs_url(self, url):
-        split_url = url.split('#')
-        if split_url[0] == '':
-            split_url[0] = self.abs_filename
-        else:
-            split_url[0] = os.path.abspath(os.path.join(self.abs_directoryname, split_url[0]))
-        return '#'.join(split_url)
+        result = self.abs_urls.get(url)
+        if result is None:
+            split_url = url.split('#')
+            if split_url[0] == '':
+                split_url[0] = self.abs_filename
+            else:
+                split_url[0] = os.path.abspath(os.path.join(self.abs_directoryname, split_url[0]))
+            result = self.abs_urls[url] = '#'.join(split_url)
+        return result
             
     def relative_url(self, uri_ref):
         split_ref = uri_ref.split('#')
@@ -739,9 +1319,19 @@ class OASValidator(object):
             return self, None
         else:
             if abs_namespace_url not in validators:
+                validator = self.spec_graph.validators_in_progress.get(abs_namespace_url) if self.spec_graph else None
+                if validator is not None:
+                    # the file refers back to a file that is still being validated. Its validator is not recorded in validators,
+                    # so that following validators from file to file still comes to an end
+                    return validator, None
                 validator = OASValidator()
+                validator.spec_graph = self.spec_graph
+                validator.quiet = self.quiet
                 rel_spec_url = entity_url.split('#')[0]
                 spec, errors = validator.validate(rel_spec_url, self.abs_directoryname)
+                self.transcript.extend(validator.transcript)
+                self.diagnostics.extend(validator.diagnostics)
+                self.file_digests.update(validator.file_digests)
                 if spec is None:
                     return None, errors
                 if errors > 0:
@@ -799,7 +1389,10 @@ class OASValidator(object):
             self.included_entities[abs_url] = entity
         return abs_url, entity
 
-    def validate(self, filename, abs_base_directory):
+    def validate(self, filename, abs_base_directory, content=None, parsed=None):
+        # content, if given, is validated instead of the content of the file. The file need not exist, but the URLs in the spec
+        # are resolved relative to it. parsed, if given with content, is what load_marked(content) returned, so that a caller that
+        # has parsed the content already does not have it parsed again. Validation changes the parsed data
         self.filename = filename
         if abs_base_directory != None:
             self.abs_directoryname = abs_base_directory
@@ -807,12 +1400,50 @@ class OASValidator(object):
         else:
             self.abs_filename = os.path.abspath(filename)
             self.abs_directoryname = os.path.dirname(self.abs_filename)
+        self.abs_urls = dict()
+        graph = self.spec_graph
+        self.is_root = graph is None # the validator of a spec that is not included or referenced by another also reports on the others
+        loaded = graph.take(self.abs_filename) if graph is not None else None
+        if loaded is not None:
+            content = loaded[0]
+        elif content is None:
+            try:
+                content = read_spec_file(self.abs_filename)
+            except IOError as e:
+                self.file_digests[self.abs_filename] = None
+                self.error('unable to open file: %s' % filename)
+                return None, e
+        self.file_digests[self.abs_filename] = content_digest(content)
+        cache = spec_cache()
+        if cache is not None:
+            state = cache.get(self)
+            if state is not None:
+                self.__dict__.update(state)
+                if not self.quiet:
+                    for line in self.transcript:
+                        print >> sys.stderr, line
+                return self.rapier_spec, self.errors
         try:
-            with open(self.abs_filename) as f:
-                self.rapier_spec = self.marked_load(f.read())
-        except IOError as e:
-            self.error('unable to open file: %s' % filename)
-            return None, e
+            if self.is_root:
+                # find and parse the specs this one includes or references first
+                self.spec_graph = graph = SpecGraph(self.abs_directoryname, self.processes, cache)
+                with profiling.phase('load yaml'):
+                    graph.load(self.abs_filename, content, parsed)
+                loaded = graph.take(self.abs_filename)
+            if loaded is not None:
+                content, self.rapier_spec, duplicate_key_messages = loaded
+                for message in duplicate_key_messages:
+                    self.warning(message)
+            else:
+                self.rapier_spec = self.marked_load(content)
+        except yaml.YAMLError as e:
+            # the file is not YAML - note which file, for callers of an included spec's validator to report it
+            if not hasattr(e, 'filename'):
+                e.filename = self.abs_filename
+            raise
+        if self.is_root:
+            for cycle in graph.include_cycles():
+                self.warning('files include each other: %s' % ' -> '.join([os.path.relpath(filename, self.abs_directoryname) for filename in cycle]))
         if self.rapier_spec is None:
             return None
         if not hasattr(self.rapier_spec, 'keys'):
@@ -847,9 +1478,28 @@ class OASValidator(object):
                     entity['name'] = entity_name
                 if 'id' not in entity:
                     entity['id'] = self.abs_url('#%s' % entity_name)
-        self.check_and_validate_keywords(self.__class__.rapier_spec_keywords, self.rapier_spec, None)
+        graph.validators_in_progress[self.abs_filename] = self
+        try:
+            with profiling.phase('validate keywords'):
+                self.check_and_validate_keywords(self.__class__.rapier_spec_keywords, self.rapier_spec, None)
+        finally:
+            graph.validators_in_progress.pop(self.abs_filename, None)
+        if self.is_root:
+            graph.loaded.clear()
+            with profiling.phase('index entities'):
+                self.uri_index = URIIndex(self)
+        if cache is not None:
+            cache.put(self)
         return self.rapier_spec, self.errors
 
+    def __getstate__(self):
+        # the spec graph is only used during validation, and is not part of a cached result. Whether messages are printed is up
+        # to the validator that gets the state
+        state = self.__dict__.copy()
+        state['spec_graph'] = None
+        state.pop('quiet', None)
+        return state
+
     def build_included_entity_map(self):
         result = {}
         result.update(self.entities)
@@ -858,6 +1508,13 @@ class OASValidator(object):
             result.update(validator.included_entities)
         return result
 
+    def included_validators(self):
+        # this validator and the validators of the specs it includes, directly or indirectly, depth first
+        yield self
+        for validator in self.included_spec_validators.itervalues():
+            for included_validator in validator.included_validators():
+                yield included_validator
+
     def included_entity_iteritems(self):
         for item in self.included_entities.iteritems():
             yield item
@@ -867,6 +1524,8 @@ class OASValidator(object):
 
     def resolve_included_entity(self, uri):
         abs_uri = self.abs_url(uri)
+        if self.uri_index is not None:
+            return self.uri_index.included_entities.get(abs_uri)
         result = self.entities.get(abs_uri) or self.included_entities.get(abs_uri)
         if result is None:
             for validator in self.included_spec_validators.itervalues():
@@ -877,6 +1536,8 @@ class OASValidator(object):
     
     def resolve_referenced_entity(self, uri):
         abs_uri = self.abs_url(uri)
+        if self.uri_index is not None:
+            return self.uri_index.referenced_entities.get(abs_uri)
         result = self.entities.get(abs_uri)
         if result is None:
             for validator in self.referenced_spec_validators.itervalues():
@@ -898,47 +1559,59 @@ class OASValidator(object):
         return self.resolve_included_entity(uri)['name']
 
     def marked_load(self, stream):
-        def construct_mapping(loader, node):
-            keys = [node_tuple[0].value for node_tuple in node.value]
-            for item, count in Counter(keys).items():
-                if count > 1:
-                    key_nodes = [node_tuple[0] for node_tuple in node.value if node_tuple[0].value == item]
-                    self.warning('%s occurs %s times, at %s' % (item, count, ' and '.join(['line %s, column %s' % (key_node.start_mark.line + 1, key_node.start_mark.column + 1) for key_node in key_nodes])))            
-            loader.flatten_mapping(node)
-            return PresortedOrderedDict(loader.construct_pairs(node))
-        MarkedLoader.add_constructor(
-            Resolver.DEFAULT_MAPPING_TAG,
-            construct_mapping)
-        return MarkedLoader(stream).get_single_data()
+        data, duplicate_key_messages = load_marked(stream)
+        for message in duplicate_key_messages:
+            self.warning(message)
+        return data
         
     def fatal_error(self, message, key_node=None):
+        self.diagnostics.append(self.diagnostic('FATAL ERROR', message, key_node))
         message = ' '. join(['FATAL ERROR -', message, 'in', self.filename])
         if key_node and hasattr(key_node, 'start_mark'):
             message += ' after line %s column %s to line %s column %s' % (key_node.start_mark.line + 1, key_node.start_mark.column + 1, key_node.end_mark.line + 1, key_node.end_mark.column + 1)
-        sys.exit(message)
+        raise SpecError(message)
 
     def error(self, message, key_node=None):
         self.errors += 1
+        self.diagnostics.append(self.diagnostic('ERROR', message, key_node))
         if key_node and hasattr(key_node, 'start_mark'):
             message += ' after line %s column %s to line %s column %s' % (key_node.start_mark.line + 1, key_node.start_mark.column + 1, key_node.end_mark.line + 1, key_node.end_mark.column + 1)
-        print >> sys.stderr, ' '. join(['ERROR -', message, 'in', self.filename])
+        self.output(' '. join(['ERROR -', message, 'in', self.filename]))
 
     def warning(self, message, key_node=None):
+        self.diagnostics.append(self.diagnostic('WARNING', message, key_node))
         if key_node and hasattr(key_node, 'start_mark'):
             message += ' after line %s column %s to line %s column %s' % (key_node.start_mark.line + 1, key_node.start_mark.column + 1, key_node.end_mark.line + 1, key_node.end_mark.column + 1)
-        print >> sys.stderr, ' '. join(['WARNING -', message, 'in', self.filename])
+        self.output(' '. join(['WARNING -', message, 'in', self.filename]))
 
     def info(self, message, key_node=None):
+        self.diagnostics.append(self.diagnostic('INFO', message, key_node))
         if key_node and hasattr(key_node, 'start_mark'):
             message += ' after line %s column %s to line %s column %s' % (key_node.start_mark.line + 1, key_node.start_mark.column + 1, key_node.end_mark.line + 1, key_node.end_mark.column + 1)
-        print >> sys.stderr, ' '. join(['INFO -', message, 'in', self.filename])
+        self.output(' '. join(['INFO -', message, 'in', self.filename]))
+
+    def diagnostic(self, severity, message, key_node):
+        # (severity, message, abs filename, start, end), where start and end are the (line, column) of the start and end of the
+        # node the message is about, counting from 0, or None if the message is not about a node
+        if key_node and hasattr(key_node, 'start_mark'):
+            return (severity, message, self.abs_filename, (key_node.start_mark.line, key_node.start_mark.column), (key_node.end_mark.line, key_node.end_mark.column))
+        return (severity, message, self.abs_filename, None, None)
+
+    def output(self, line):
+        self.transcript.append(line)
+        if not self.quiet:
+            print >> sys.stderr, line
 
 def main(args):
     validator = OASValidator()
     if not len(args) == 1:
         usage = 'usage: validate_rapier.py filename'
         sys.exit(usage)
-    validator.validate(*args)
+    try:
+        with profiling.phase('validate'):
+            validator.validate(args[0], None)
+    except SpecError as e:
+        sys.exit(str(e))
     return validator.rapier_spec, validator.errors
 
 if __name__ == "__main__":
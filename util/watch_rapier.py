@@ -0,0 +1,103 @@
+#!/usr/bin/env python 
+
+import sys, os, getopt, time, traceback
+import validate_rapier
+from validate_rapier import SpecError
+from gen_openapispec import OASGenerator, RelationshipIndex, FragmentCache, dump_openapispec
+from gen_html import HTMLGenerator
+from compiler import write_file
+
+POLL_INTERVAL = 1.0 # seconds between checks for changed files
+
+class SpecWatcher(object):
+    # Writes the OpenAPI spec and the HTML for a rapier spec, and writes them again whenever the spec, or a file it includes or
+    # references, changes. The validated specs are kept in a MemorySpecCache, so a rebuild only parses and validates the files that
+    # changed and the files that include or reference them. The OpenAPI spec and HTML are both generated from one validation of
+    # the spec. The HTML is generated again in full; the OpenAPI spec keeps its fragments in a FragmentCache, so only the
+    # interfaces, definitions and paths of the entities that changed, and of the entities that refer to them, are generated again
+
+    def __init__(self, filename, opts, output_dir):
+        self.filename = filename
+        self.opts = opts
+        self.output_dir = output_dir
+        self.cache = validate_rapier.MemorySpecCache()
+        self.fragment_cache = FragmentCache()
+        self.mtimes = dict() # abs filename -> mtime, or None if the file did not exist, at the last rebuild
+
+    def output_path(self, extension):
+        return os.path.join(self.output_dir, os.path.splitext(os.path.basename(self.filename))[0] + extension)
+
+    def generate(self):
+        validator = validate_rapier.OASValidator()
+        spec, errors = validator.validate(self.filename, None)
+        relationship_index = RelationshipIndex(validator) if spec is not None and errors == 0 else None
+        generator = OASGenerator()
+        generator.set_opts(self.opts)
+        generator.fragment_cache = self.fragment_cache
+        openAPI_spec = generator.openAPI_spec_from_validator(validator, spec, errors, relationship_index)
+        write_file(self.output_path('.openapi.yaml'), dump_openapispec(openAPI_spec))
+        write_file(self.output_path('.html'), HTMLGenerator().html_from_validator(validator, spec, errors, relationship_index))
+
+    def rebuild(self, changed_files):
+        start = time.time()
+        validate_rapier.set_spec_cache(self.cache)
+        try:
+            self.generate()
+            outcome = 'rebuilt'
+        except SpecError as e:
+            print >> sys.stderr, e
+            outcome = 'failed to build'
+        except Exception:
+            traceback.print_exc()
+            outcome = 'failed to build'
+        finally:
+            validate_rapier.set_spec_cache(None)
+        watched_files = self.cache.watched_files()
+        watched_files.add(os.path.abspath(self.filename))
+        self.mtimes = {filename: mtime(filename) for filename in watched_files}
+        message = '%s %s in %.3f seconds' % (outcome, self.filename, time.time() - start)
+        if changed_files:
+            message += ' - changed: %s' % ', '.join([os.path.relpath(filename) for filename in changed_files])
+        print >> sys.stderr, message
+
+    def changed_files(self):
+        return sorted(filename for filename, last_mtime in self.mtimes.iteritems() if mtime(filename) != last_mtime)
+
+    def run(self):
+        self.rebuild([])
+        while True:
+            time.sleep(POLL_INTERVAL)
+            changed_files = self.changed_files()
+            if changed_files:
+                self.rebuild(changed_files)
+
+def mtime(filename):
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
+
+def main(args):
+    usage = 'usage: watch_rapier.py [-o, --output-dir dirname] [-m, --yaml-merge] [-i, --include-impl] [-t --suppress-templates] filename'
+    try:
+        opts, args = getopt.getopt(args, 'o:mit', ['output-dir=', 'yaml-merge', 'include-impl', 'suppress-templates'])
+    except getopt.GetoptError as err:
+        sys.exit(str(err) + '\n' + usage)
+    if not len(args) == 1:
+        sys.exit(usage)
+    output_dir = '.'
+    generator_opts = []
+    for k, v in opts:
+        if k in ('-o', '--output-dir'):
+            output_dir = v
+        else:
+            generator_opts.append((k, v))
+    if not os.path.isdir(output_dir):
+        sys.exit('output directory does not exist: %s' % output_dir)
+    try:
+        SpecWatcher(args[0], generator_opts, output_dir).run()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main(sys.argv[1:])